@@ -11,7 +11,9 @@ from django.contrib.auth.views import LoginView
 from django.views.generic.edit import UpdateView
 from django.views.generic.list import ListView
 
+from blog.managers import PublishedEntryQuerySet
 from blog.models import Entry, Category
+from blog.pagination import CursorPaginationMixin
 
 
 class UserLogin(LoginView):
@@ -38,7 +40,7 @@ class DashBoard(DetailView):
 
 
 @method_decorator(login_required, name="dispatch")
-class DashBoardEntryListView(ListView):
+class DashBoardEntryListView(CursorPaginationMixin, ListView):
     template_name = "dashboard.html"
     context_object_name = "entries"
     paginate_by = 12
@@ -48,6 +50,7 @@ class DashBoardEntryListView(ListView):
         return (
             self.model.objects.select_related("author")
             .filter(author=self.request.user)
+            .only(*PublishedEntryQuerySet.CARD_FIELDS)
             .order_by("-modified_at")
         )
 
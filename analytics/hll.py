@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import math
+import struct
+import zlib
+
+
+# 2 ** P registers, the layout (and hash) of redis' PFADD
+P = 14
+REGISTERS = 1 << P
+# hash bits left after picking the register
+Q = 64 - P
+
+MURMUR_SEED = 0xADC83B19
+MURMUR_M = 0xC6A4A7935BD1E995
+MASK = (1 << 64) - 1
+
+HEADER = struct.Struct("<4sB3x8s")
+DENSE, SPARSE = 0, 1
+
+
+def murmurhash64a(data, seed=MURMUR_SEED):
+    """MurmurHash64A of bytes data, as redis hashes PFADD elements."""
+    length = len(data)
+    h = (seed ^ (length * MURMUR_M)) & MASK
+    end = length - length % 8
+    for start in range(0, end, 8):
+        k = int.from_bytes(data[start : start + 8], "little")
+        k = (k * MURMUR_M) & MASK
+        k ^= k >> 47
+        k = (k * MURMUR_M) & MASK
+        h ^= k
+        h = (h * MURMUR_M) & MASK
+    if length % 8:
+        h ^= int.from_bytes(data[end:], "little")
+        h = (h * MURMUR_M) & MASK
+    h ^= h >> 47
+    h = (h * MURMUR_M) & MASK
+    h ^= h >> 47
+    return h
+
+
+def tau(x):
+    if x == 0 or x == 1:
+        return 0.0
+    y, z = 1.0, 1 - x
+    while True:
+        x = math.sqrt(x)
+        previous = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if previous == z:
+            return z / 3
+
+
+def sigma(x):
+    if x == 1:
+        return float("inf")
+    y, z = 1.0, x
+    while True:
+        x *= x
+        previous = z
+        z += x * y
+        y += y
+        if previous == z:
+            return z
+
+
+class HyperLogLog:
+    """
+    HyperLogLog sketch of 2 ** 14 registers, compatible with redis.
+
+    Elements are hashed and placed like redis' PFADD does (redis 5+) and
+    count() is the estimator of PFCOUNT, so sketches built here, read from
+    redis (from_redis) or stored in the database merge with each other.
+    The standard error of the estimate is 1.04 / sqrt(2 ** 14), 0.81%,
+    about 2% at 2.5 standard errors, and small counts are close to exact.
+    """
+
+    def __init__(self, registers=None):
+        self.registers = bytearray(registers or REGISTERS)
+
+    def add(self, *values):
+        registers = self.registers
+        for value in values:
+            if not isinstance(value, bytes):
+                value = str(value).encode("utf-8")
+            h = murmurhash64a(value)
+            index = h & (REGISTERS - 1)
+            h = (h >> P) | (1 << Q)
+            # position of the lowest set bit, 1 based
+            rank = (h & -h).bit_length()
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def merge(self, *others):
+        registers = self.registers
+        for other in others:
+            for index, rank in enumerate(other.registers):
+                if rank > registers[index]:
+                    registers[index] = rank
+        return self
+
+    def count(self):
+        histogram = [0] * (Q + 2)
+        for rank in self.registers:
+            histogram[rank] += 1
+        m = float(REGISTERS)
+        z = m * tau((m - histogram[Q + 1]) / m)
+        for rank in range(Q, 0, -1):
+            z += histogram[rank]
+            z *= 0.5
+        z += m * sigma(histogram[0] / m)
+        return int(round(0.5 / math.log(2) * m * m / z))
+
+    def __len__(self):
+        return self.count()
+
+    def to_bytes(self):
+        """Compressed registers, for a database column."""
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(zlib.decompress(bytes(data)))
+
+    def to_redis(self):
+        """The registers as a dense redis HyperLogLog string value."""
+        packed = bytearray((REGISTERS * 6 + 7) // 8 + 1)
+        for index, rank in enumerate(self.registers):
+            position = index * 6
+            byte, bit = position >> 3, position & 7
+            value = rank << bit
+            packed[byte] |= value & 0xFF
+            packed[byte + 1] |= value >> 8
+        # the cached cardinality is flagged stale so PFCOUNT recomputes it
+        header = HEADER.pack(b"HYLL", DENSE, b"\0" * 7 + b"\x80")
+        return header + bytes(packed[:-1])
+
+    @classmethod
+    def from_redis(cls, data):
+        """Read a redis HyperLogLog string value, dense or sparse."""
+        data = bytes(data)
+        if len(data) < HEADER.size:
+            raise ValueError("Not a redis HyperLogLog value")
+        magic, encoding, __ = HEADER.unpack_from(data)
+        if magic != b"HYLL" or encoding not in (DENSE, SPARSE):
+            raise ValueError("Not a redis HyperLogLog value")
+        body = data[HEADER.size :]
+        registers = bytearray(REGISTERS)
+
+        if encoding == DENSE:
+            body += b"\0"
+            for index in range(REGISTERS):
+                position = index * 6
+                byte, bit = position >> 3, position & 7
+                registers[index] = (
+                    (body[byte] >> bit) | (body[byte + 1] << (8 - bit))
+                ) & 63
+            return cls(registers)
+
+        index = offset = 0
+        while offset < len(body) and index < REGISTERS:
+            opcode = body[offset]
+            if opcode & 0x80:
+                # VAL: 1vvvvvxx, a run of xx + 1 registers set to vvvvv + 1
+                rank, run = ((opcode >> 2) & 31) + 1, (opcode & 3) + 1
+                registers[index : index + run] = bytes([rank]) * run
+                offset += 1
+            elif opcode & 0x40:
+                # XZERO: 01xxxxxx yyyyyyyy, a run of 14 bits + 1 empty ones
+                if offset + 1 == len(body):
+                    break
+                run = (((opcode & 0x3F) << 8) | body[offset + 1]) + 1
+                offset += 2
+            else:
+                # ZERO: 00xxxxxx, a run of xxxxxx + 1 empty registers
+                run = (opcode & 0x3F) + 1
+                offset += 1
+            index += run
+        if index != REGISTERS or offset != len(body):
+            raise ValueError("Truncated redis HyperLogLog value")
+        return cls(registers)
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import datetime
+import json
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError, ResponseError
+
+from analytics.models import PageView
+
+
+logger = logging.getLogger(__name__)
+
+# column limits beacon values are cut to
+MAX_LENGTHS = {
+    field.attname: field.max_length
+    for field in PageView._meta.concrete_fields
+    if field.max_length and field.get_internal_type() != "GenericIPAddressField"
+}
+
+
+class PageViewQueue:
+    """
+    Buffers page views and writes them to PageView in batches.
+
+    Beacons are appended as JSON to a redis list on the default cache
+    server and drained by the flush_page_views task, which drops the
+    repeated (domain, url, session_id, day) hits in memory and inserts the
+    rest in bulk, skipping the views already stored. When redis is not
+    reachable views are kept in this process and written by it once they
+    are older than the flush interval.
+
+    Lists being flushed are registered in a sorted set and trimmed as
+    their batches are written, the ones left by a flush that failed or
+    died are picked up by the next flush once they are recover_after
+    seconds old.
+    """
+
+    def __init__(self, flush_interval=10, batch_size=5000, recover_after=300):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.recover_after = recover_after
+        self._local = []
+        self._local_since = None
+        self._lock = threading.Lock()
+
+    @property
+    def key(self):
+        return cache.make_key("page_views")
+
+    def get_connection(self):
+        try:
+            return get_redis_connection("default")
+        except NotImplementedError:
+            # the default cache is not a redis cache
+            return None
+
+    @staticmethod
+    def dumps(data):
+        if isinstance(data["timestamp"], datetime):
+            data = dict(data, timestamp=data["timestamp"].isoformat())
+        return json.dumps(data, separators=(",", ":"))
+
+    def push(self, data):
+        """
+        Queue a page view, data holds the PageView fields. The timestamp
+        is a datetime or, cheaper to get, a unix timestamp.
+        """
+        connection = self.get_connection()
+        if connection is not None:
+            try:
+                connection.rpush(self.key, self.dumps(data))
+                return
+            except RedisError:
+                pass
+
+        with self._lock:
+            self._local.append(data)
+            if self._local_since is None:
+                self._local_since = time.time()
+            due = time.time() - self._local_since >= self.flush_interval
+        if due:
+            self.flush_local()
+
+    @property
+    def flushing_keys(self):
+        # lists being flushed, scored by the time their flush started
+        return cache.make_key("page_views_flushing")
+
+    def flush(self):
+        """Move the page views queued in redis to the database."""
+        connection = self.get_connection()
+        if connection is None:
+            return 0
+
+        total = 0
+        for key in self.leftover_keys(connection):
+            total += self.drain(connection, key)
+
+        # rename first so beacons queued while flushing go to a new list,
+        # registered before so a later flush finds it if this one fails
+        flushing_key = "{0}:{1}".format(self.key, uuid.uuid4().hex)
+        try:
+            connection.zadd(self.flushing_keys, time.time(), flushing_key)
+            connection.rename(self.key, flushing_key)
+        except ResponseError:
+            # nothing queued since the last flush
+            connection.zrem(self.flushing_keys, flushing_key)
+            return total
+        except RedisError:
+            # redis is down
+            return total
+        return total + self.drain(connection, flushing_key)
+
+    def leftover_keys(self, connection):
+        """
+        Claim the lists of flushes older than recover_after, registering
+        them again with the current time so a concurrent flush does not
+        drain them too.
+        """
+        cutoff = time.time() - self.recover_after
+        keys = []
+        for key in connection.zrangebyscore(self.flushing_keys, "-inf", cutoff):
+            # only one flush removes it
+            if connection.zrem(self.flushing_keys, key):
+                connection.zadd(self.flushing_keys, time.time(), key)
+                keys.append(key)
+        return keys
+
+    def drain(self, connection, key):
+        """Write the page views of the list key by batches, trimming it."""
+        total = 0
+        while True:
+            rows = connection.lrange(key, 0, self.batch_size - 1)
+            if not rows:
+                # the list was removed by redis once empty
+                connection.zrem(self.flushing_keys, key)
+                return total
+            total += self.save(self.loads(rows))
+            connection.ltrim(key, len(rows), -1)
+
+    def flush_local(self):
+        """Write the page views queued in this process to the database."""
+        with self._lock:
+            views, self._local = self._local, []
+            self._local_since = None
+        return self.save(views)
+
+    @staticmethod
+    def loads(rows):
+        views = []
+        for row in rows:
+            try:
+                views.append(json.loads(row.decode("utf-8")))
+            except ValueError:
+                logger.warning("Dropping malformed page view %r", row[:200])
+        return views
+
+    @staticmethod
+    def get_timestamp(value):
+        if isinstance(value, datetime):
+            return value
+        if isinstance(value, str):
+            return parse_datetime(value)
+        return datetime.fromtimestamp(value, timezone.utc)
+
+    def save(self, views):
+        """
+        Insert views (dicts of PageView fields), skipping the ones whose
+        session already viewed the page that day. Values are cut to their
+        column, and a batch the database rejects is inserted view by view,
+        leaving out and logging the views it still rejects.
+        """
+        unique = {}
+        for data in views:
+            try:
+                data = dict(
+                    data,
+                    headers=json.dumps(data["headers"]),
+                    timestamp=self.get_timestamp(data["timestamp"]),
+                )
+                for name, max_length in MAX_LENGTHS.items():
+                    if isinstance(data.get(name), str):
+                        data[name] = data[name][:max_length]
+                view = PageView(**data)
+                view.set_day()
+            except (KeyError, TypeError, ValueError, AttributeError):
+                logger.warning("Dropping malformed page view %r", data)
+                continue
+            unique.setdefault((view.domain, view.url, view.session_id, view.day), view)
+        views = list(unique.values())
+
+        # views stored by earlier flushes are left out by the unique constraint
+        try:
+            with transaction.atomic():
+                return PageView.objects.insert_new(views)
+        except DatabaseError:
+            logger.exception("Inserting %d page views failed", len(views))
+
+        inserted = 0
+        for view in views:
+            try:
+                with transaction.atomic():
+                    inserted += PageView.objects.insert_new([view])
+            except DatabaseError:
+                logger.exception("Dropping page view of %s%s", view.domain, view.url)
+        return inserted
+
+
+page_view_queue = PageViewQueue(
+    flush_interval=getattr(settings, "PAGE_VIEWS_FLUSH_INTERVAL", 10)
+)
@@ -0,0 +1,18 @@
+# Generated by Django 2.0.8 on 2026-10-18 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("analytics", "0003_auto_20171119_1446")]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="pageview",
+            index=models.Index(
+                fields=["session_id", "url", "domain", "timestamp"],
+                name="page_view_dedupe_idx",
+            ),
+        )
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.0.8 on 2026-10-18 14:40
+
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+CHUNK_SIZE = 10000
+
+
+def backfill_days(apps, schema_editor):
+    PageView = apps.get_model("analytics", "PageView")
+    bounds = PageView.objects.aggregate(first=models.Min("pk"), last=models.Max("pk"))
+    if bounds["first"] is None:
+        return
+    # one short UPDATE (and transaction) per range of ids, no long table lock
+    for start in range(bounds["first"], bounds["last"] + 1, CHUNK_SIZE):
+        PageView.objects.filter(
+            pk__gte=start, pk__lt=start + CHUNK_SIZE, day__isnull=True
+        ).update(day=TruncDate("timestamp"))
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [("analytics", "0004_pageview_dedupe_index")]
+
+    operations = [
+        migrations.AddField(
+            model_name="pageview",
+            name="day",
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_days, migrations.RunPython.noop),
+    ]
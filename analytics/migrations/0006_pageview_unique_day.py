@@ -0,0 +1,115 @@
+# Generated by Django 2.0.8 on 2026-10-18 14:40
+
+from django.db import migrations, models, transaction
+
+CHUNK_SIZE = 10000
+
+UNIQUE_NAME = "page_view_domain_url_session_day_uniq"
+
+
+def delete_duplicates(apps, schema_editor):
+    PageView = apps.get_model("analytics", "PageView")
+    bounds = PageView.objects.aggregate(first=models.Min("pk"), last=models.Max("pk"))
+    if bounds["first"] is None:
+        return
+    # a view is a duplicate when an older one has its (domain, url,
+    # session_id, day), found through page_view_dedupe_idx
+    older = PageView.objects.filter(
+        pk__lt=models.OuterRef("pk"),
+        domain=models.OuterRef("domain"),
+        url=models.OuterRef("url"),
+        session_id=models.OuterRef("session_id"),
+        day=models.OuterRef("day"),
+    )
+    # one short transaction per range of ids, no long table lock
+    for start in range(bounds["first"], bounds["last"] + 1, CHUNK_SIZE):
+        with transaction.atomic():
+            duplicates = list(
+                PageView.objects.filter(pk__gte=start, pk__lt=start + CHUNK_SIZE)
+                .annotate(duplicate=models.Exists(older))
+                .filter(duplicate=True)
+                .values_list("pk", flat=True)
+            )
+            for index in range(0, len(duplicates), 500):
+                PageView.objects.filter(pk__in=duplicates[index : index + 500]).delete()
+
+
+def add_postgresql_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for sql in (
+        # NOT NULL is proven by the validated CHECK (PostgreSQL 12+) instead
+        # of a scan under an exclusive lock, VALIDATE lets writes through
+        "ALTER TABLE page_view ADD CONSTRAINT page_view_day_not_null "
+        "CHECK (day IS NOT NULL) NOT VALID",
+        "ALTER TABLE page_view VALIDATE CONSTRAINT page_view_day_not_null",
+        "ALTER TABLE page_view ALTER COLUMN day SET NOT NULL",
+        "ALTER TABLE page_view DROP CONSTRAINT page_view_day_not_null",
+        # built without blocking writes, then made the constraint. It fails
+        # on duplicates inserted since delete_duplicates, migrate again then
+        "DROP INDEX IF EXISTS {0}".format(UNIQUE_NAME),
+        "CREATE UNIQUE INDEX CONCURRENTLY {0} ON page_view "
+        "(domain, url, session_id, day)".format(UNIQUE_NAME),
+        "ALTER TABLE page_view ADD CONSTRAINT {0} UNIQUE USING INDEX {0}".format(
+            UNIQUE_NAME
+        ),
+        "DROP INDEX CONCURRENTLY IF EXISTS page_view_dedupe_idx",
+    ):
+        schema_editor.execute(sql)
+
+
+def remove_postgresql_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for sql in (
+        "CREATE INDEX CONCURRENTLY page_view_dedupe_idx ON page_view "
+        "(session_id, url, domain, timestamp)",
+        "ALTER TABLE page_view DROP CONSTRAINT {0}".format(UNIQUE_NAME),
+        "ALTER TABLE page_view ALTER COLUMN day DROP NOT NULL",
+    ):
+        schema_editor.execute(sql)
+
+
+class UnlessPostgreSQL(migrations.SeparateDatabaseAndState):
+    """Operations changing the state, and the database unless PostgreSQL."""
+
+    def __init__(self, operations):
+        super().__init__(database_operations=operations, state_operations=operations)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != "postgresql":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != "postgresql":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    # duplicates are deleted by chunks and, on PostgreSQL, the unique index
+    # is built concurrently, neither can run in one transaction
+    atomic = False
+
+    dependencies = [("analytics", "0005_pageview_day")]
+
+    operations = [
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.RunPython(add_postgresql_constraints, remove_postgresql_constraints),
+        UnlessPostgreSQL(
+            [
+                migrations.AlterField(
+                    model_name="pageview",
+                    name="day",
+                    field=models.DateField(editable=False),
+                ),
+                migrations.AlterUniqueTogether(
+                    name="pageview",
+                    unique_together={("domain", "url", "session_id", "day")},
+                ),
+                migrations.RemoveIndex(
+                    model_name="pageview", name="page_view_dedupe_idx"
+                ),
+            ]
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 2.0.8 on 2026-10-18 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("analytics", "0006_pageview_unique_day")]
+
+    operations = [
+        migrations.CreateModel(
+            name="RollupWatermark",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                ("last_id", models.BigIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Rollup Watermark",
+                "verbose_name_plural": "Rollup Watermarks",
+                "db_table": "rollup_watermark",
+            },
+        ),
+        migrations.CreateModel(
+            name="HourlyPageViews",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("domain", models.URLField()),
+                ("url", models.CharField(max_length=100)),
+                (
+                    "referrer_host",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                ("sessions", models.PositiveIntegerField(default=0)),
+                ("hour", models.DateTimeField()),
+            ],
+            options={
+                "verbose_name": "Hourly Page Views",
+                "verbose_name_plural": "Hourly Page Views",
+                "db_table": "page_view_hourly",
+                "unique_together": {("hour", "domain", "url", "referrer_host")},
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyPageViews",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("domain", models.URLField()),
+                ("url", models.CharField(max_length=100)),
+                (
+                    "referrer_host",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                ("sessions", models.PositiveIntegerField(default=0)),
+                ("day", models.DateField()),
+            ],
+            options={
+                "verbose_name": "Daily Page Views",
+                "verbose_name_plural": "Daily Page Views",
+                "db_table": "page_view_daily",
+                "unique_together": {("day", "domain", "url", "referrer_host")},
+            },
+        ),
+    ]
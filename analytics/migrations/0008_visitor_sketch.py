@@ -0,0 +1,35 @@
+# Generated by Django 2.0.8 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("analytics", "0007_page_view_rollups")]
+
+    operations = [
+        migrations.CreateModel(
+            name="VisitorSketch",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("domain", models.URLField()),
+                ("url", models.CharField(max_length=100)),
+                ("registers", models.BinaryField()),
+            ],
+            options={
+                "verbose_name": "Visitor Sketch",
+                "verbose_name_plural": "Visitor Sketches",
+                "db_table": "visitor_sketch",
+                "unique_together": {("day", "domain", "url")},
+            },
+        )
+    ]
@@ -1,10 +1,69 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models.sql import InsertQuery
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 
+class PageViewQuerySet(models.QuerySet):
+    # statements inserting rows and skipping the ones breaking a unique constraint
+    INSERT_IGNORE = {
+        "postgresql": ("INSERT INTO", "INSERT INTO", " ON CONFLICT DO NOTHING"),
+        "sqlite": ("INSERT INTO", "INSERT OR IGNORE INTO", ""),
+        "mysql": ("INSERT INTO", "INSERT IGNORE INTO", ""),
+    }
+
+    def insert_new(self, objs):
+        """
+        Insert objs like bulk_create, leaving out the page views already
+        stored for their (domain, url, session_id, day). Returns the number
+        of rows inserted.
+
+        Django 2.0 has no bulk_create(ignore_conflicts=True), the insert
+        statement is compiled by Django and turned into the backend's own
+        conflict skipping INSERT.
+        """
+        objs = list(objs)
+        if not objs:
+            return 0
+        for obj in objs:
+            obj.set_day()
+
+        connection = connections[self.db]
+        if connection.vendor not in self.INSERT_IGNORE:
+            return self._insert_new_one_by_one(objs)
+
+        prefix, replacement, suffix = self.INSERT_IGNORE[connection.vendor]
+        fields = [
+            field for field in self.model._meta.concrete_fields if not field.primary_key
+        ]
+        batch_size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+        inserted = 0
+        with transaction.atomic(using=self.db, savepoint=False):
+            for start in range(0, len(objs), batch_size):
+                query = InsertQuery(self.model)
+                query.insert_values(fields, objs[start : start + batch_size])
+                with connection.cursor() as cursor:
+                    for sql, params in query.get_compiler(using=self.db).as_sql():
+                        sql = replacement + sql[len(prefix) :] + suffix
+                        cursor.execute(sql, params)
+                        inserted += max(cursor.rowcount, 0)
+        return inserted
+
+    def _insert_new_one_by_one(self, objs):
+        inserted = 0
+        for obj in objs:
+            try:
+                with transaction.atomic(using=self.db):
+                    obj.save(force_insert=True, using=self.db)
+            except IntegrityError:
+                continue
+            inserted += 1
+        return inserted
+
+
 class PageView(models.Model):
     domain = models.URLField(null=False)
     url = models.FilePathField()
@@ -12,20 +71,109 @@ class PageView(models.Model):
     ip = models.GenericIPAddressField(null=False)
     referrer = models.TextField(null=False)
     timestamp = models.DateTimeField(null=False)
+    # local date of timestamp, a session counts once per page and day
+    day = models.DateField(editable=False)
     headers = models.TextField(null=False)
     session_id = models.CharField(null=False, max_length=255)
 
+    objects = PageViewQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Page View")
         verbose_name_plural = _("Page Views")
         db_table = "page_view"
         default_related_name = "page_view"
+        unique_together = ("domain", "url", "session_id", "day")
 
     def __str__(self):
         return "{0}{1}".format(self.domain, self.url)
 
+    @staticmethod
+    def day_of(timestamp):
+        if timezone.is_aware(timestamp):
+            timestamp = timezone.localtime(timestamp)
+        return timestamp.date()
+
+    def set_day(self):
+        if self.day is None:
+            self.day = self.day_of(self.timestamp)
+
+    def save(self, *args, **kwargs):
+        self.set_day()
+        super(PageView, self).save(*args, **kwargs)
+
     def get_browser(self):
         return ""
 
     def get_browser_icon(self):
         return ""
+
+
+class PageViewRollup(models.Model):
+    """Sessions that viewed a page, per period and referrer host."""
+
+    domain = models.URLField()
+    url = models.CharField(max_length=100)
+    referrer_host = models.CharField(max_length=255, blank=True, default="")
+    # PageView keeps one row per session, page and day, so every view
+    # rolled up is a distinct session
+    sessions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return "{0}{1}".format(self.domain, self.url)
+
+
+class HourlyPageViews(PageViewRollup):
+    hour = models.DateTimeField()
+
+    class Meta:
+        verbose_name = _("Hourly Page Views")
+        verbose_name_plural = _("Hourly Page Views")
+        db_table = "page_view_hourly"
+        unique_together = ("hour", "domain", "url", "referrer_host")
+
+
+class DailyPageViews(PageViewRollup):
+    day = models.DateField()
+
+    class Meta:
+        verbose_name = _("Daily Page Views")
+        verbose_name_plural = _("Daily Page Views")
+        db_table = "page_view_daily"
+        unique_together = ("day", "domain", "url", "referrer_host")
+
+
+class RollupWatermark(models.Model):
+    """Id of the last PageView added to the rollups."""
+
+    name = models.CharField(max_length=50, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = _("Rollup Watermark")
+        verbose_name_plural = _("Rollup Watermarks")
+        db_table = "rollup_watermark"
+
+    def __str__(self):
+        return "{0}: {1}".format(self.name, self.last_id)
+
+
+class VisitorSketch(models.Model):
+    """HyperLogLog of the visitors of a page on a day, see analytics.visitors."""
+
+    day = models.DateField()
+    domain = models.URLField()
+    url = models.CharField(max_length=100)
+    registers = models.BinaryField()
+
+    class Meta:
+        verbose_name = _("Visitor Sketch")
+        verbose_name_plural = _("Visitor Sketches")
+        db_table = "visitor_sketch"
+        unique_together = ("day", "domain", "url")
+
+    def __str__(self):
+        return "{0}{1} {2}".format(self.domain, self.url, self.day)
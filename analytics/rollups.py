@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import Counter
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+from analytics.models import DailyPageViews, HourlyPageViews, PageView, RollupWatermark
+
+
+WATERMARK = "page_views"
+
+# page views read and rolled up per transaction
+CHUNK_SIZE = 10000
+
+
+def referrer_host(referrer):
+    try:
+        return (urlsplit(referrer).hostname or "")[:255]
+    except ValueError:
+        return ""
+
+
+def add_counts(model, period, counts):
+    """Add counts ((period value, domain, url, referrer host) -> sessions)."""
+    if not counts:
+        return
+    existing = {}
+    rows = model.objects.filter(
+        **{period + "__in": {key[0] for key in counts}}
+    ).values_list("pk", period, "domain", "url", "referrer_host")
+    for pk, *key in rows.iterator():
+        existing[tuple(key)] = pk
+
+    new = [
+        model(
+            **{period: key[0]},
+            domain=key[1],
+            url=key[2],
+            referrer_host=key[3],
+            sessions=sessions,
+        )
+        for key, sessions in counts.items()
+        if key not in existing
+    ]
+    model.objects.bulk_create(new)
+
+    updates = [
+        (existing[key], sessions) for key, sessions in counts.items() if key in existing
+    ]
+    for start in range(0, len(updates), 500):
+        batch = updates[start : start + 500]
+        whens = [models.When(pk=pk, then=sessions) for pk, sessions in batch]
+        model.objects.filter(pk__in=[pk for pk, __ in batch]).update(
+            sessions=models.F("sessions")
+            + models.Case(*whens, output_field=models.PositiveIntegerField())
+        )
+
+
+def rollup_chunk(upto, chunk_size=CHUNK_SIZE):
+    """
+    Add the next page views after the watermark, up to id upto, to the
+    rollups. Returns the number of views rolled up.
+    """
+    with transaction.atomic():
+        watermark, __ = RollupWatermark.objects.get_or_create(name=WATERMARK)
+        # a concurrent rollup waits here and starts from the new watermark
+        watermark = RollupWatermark.objects.select_for_update().get(pk=WATERMARK)
+        views = (
+            PageView.objects.filter(pk__gt=watermark.last_id, pk__lte=upto)
+            .order_by("pk")
+            .values_list("pk", "timestamp", "day", "domain", "url", "referrer")
+        )[:chunk_size]
+
+        hourly, daily = Counter(), Counter()
+        last_id = None
+        for last_id, timestamp, day, domain, url, referrer in views:
+            host = referrer_host(referrer)
+            hour = timestamp.replace(minute=0, second=0, microsecond=0)
+            hourly[hour, domain, url, host] += 1
+            daily[day, domain, url, host] += 1
+        if last_id is None:
+            return 0
+
+        add_counts(HourlyPageViews, "hour", hourly)
+        add_counts(DailyPageViews, "day", daily)
+        watermark.last_id = last_id
+        watermark.save(update_fields=["last_id"])
+    return sum(daily.values())
+
+
+def rollup_page_views(lag=None, chunk_size=CHUNK_SIZE):
+    """
+    Roll up the page views stored since the last run, by chunks.
+
+    Only the views inserted before the last one older than lag seconds are
+    read, so ids handed to a flush still in progress are not skipped.
+    """
+    if lag is None:
+        lag = getattr(settings, "PAGE_VIEWS_ROLLUP_LAG", 60)
+    watermark = (
+        RollupWatermark.objects.filter(name=WATERMARK)
+        .values_list("last_id", flat=True)
+        .first()
+        or 0
+    )
+    upto = PageView.objects.filter(
+        pk__gt=watermark, timestamp__lt=timezone.now() - timedelta(seconds=lag)
+    ).aggregate(upto=models.Max("pk"))["upto"]
+    if upto is None:
+        return 0
+
+    total = 0
+    while True:
+        rolled_up = rollup_chunk(upto, chunk_size)
+        if not rolled_up:
+            return total
+        total += rolled_up
+
+
+def prune_page_views(days=None, chunk_size=CHUNK_SIZE):
+    """
+    Delete the page views older than days once they are rolled up, by
+    ranges of ids so no delete holds its locks for long.
+    """
+    if days is None:
+        days = getattr(settings, "PAGE_VIEWS_RETENTION_DAYS", 90)
+    if not days:
+        return 0
+    watermark = (
+        RollupWatermark.objects.filter(name=WATERMARK)
+        .values_list("last_id", flat=True)
+        .first()
+    )
+    if not watermark:
+        return 0
+
+    cutoff = timezone.localdate() - timedelta(days=days)
+    old = PageView.objects.filter(pk__lte=watermark, day__lt=cutoff)
+    first = old.aggregate(first=models.Min("pk"))["first"]
+    if first is None:
+        return 0
+
+    total = 0
+    for start in range(first, watermark + 1, chunk_size):
+        deleted, __ = old.filter(pk__gte=start, pk__lt=start + chunk_size).delete()
+        total += deleted
+    return total
+
+
+def page_views_per_day(start, end, **filters):
+    """
+    Sessions per day between the dates start and end (included), for the
+    pages matching filters (domain, url, referrer_host). Reads the daily
+    rollup, so the cost grows with the days, not the views.
+    """
+    return list(
+        DailyPageViews.objects.filter(day__gte=start, day__lte=end, **filters)
+        .values("day")
+        .annotate(sessions=models.Sum("sessions"))
+        .order_by("day")
+        .values_list("day", "sessions")
+    )
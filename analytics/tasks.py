@@ -1,23 +1,37 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from datetime import date
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 from tinyblog import celery_app
-from .models import PageView
+from .ingest import page_view_queue
+from .rollups import prune_page_views, rollup_page_views
+from .visitors import unique_visitors
 
 
 @celery_app.task(ignore_result=True, name="page_analytics")
 def save_page_analytics(data):
-    today = date.today()
-
-    try:
-        PageView.objects.get(
-            url=data["url"],
-            domain=data["domain"],
-            session_id=data["session_id"],
-            timestamp__contains=today,
-        )
-    except PageView.DoesNotExist:
-        page = PageView(**data)
-        page.save()
+    # AnalyticsView queues beacons for flush_page_views now, this only
+    # saves the messages sent before upgrading.
+    timestamp = parse_datetime(data["timestamp"])
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return page_view_queue.save([dict(data, timestamp=timestamp)])
+
+
+@celery_app.task(ignore_result=True, name="flush_page_views")
+def flush_page_views():
+    return page_view_queue.flush()
+
+
+@celery_app.task(ignore_result=True, name="rollup_page_views")
+def rollup_and_prune_page_views():
+    rolled_up = rollup_page_views()
+    prune_page_views()
+    return rolled_up
+
+
+@celery_app.task(ignore_result=True, name="persist_visitor_sketches")
+def persist_visitor_sketches():
+    return unique_visitors.persist()
@@ -1,6 +1,522 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.test import TestCase
+from datetime import date, timedelta
+import json
+import os
+import timeit
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from django.conf import settings
+from django.db import DataError, DatabaseError, IntegrityError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from analytics.hll import REGISTERS, HyperLogLog, murmurhash64a
+from analytics.ingest import PageViewQueue, page_view_queue
+from analytics.models import DailyPageViews, HourlyPageViews, PageView, VisitorSketch
+from analytics.rollups import page_views_per_day, prune_page_views, rollup_page_views
+from analytics.tasks import flush_page_views
+from analytics.views import PIXEL, VISITOR_COOKIE, AnalyticsView
+from analytics.visitors import UniqueVisitors, unique_visitors
+from blog.tests.test_benchmarks import report
+from blog.tests.test_managers import EXPLAIN_VENDORS, explain
+
+
+RUN_BENCHMARKS = os.environ.get("RUN_BENCHMARKS")
+
+
+def make_view(session_id="session", url="/blog/", timestamp=None, **kwargs):
+    data = dict(
+        headers={"HTTP_USER_AGENT": "test"},
+        session_id=session_id,
+        domain="localhost",
+        url=url,
+        title="Blog",
+        referrer="",
+        ip="127.0.0.1",
+        timestamp=timestamp or timezone.now(),
+    )
+    data.update(kwargs)
+    return data
+
+
+@skipUnless(connection.vendor in EXPLAIN_VENDORS, "EXPLAIN output is vendor specific")
+class PageViewIndexTestCase(TestCase):
+    def test_dedupe_index(self):
+        queryset = PageView.objects.filter(
+            domain="localhost", url="/blog/", session_id="session", day=date.today()
+        )
+        # the index of the unique constraint, named by the database
+        self.assertIn("INDEX", explain(queryset).upper())
+
+
+class PageViewQueueTestCase(TestCase):
+    def tearDown(self):
+        from django_redis import get_redis_connection
+
+        get_redis_connection("default").flushall()
+
+    def test_beacon_queued(self):
+        url = reverse("analytics")
+        params = {"domain": "localhost", "url": "/blog/", "title": "Blog"}
+        for __ in range(3):
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+
+        # Nothing is written until the queue is flushed.
+        self.assertFalse(PageView.objects.exists())
+        self.assertEqual(flush_page_views(), 1)
+        self.assertEqual(PageView.objects.get().url, "/blog/")
+        self.assertEqual(page_view_queue.flush(), 0)
+
+    def test_dedupe(self):
+        yesterday = timezone.now() - timedelta(days=1)
+        for data in (
+            make_view(),
+            make_view(),
+            make_view(url="/about/"),
+            make_view(session_id="other"),
+            make_view(timestamp=yesterday),
+        ):
+            page_view_queue.push(data)
+        self.assertEqual(page_view_queue.flush(), 4)
+
+        # views already stored are not written again
+        page_view_queue.push(make_view())
+        page_view_queue.push(make_view(url="/contact/"))
+        self.assertEqual(page_view_queue.flush(), 1)
+        self.assertEqual(PageView.objects.count(), 5)
+
+    def test_batches(self):
+        queue = PageViewQueue(batch_size=3)
+        for index in range(7):
+            queue.push(make_view(session_id="session-{0}".format(index)))
+        with self.assertNumQueries(9):
+            # one insert per batch, in a savepoint
+            self.assertEqual(queue.flush(), 7)
+
+    def test_long_values(self):
+        page_view_queue.push(make_view(url="/" + "a" * 300, session_id="s" * 300))
+        self.assertEqual(page_view_queue.flush(), 1)
+        view = PageView.objects.get()
+        self.assertEqual((len(view.url), len(view.session_id)), (100, 255))
+
+    def test_rejected_views(self):
+        insert_new = PageView.objects.insert_new
+
+        def reject_bad(objs):
+            objs = list(objs)
+            if any(obj.url == "/bad/" for obj in objs):
+                raise DataError("value too long")
+            return insert_new(objs)
+
+        for url in ("/blog/", "/bad/", "/about/"):
+            page_view_queue.push(make_view(url=url))
+        page_view_queue.get_connection().rpush(page_view_queue.key, b"{not json")
+        with patch.object(PageView.objects, "insert_new", side_effect=reject_bad):
+            with self.assertLogs("analytics.ingest", "WARNING") as logs:
+                self.assertEqual(page_view_queue.flush(), 2)
+        self.assertEqual(len(logs.records), 3)
+        self.assertEqual(
+            set(PageView.objects.values_list("url", flat=True)), {"/blog/", "/about/"}
+        )
+
+    def test_recover_failed_flush(self):
+        queue = PageViewQueue(batch_size=2)
+        for index in range(5):
+            queue.push(make_view(session_id="session-{0}".format(index)))
+        save, calls = queue.save, []
+
+        def fail_second_batch(views):
+            calls.append(views)
+            if len(calls) == 2:
+                raise DatabaseError("connection lost")
+            return save(views)
+
+        with patch.object(queue, "save", side_effect=fail_second_batch):
+            with self.assertRaises(DatabaseError):
+                queue.flush()
+        self.assertEqual(PageView.objects.count(), 2)
+
+        # the rest is left in redis and recovered once old enough
+        self.assertEqual(queue.flush(), 0)
+        queue.recover_after = 0
+        connection = queue.get_connection()
+        # leftovers are found through the registered keys, not by a scan
+        with patch.object(connection, "scan_iter") as scan_iter:
+            self.assertEqual(queue.flush(), 3)
+        self.assertFalse(scan_iter.called)
+        self.assertEqual(PageView.objects.count(), 5)
+        self.assertEqual(list(connection.scan_iter(match=queue.key + "*")), [])
+        self.assertEqual(connection.zcard(queue.flushing_keys), 0)
+
+    def test_local_fallback(self):
+        queue = PageViewQueue(flush_interval=3600)
+
+        with patch.object(queue, "get_connection", return_value=None):
+            queue.push(make_view())
+            queue.push(make_view())
+            self.assertFalse(PageView.objects.exists())
+
+            # Views kept in process are written once the interval is over.
+            queue.flush_interval = 0
+            queue.push(make_view(url="/about/"))
+
+        self.assertEqual(PageView.objects.count(), 2)
+
+
+class BeaconTestCase(TestCase):
+    def tearDown(self):
+        from django_redis import get_redis_connection
+
+        get_redis_connection("default").flushall()
+
+    def test_pixel(self):
+        url = reverse("analytics")
+        response = self.client.get(url, {"url": "/blog/"}, HTTP_USER_AGENT="test")
+        self.assertEqual(response["Content-Type"], "image/gif")
+        self.assertEqual(response["Cache-Control"], "no-store")
+        self.assertEqual(response.content, PIXEL)
+        self.assertIn(VISITOR_COOKIE, response.cookies)
+        # the session is left alone
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertFalse(response.has_header("Vary"))
+
+        # the cookie is sent back, the visitor is the same
+        response = self.client.get(url, {"url": "/blog/"})
+        self.assertNotIn(VISITOR_COOKIE, response.cookies)
+        self.assertEqual(flush_page_views(), 1)
+        view = PageView.objects.get()
+        self.assertEqual(json.loads(view.headers), {"HTTP_USER_AGENT": "test"})
+        self.assertEqual(view.day, timezone.localdate())
+
+    def test_visitors(self):
+        url = reverse("analytics")
+        self.client.get(url, {"url": "/blog/"})
+        self.client.cookies.clear()
+        self.client.get(url, {"url": "/blog/"})
+        # a tampered cookie is a new visitor
+        self.client.cookies[VISITOR_COOKIE] = "visitor"
+        self.client.get(url, {"url": "/blog/"})
+        self.assertEqual(flush_page_views(), 3)
+
+
+@skipUnless(RUN_BENCHMARKS, "set RUN_BENCHMARKS=1 to run benchmarks")
+class BeaconBenchmark(TestCase):
+    """Microseconds per beacon through the view, RUN_BENCHMARKS=1 to run."""
+
+    def tearDown(self):
+        from django_redis import get_redis_connection
+
+        get_redis_connection("default").flushall()
+
+    def time_beacons(self, view, requests):
+        started = timeit.default_timer()
+        for request in requests:
+            view(request)
+        return (timeit.default_timer() - started) / len(requests) * 1e6
+
+    def test_beacon(self):
+        factory = RequestFactory()
+        view = AnalyticsView.as_view()
+        params = {"domain": "localhost", "url": "/blog/", "title": "Blog"}
+        cookie = view(factory.get("/analytics.gif", params)).cookies[VISITOR_COOKIE]
+        returning = factory.get("/analytics.gif", params)
+        returning.COOKIES[VISITOR_COOKIE] = cookie.value
+
+        rows = []
+        for label, make_request in (
+            ("new", lambda: factory.get("/analytics.gif", params)),
+            ("returning", lambda: returning),
+        ):
+            requests = [make_request() for __ in range(2000)]
+            with patch.object(page_view_queue, "push"), patch.object(
+                unique_visitors, "add"
+            ):
+                rows.append((label + ", view only", self.time_beacons(view, requests)))
+            rows.append((label + ", queued", self.time_beacons(view, requests)))
+        report("analytics beacon", rows, unit="us/beacon")
+
+
+@skipUnless(RUN_BENCHMARKS, "set RUN_BENCHMARKS=1 to run benchmarks")
+class PageViewIngestBenchmark(TestCase):
+    """Beacons per second queued and flushed, RUN_BENCHMARKS=1 to run."""
+
+    def tearDown(self):
+        from django_redis import get_redis_connection
+
+        get_redis_connection("default").flushall()
+
+    def legacy_save(self, data):
+        """The original save_page_analytics, one lookup and insert per beacon."""
+        try:
+            PageView.objects.get(
+                url=data["url"],
+                domain=data["domain"],
+                session_id=data["session_id"],
+                timestamp__contains=date.today(),
+            )
+        except PageView.DoesNotExist:
+            PageView(**data).save()
+
+    def test_throughput(self):
+        rows = []
+        for beacons in (1000, 10000):
+            # a tenth of the beacons repeat a page view of the same day
+            views = [
+                make_view(session_id="session-{0}".format(index % (beacons * 9 // 10)))
+                for index in range(beacons)
+            ]
+
+            started = timeit.default_timer()
+            for data in views:
+                page_view_queue.push(data)
+            pushed = timeit.default_timer()
+            self.assertEqual(page_view_queue.flush(), beacons * 9 // 10)
+            flushed = timeit.default_timer()
+            PageView.objects.all().delete()
+
+            started_legacy = timeit.default_timer()
+            for data in views:
+                self.legacy_save(data)
+            legacy = timeit.default_timer() - started_legacy
+            PageView.objects.all().delete()
+
+            label = "{0} beacons".format(beacons)
+            rows.append(("push, " + label, beacons / (pushed - started)))
+            rows.append(("flush, " + label, beacons / (flushed - pushed)))
+            rows.append(("legacy task, " + label, beacons / legacy))
+        report("page view ingestion", rows, unit="beacons/s")
+
+
+class PageViewInsertNewTestCase(TestCase):
+    def test_insert_new(self):
+        views = [PageView(**make_view(headers="{}")) for __ in range(2)]
+        self.assertEqual(PageView.objects.insert_new(views[:1]), 1)
+        self.assertEqual(PageView.objects.insert_new(views[1:]), 0)
+
+        other = PageView(**make_view(url="/about/", headers="{}"))
+        self.assertEqual(PageView.objects.insert_new([other]), 1)
+        self.assertEqual(PageView.objects.count(), 2)
+        self.assertEqual(PageView.objects.first().day, timezone.localdate())
+
+    def test_one_by_one(self):
+        views = [PageView(**make_view(headers="{}")) for __ in range(2)]
+        with patch.object(connection, "vendor", "oracle"):
+            self.assertEqual(PageView.objects.insert_new(views), 1)
+        self.assertEqual(PageView.objects.count(), 1)
+
+    def test_unique_day(self):
+        PageView(**make_view(headers="{}")).save()
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                PageView(**make_view(headers="{}")).save()
+
+
+class RollupTestCase(TestCase):
+    def setUp(self):
+        self.now = timezone.now().replace(minute=30)
+        self.yesterday = self.now - timedelta(days=1)
+
+    def add_views(self, *views):
+        PageView.objects.insert_new(
+            PageView(**make_view(headers="{}", **kwargs)) for kwargs in views
+        )
+
+    def test_rollup(self):
+        self.add_views(
+            dict(session_id="a", timestamp=self.yesterday),
+            dict(session_id="b", timestamp=self.yesterday),
+            dict(session_id="c", referrer="https://www.google.com/search?q=blog"),
+            dict(session_id="d", referrer="https://www.google.com/"),
+            dict(session_id="a", url="/about/"),
+        )
+        self.assertEqual(rollup_page_views(lag=0), 5)
+
+        per_day = page_views_per_day(
+            timezone.localdate(self.yesterday), timezone.localdate(), url="/blog/"
+        )
+        self.assertEqual(
+            per_day,
+            [(timezone.localdate(self.yesterday), 2), (timezone.localdate(), 2)],
+        )
+        daily = DailyPageViews.objects.get(
+            day=timezone.localdate(), url="/blog/", referrer_host="www.google.com"
+        )
+        self.assertEqual(daily.sessions, 2)
+        hourly = HourlyPageViews.objects.filter(url="/blog/")
+        self.assertEqual(sorted(hourly.values_list("sessions", flat=True)), [2, 2])
+        self.assertEqual(hourly.first().hour.minute, 0)
+
+    def test_incremental(self):
+        self.add_views(dict(session_id="a"), dict(session_id="b"))
+        self.assertEqual(rollup_page_views(lag=0), 2)
+        self.assertEqual(rollup_page_views(lag=0), 0)
+
+        self.add_views(dict(session_id="c"), dict(session_id="a", url="/about/"))
+        self.assertEqual(rollup_page_views(lag=0, chunk_size=1), 2)
+        self.assertEqual(DailyPageViews.objects.get(url="/blog/").sessions, 3)
+
+    def test_lag(self):
+        self.add_views(dict(session_id="a"))
+        self.assertEqual(rollup_page_views(lag=3600), 0)
+        self.assertFalse(DailyPageViews.objects.exists())
+
+    def test_prune(self):
+        old = self.now - timedelta(days=100)
+        self.add_views(dict(session_id="a", timestamp=old), dict(session_id="b"))
+        # nothing is deleted before it is rolled up
+        self.assertEqual(prune_page_views(days=90), 0)
+
+        rollup_page_views(lag=0)
+        self.assertEqual(prune_page_views(days=90), 1)
+        self.assertEqual(PageView.objects.get().session_id, "b")
+        self.assertEqual(
+            page_views_per_day(timezone.localdate(old), timezone.localdate(old)),
+            [(timezone.localdate(old), 1)],
+        )
+        self.assertEqual(prune_page_views(days=0), 0)
+
+
+def sparse_redis_value(registers):
+    """The sparse redis encoding of registers (ranks up to 32)."""
+    body = bytearray()
+    index = 0
+    while index < len(registers):
+        rank = registers[index]
+        run = 1
+        limit = 4 if rank else 16384
+        while (
+            index + run < len(registers)
+            and registers[index + run] == rank
+            and run < limit
+        ):
+            run += 1
+        if rank:
+            body.append(0x80 | (rank - 1) << 2 | (run - 1))
+        elif run <= 64:
+            body.append(run - 1)
+        else:
+            body += bytes([0x40 | (run - 1) >> 8, (run - 1) & 0xFF])
+        index += run
+    return b"HYLL\x01\0\0\0" + b"\0" * 8 + bytes(body)
+
+
+class HyperLogLogTestCase(SimpleTestCase):
+    def test_murmurhash64a(self):
+        # MurmurHash64A(element, 0xadc83b19), as redis hashes PFADD elements
+        self.assertEqual(murmurhash64a(b"a"), 6039968161137406375)
+        self.assertEqual(murmurhash64a(b"abcdefgh"), 17556823505701520743)
+        self.assertEqual(murmurhash64a(b"session-12345"), 1532631944929098205)
+
+    def test_count(self):
+        for size in (0, 1, 10, 5000):
+            sketch = HyperLogLog()
+            sketch.add(*("visitor-{0}".format(n) for n in range(size)))
+            sketch.add(*("visitor-{0}".format(n) for n in range(size)))
+            # within 2% (2.5 standard errors)
+            self.assertLessEqual(abs(sketch.count() - size), size * 0.02)
+
+    def test_merge(self):
+        first, second = HyperLogLog(), HyperLogLog()
+        first.add(*range(0, 3000))
+        second.add(*range(2000, 5000))
+        self.assertAlmostEqual(first.merge(second).count(), 5000, delta=100)
+
+    def test_serialization(self):
+        sketch = HyperLogLog()
+        sketch.add(*range(1000))
+        self.assertEqual(
+            HyperLogLog.from_bytes(sketch.to_bytes()).registers, sketch.registers
+        )
+        value = sketch.to_redis()
+        self.assertEqual(len(value), 16 + REGISTERS * 6 // 8)
+        self.assertEqual(HyperLogLog.from_redis(value).registers, sketch.registers)
+
+    def test_sparse_redis_value(self):
+        sketch = HyperLogLog()
+        sketch.add(*range(50))
+        value = sparse_redis_value(sketch.registers)
+        self.assertEqual(HyperLogLog.from_redis(value).registers, sketch.registers)
+
+        with self.assertRaises(ValueError):
+            HyperLogLog.from_redis(value[:-1])
+        with self.assertRaises(ValueError):
+            HyperLogLog.from_redis(b"not a sketch")
+
+
+class UniqueVisitorsTestCase(TestCase):
+    def tearDown(self):
+        from django_redis import get_redis_connection
+
+        get_redis_connection("default").flushall()
+
+    def assertEstimate(self, count, exact):
+        # within 2.5 standard errors of the estimate (0.81%), counts of
+        # redis and of HyperLogLog may differ slightly
+        self.assertAlmostEqual(count, exact, delta=max(1, exact * 0.02))
+
+    def setUp(self):
+        # redis is flushed between tests, pages have to be listed again
+        unique_visitors._registered_until = 0
+        self.today = timezone.localdate()
+        self.yesterday = self.today - timedelta(days=1)
+
+    def test_beacon(self):
+        url = reverse("analytics")
+        params = {"domain": "localhost", "url": "/blog/"}
+        for __ in range(3):
+            self.client.get(url, params)
+        self.assertEstimate(unique_visitors.count("localhost", "/blog/", self.today), 1)
+
+    def test_redis_count(self):
+        for visitor in range(100):
+            unique_visitors.add("localhost", "/blog/", visitor, self.yesterday)
+        for visitor in range(50, 150):
+            unique_visitors.add("localhost", "/blog/", visitor, self.today)
+
+        count = unique_visitors.count("localhost", "/blog/", self.yesterday)
+        self.assertEstimate(count, 100)
+        count = unique_visitors.count("localhost", "/blog/", self.yesterday, self.today)
+        self.assertEstimate(count, 150)
+
+    def test_persist(self):
+        sketch = HyperLogLog()
+        sketch.add(*range(100))
+        unique_visitors.add("localhost", "/blog/", "visitor", self.today)
+        connection = unique_visitors.get_connection()
+
+        # redis stores the sketch as a string value in this format
+        with patch.object(connection, "mget", return_value=[sketch.to_redis()]):
+            self.assertEqual(unique_visitors.persist(), 1)
+            self.assertEqual(unique_visitors.persist(), 1)
+            count = unique_visitors.count("localhost", "/blog/", self.today)
+        self.assertEqual(VisitorSketch.objects.count(), 1)
+        self.assertEstimate(count, 100)
+
+    def test_registered(self):
+        connection = unique_visitors.get_connection()
+        unique_visitors.add("localhost", "/blog/", "first", self.today)
+        with patch.object(connection, "pipeline") as pipeline:
+            unique_visitors.add("localhost", "/blog/", "second", self.today)
+            self.assertFalse(pipeline.called)
+            unique_visitors.add("localhost", "/about/", "second", self.today)
+            self.assertTrue(pipeline.called)
+        self.assertEstimate(unique_visitors.count("localhost", "/blog/", self.today), 2)
+
+    def test_local_fallback(self):
+        visitors = UniqueVisitors(flush_interval=3600)
+        with patch.object(visitors, "get_connection", return_value=None):
+            for visitor in range(20):
+                visitors.add("localhost", "/blog/", visitor, self.yesterday)
+            self.assertFalse(VisitorSketch.objects.exists())
+
+            # Sketches kept in process are merged once the interval is over.
+            visitors.flush_interval = 0
+            visitors.add("localhost", "/blog/", 99, self.today)
+
+            self.assertEqual(VisitorSketch.objects.count(), 2)
+            count = visitors.count("localhost", "/blog/", self.yesterday, self.today)
+        self.assertEstimate(count, 21)
@@ -1,56 +1,97 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from datetime import datetime
-import re
-from django.http.response import JsonResponse
+from datetime import datetime, timedelta
+import base64
+import time
+import uuid
+
+from django.http import HttpResponse
+from django.utils import timezone
 from django.views import View
 
-from analytics.tasks import save_page_analytics
+from analytics.ingest import page_view_queue
+from analytics.visitors import unique_visitors
+
+
+# transparent 1x1 GIF
+PIXEL = base64.b64decode("R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7")
+
+# request headers stored with the page views
+HEADERS = (
+    "HTTP_USER_AGENT",
+    "HTTP_ACCEPT_LANGUAGE",
+    "HTTP_REFERER",
+    "HTTP_DNT",
+    "HTTP_X_FORWARDED_FOR",
+)
+
+VISITOR_COOKIE = "visitor"
+VISITOR_COOKIE_SALT = "analytics.visitor"
+VISITOR_COOKIE_AGE = 365 * 24 * 3600
+
+
+class LocalDate:
+    """Today's local date, computed again only once the day is over."""
+
+    def __init__(self):
+        self._today = None
+        self._tomorrow = 0
+
+    def __call__(self, timestamp):
+        if timestamp >= self._tomorrow:
+            self._today = timezone.localdate()
+            midnight = datetime.combine(
+                self._today + timedelta(days=1), datetime.min.time()
+            )
+            self._tomorrow = timezone.make_aware(midnight).timestamp()
+        return self._today
+
+
+local_date = LocalDate()
 
 
 class AnalyticsView(View):
-    def __get_headers(self, request):
-        regex_http_ = re.compile(r"^HTTP_.+$")
-        regex_content_type = re.compile(r"^CONTENT_TYPE$")
-        regex_content_length = re.compile(r"^CONTENT_LENGTH$")
-
-        request_headers = {}
-        for header in request.META:
-            if (
-                regex_http_.match(header)
-                or regex_content_type.match(header)
-                or regex_content_length.match(header)
-            ):
-                request_headers[header] = request.META[header]
-        return request_headers
-
-    def __get_query_string(self, request):
-        query_string = {}
-        query = request.get_full_path().split("?")[0]
-        params = query.split("&")
-        for a_string in params:
-            key, value = a_string.split("=")
-            query_string.update({key: value})
-
-        return query_string
+    """
+    The analytics beacon, a 1x1 GIF queuing a page view.
+
+    Visitors are told apart by a signed cookie set on their first beacon,
+    the session is never loaded. Only the HEADERS are read from the
+    request and the view is queued with a unix timestamp, the work left to
+    the flush_page_views task.
+    """
 
     def get(self, request):
-        now = datetime.now()
-        try:
-            headers = self.__get_headers(request)
-            session_id = request.session.session_key
-            data = dict(
-                headers=headers,
-                session_id=session_id,
-                domain=request.GET.get("domain", ""),
-                url=request.GET.get("url", ""),
-                title=request.GET.get("title", ""),
-                referrer=request.GET.get("ref", ""),
-                ip=request.META["REMOTE_ADDR"],
-                timestamp=now,
+        now = time.time()
+        meta = request.META
+        visitor = request.get_signed_cookie(
+            VISITOR_COOKIE, default=None, salt=VISITOR_COOKIE_SALT
+        )
+        new_visitor = visitor is None
+        if new_visitor:
+            visitor = uuid.uuid4().hex
+
+        data = dict(
+            headers={header: meta[header] for header in HEADERS if header in meta},
+            session_id=visitor,
+            domain=request.GET.get("domain", ""),
+            url=request.GET.get("url", ""),
+            title=request.GET.get("title", ""),
+            referrer=request.GET.get("ref", ""),
+            ip=meta["REMOTE_ADDR"],
+            timestamp=now,
+        )
+        page_view_queue.push(data)
+        unique_visitors.add(data["domain"], data["url"], visitor, local_date(now))
+
+        response = HttpResponse(PIXEL, content_type="image/gif")
+        response["Cache-Control"] = "no-store"
+        if new_visitor:
+            response.set_signed_cookie(
+                VISITOR_COOKIE,
+                visitor,
+                salt=VISITOR_COOKIE_SALT,
+                max_age=VISITOR_COOKIE_AGE,
+                httponly=True,
             )
-            save_page_analytics.delay(data)
-            return JsonResponse({"message": "Ok"}, status=200)
-        except Exception as e:
-            return JsonResponse({"Error": e}, status=400)
+        return response
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import timedelta
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from analytics.hll import HyperLogLog
+from analytics.models import VisitorSketch
+
+
+class UniqueVisitors:
+    """
+    Unique visitors per page and day in HyperLogLog sketches.
+
+    Visitors are added with PFADD to a sketch per page and day on the
+    default cache server (the page is listed and the ttl set on the first
+    hit of each flush interval only), and the persist_visitor_sketches task
+    copies the sketches of the last days to VisitorSketch. Counts over a range of days
+    merge the stored and live sketches, in constant memory (16 KB) and time
+    per day whatever the number of visitors, within 0.81% (one standard
+    error) of the exact count. When redis is not reachable sketches are
+    kept in this process and merged in the database once they are older
+    than the flush interval.
+    """
+
+    def __init__(self, flush_interval=60, redis_days=3):
+        self.flush_interval = flush_interval
+        self.redis_days = redis_days
+        self._local = {}
+        self._local_since = None
+        self._lock = threading.Lock()
+        # keys listed in their day's pages and given a ttl by this process
+        self._registered = set()
+        self._registered_until = 0
+
+    def key(self, day, domain, url):
+        page = hashlib.md5("{0}\n{1}".format(domain, url).encode("utf-8"))
+        return cache.make_key("visitors:{0}:{1}".format(day, page.hexdigest()))
+
+    def pages_key(self, day):
+        return cache.make_key("visitors:{0}:pages".format(day))
+
+    def get_connection(self):
+        try:
+            return get_redis_connection("default")
+        except NotImplementedError:
+            # the default cache is not a redis cache
+            return None
+
+    def add(self, domain, url, visitor, day=None):
+        day = day or timezone.localdate()
+        connection = self.get_connection()
+        if connection is not None:
+            timeout = self.redis_days * 24 * 3600
+            key, pages_key = self.key(day, domain, url), self.pages_key(day)
+            try:
+                if key in self._registered and time.time() < self._registered_until:
+                    connection.pfadd(key, visitor)
+                    return
+                pipeline = connection.pipeline(transaction=False)
+                pipeline.pfadd(key, visitor)
+                pipeline.sadd(pages_key, json.dumps([domain, url]))
+                pipeline.expire(key, timeout)
+                pipeline.expire(pages_key, timeout)
+                pipeline.execute()
+                self.registered(key)
+                return
+            except RedisError:
+                pass
+
+        with self._lock:
+            sketch = self._local.setdefault((day, domain, url), HyperLogLog())
+            sketch.add(visitor)
+            if self._local_since is None:
+                self._local_since = time.time()
+            due = time.time() - self._local_since >= self.flush_interval
+        if due:
+            self.flush_local()
+
+    def registered(self, key):
+        # forgotten every flush interval, so a key recreated without a ttl
+        # (after a redis restart) gets it back
+        with self._lock:
+            if time.time() >= self._registered_until:
+                self._registered = set()
+                self._registered_until = time.time() + self.flush_interval
+            self._registered.add(key)
+
+    def flush_local(self):
+        """Merge the sketches kept in this process into the database."""
+        with self._lock:
+            sketches, self._local = self._local, {}
+            self._local_since = None
+        return self.save(sketches)
+
+    @staticmethod
+    def save(sketches):
+        """Merge sketches ((day, domain, url) -> HyperLogLog) into VisitorSketch."""
+        for (day, domain, url), sketch in sketches.items():
+            with transaction.atomic():
+                stored, __ = VisitorSketch.objects.select_for_update().get_or_create(
+                    day=day,
+                    domain=domain,
+                    url=url,
+                    defaults={"registers": HyperLogLog().to_bytes()},
+                )
+                sketch = HyperLogLog.from_bytes(stored.registers).merge(sketch)
+                stored.registers = sketch.to_bytes()
+                stored.save(update_fields=["registers"])
+        return len(sketches)
+
+    @staticmethod
+    def read_redis(connection, keys):
+        """The sketches of keys read from redis, None for the missing ones."""
+        sketches = []
+        for data in connection.mget(keys):
+            try:
+                sketches.append(HyperLogLog.from_redis(data) if data else None)
+            except ValueError:
+                sketches.append(None)
+        return sketches
+
+    def persist(self, days=None):
+        """
+        Copy the redis sketches of days (today and yesterday by default) to
+        the database. Merging is idempotent, running it again is harmless.
+        """
+        connection = self.get_connection()
+        if connection is None:
+            return 0
+        if days is None:
+            today = timezone.localdate()
+            days = [today - timedelta(days=1), today]
+
+        total = 0
+        for day in days:
+            try:
+                pages = [
+                    tuple(json.loads(page.decode("utf-8")))
+                    for page in connection.smembers(self.pages_key(day))
+                ]
+                sketches = {}
+                for start in range(0, len(pages), 100):
+                    batch = pages[start : start + 100]
+                    keys = [self.key(day, domain, url) for domain, url in batch]
+                    for (domain, url), sketch in zip(
+                        batch, self.read_redis(connection, keys)
+                    ):
+                        if sketch is not None:
+                            sketches[day, domain, url] = sketch
+            except RedisError:
+                continue
+            total += self.save(sketches)
+        return total
+
+    def count(self, domain, url, start, end=None):
+        """Estimated unique visitors of a page between the days start and end."""
+        end = end or start
+        days = [start + timedelta(days=n) for n in range((end - start).days + 1)]
+        stored = VisitorSketch.objects.filter(
+            day__gte=start, day__lte=end, domain=domain, url=url
+        ).values_list("registers", flat=True)
+        stored = [HyperLogLog.from_bytes(registers) for registers in stored]
+
+        connection = self.get_connection()
+        keys = [self.key(day, domain, url) for day in days]
+        try:
+            if connection is not None and not stored:
+                # the union is estimated by redis
+                return connection.pfcount(*keys)
+            live = self.read_redis(connection, keys) if connection else []
+        except RedisError:
+            live = []
+        live = [sketch for sketch in live if sketch is not None]
+        return HyperLogLog().merge(*stored + live).count()
+
+
+unique_visitors = UniqueVisitors(
+    flush_interval=getattr(settings, "UNIQUE_VISITORS_FLUSH_INTERVAL", 60),
+    redis_days=getattr(settings, "UNIQUE_VISITORS_REDIS_DAYS", 3),
+)
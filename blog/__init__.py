@@ -1,2 +1,4 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
+
+default_app_config = "blog.apps.BlogConfig"
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import Counter
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError, ResponseError
+
+from blog.models import Entry
+
+
+class ViewCounter:
+    """
+    Buffers entry views and writes them to Entry.views in batches.
+
+    Views are counted in a redis hash (entry slug -> views) on the default
+    cache server and flushed to the database with one UPDATE by the
+    flush_entry_views task. When redis is not reachable views are kept
+    in this process and written by it once they are older than the flush
+    interval, or by the next flush.
+
+    Hashes being flushed are registered in a sorted set, the ones left by
+    a flush that failed or died are picked up by the next flush once they
+    are recover_after seconds old.
+    """
+
+    def __init__(self, flush_interval=60, recover_after=300):
+        self.flush_interval = flush_interval
+        self.recover_after = recover_after
+        self._local = Counter()
+        self._local_since = None
+        self._lock = threading.Lock()
+
+    @property
+    def key(self):
+        return cache.make_key("entry_views")
+
+    def get_connection(self):
+        try:
+            return get_redis_connection("default")
+        except NotImplementedError:
+            # the default cache is not a redis cache
+            return None
+
+    def incr(self, slug):
+        connection = self.get_connection()
+        if connection is not None:
+            try:
+                connection.hincrby(self.key, slug, 1)
+            except RedisError:
+                pass
+            else:
+                if self._local:
+                    # redis is back, write what was kept meanwhile
+                    self.flush_local()
+                return
+
+        with self._lock:
+            self._local[slug] += 1
+            if self._local_since is None:
+                self._local_since = time.time()
+            due = time.time() - self._local_since >= self.flush_interval
+        if due:
+            self.flush_local()
+
+    @property
+    def flushing_keys(self):
+        # hashes being flushed, scored by the time their flush started
+        return cache.make_key("entry_views_flushing")
+
+    def flush(self):
+        """Move the views counted in redis, and in this process, to the database."""
+        total = self.flush_local()
+        connection = self.get_connection()
+        if connection is None:
+            return total
+
+        for key in self.leftover_keys(connection):
+            total += self.drain(connection, key)
+
+        # rename first so views counted while flushing go to a new hash,
+        # registered before so a later flush finds it if this one fails
+        flushing_key = "{0}:{1}".format(self.key, uuid.uuid4().hex)
+        try:
+            connection.zadd(self.flushing_keys, time.time(), flushing_key)
+            connection.rename(self.key, flushing_key)
+        except ResponseError:
+            # nothing counted since the last flush
+            connection.zrem(self.flushing_keys, flushing_key)
+            return total
+        except RedisError:
+            # redis is down
+            return total
+        return total + self.drain(connection, flushing_key)
+
+    def leftover_keys(self, connection):
+        """
+        Claim the hashes of flushes older than recover_after, registering
+        them again with the current time so a concurrent flush does not
+        write them too.
+        """
+        cutoff = time.time() - self.recover_after
+        keys = []
+        for key in connection.zrangebyscore(self.flushing_keys, "-inf", cutoff):
+            # only one flush removes it
+            if connection.zrem(self.flushing_keys, key):
+                connection.zadd(self.flushing_keys, time.time(), key)
+                keys.append(key)
+        return keys
+
+    def drain(self, connection, key):
+        """Write the views of the hash key, then remove and unregister it."""
+        counts = connection.hgetall(key)
+        total = self.save(
+            {slug.decode("utf-8"): int(views) for slug, views in counts.items()}
+        )
+        pipeline = connection.pipeline()
+        pipeline.delete(key)
+        pipeline.zrem(self.flushing_keys, key)
+        pipeline.execute()
+        return total
+
+    def flush_local(self):
+        """Write the views counted in this process to the database."""
+        with self._lock:
+            counts, self._local = self._local, Counter()
+            self._local_since = None
+        return self.save(counts)
+
+    @staticmethod
+    def save(counts):
+        """Add counts (entry slug -> views) to Entry.views with one UPDATE."""
+        if not counts:
+            return 0
+
+        whens = [models.When(slug=slug, then=views) for slug, views in counts.items()]
+        Entry.objects.filter(slug__in=counts.keys()).update(
+            views=models.F("views")
+            + models.Case(*whens, output_field=models.PositiveIntegerField())
+        )
+        return sum(counts.values())
+
+
+view_counter = ViewCounter(
+    flush_interval=getattr(settings, "ENTRY_VIEWS_FLUSH_INTERVAL", 60)
+)
+
+
+def count_view(slug):
+    """
+    Count a view of the entry with slug, in the database or buffered per
+    ENTRY_VIEWS_MODE. Keyed by slug so pages served from the page cache are
+    counted without looking the entry up.
+    """
+    if getattr(settings, "ENTRY_VIEWS_MODE", "sync") == "buffered":
+        view_counter.incr(slug)
+    else:
+        Entry.objects.filter(slug=slug).update(views=models.F("views") + 1)
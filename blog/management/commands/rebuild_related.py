@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog.related import rebuild_related
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the similar entries of every entry, e.g. after upgrading or "
+        "changing RELATED_ENTRIES_COUNT. Tag changes keep them up to date, run it "
+        "now and then to refit the number of tagged entries weighting the tags."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--count",
+            type=int,
+            default=settings.RELATED_ENTRIES_COUNT,
+            dest="count",
+            help="Number of similar entries kept per entry.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.time()
+        total = rebuild_related(options["count"])
+        message = "Related entries of {0} entries rebuilt in {1:.1f}s."
+        self.stdout.write(
+            self.style.SUCCESS(message.format(total, time.time() - started))
+        )
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog.tfidf import rebuild_vectors
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the TF-IDF vectors and nearest entries of every published "
+        "entry. Saves keep them up to date against the document frequencies "
+        "of the last rebuild, run it now and then to refit them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--count",
+            type=int,
+            default=settings.RELATED_ENTRIES_COUNT,
+            dest="count",
+            help="Number of nearest entries kept per entry.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.time()
+        total = rebuild_vectors(options["count"])
+        message = "Vectors of {0} entries rebuilt in {1:.1f}s."
+        self.stdout.write(
+            self.style.SUCCESS(message.format(total, time.time() - started))
+        )
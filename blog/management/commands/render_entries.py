@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing
+import os
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from blog.models import Entry
+from blog.utils import RENDERER_VERSION, render_entry_body
+
+
+def render_chunk(chunk):
+    """Render a list of (pk, body) pairs, runs in the worker processes."""
+    return [(pk, render_entry_body(body)) for pk, body in chunk]
+
+
+def save_chunk(rendered):
+    """Write a chunk of (pk, html) pairs back with a single UPDATE."""
+    # update() keeps modified_at untouched, re-rendering is not an edit.
+    whens = [models.When(pk=pk, then=models.Value(html)) for pk, html in rendered]
+    Entry.objects.filter(pk__in=[pk for pk, __ in rendered]).update(
+        rendered_body=models.Case(*whens, output_field=models.TextField()),
+        renderer_version=RENDERER_VERSION,
+    )
+
+
+class Checkpoint:
+    """
+    Remembers the last entry written so an interrupted run can resume,
+    a checkpoint left by another renderer version is ignored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with open(self.path) as checkpoint:
+            data = json.load(checkpoint)
+        if data.get("renderer_version") != RENDERER_VERSION:
+            return 0
+        return data["last_pk"]
+
+    def save(self, last_pk):
+        if not self.path:
+            return
+        with open(self.path, "w") as checkpoint:
+            json.dump(
+                {"renderer_version": RENDERER_VERSION, "last_pk": last_pk}, checkpoint
+            )
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-render the stored HTML of entries whose renderer version is out of "
+        "date, e.g. after changing the formatter or upgrading Pygments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            dest="all",
+            help="Re-render every entry, not only the stale ones.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            dest="batch_size",
+            help="Number of entries rendered and written back together.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            dest="workers",
+            help="Number of rendering processes, 1 renders in this process.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default=None,
+            dest="checkpoint",
+            help="File used to resume an interrupted run after the last written entry.",
+        )
+
+    def get_chunks(self, queryset, batch_size):
+        chunk = []
+        entries = queryset.order_by("pk").values_list("pk", "body")
+        for entry in entries.iterator(chunk_size=batch_size):
+            chunk.append(entry)
+            if len(chunk) == batch_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def render(self, chunks, workers):
+        """Yield rendered chunks in order, rendering up to workers at a time."""
+        if workers <= 1:
+            for chunk in chunks:
+                yield render_chunk(chunk)
+            return
+
+        # spawn so workers open their own cache connections
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            workers, mp_context=context, initializer=django.setup
+        ) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(render_chunk, chunk))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def handle(self, *args, **options):
+        checkpoint = Checkpoint(options["checkpoint"])
+        last_pk = checkpoint.load()
+
+        queryset = Entry.objects.filter(pk__gt=last_pk)
+        if not options["all"]:
+            queryset = queryset.exclude(renderer_version=RENDERER_VERSION)
+
+        total = 0
+        started = time.time()
+        chunks = self.get_chunks(queryset, options["batch_size"])
+        for rendered in self.render(chunks, options["workers"]):
+            save_chunk(rendered)
+            checkpoint.save(rendered[-1][0])
+            total += len(rendered)
+
+            if options["verbosity"] > 1:
+                self.stdout.write(
+                    "{0} entries, {1:.1f} entries/sec".format(
+                        total, total / max(time.time() - started, 1e-6)
+                    )
+                )
+
+        checkpoint.clear()
+        elapsed = max(time.time() - started, 1e-6)
+        message = "Rendered {0} entries with {1} in {2:.1f}s ({3:.1f} entries/sec)."
+        self.stdout.write(
+            self.style.SUCCESS(
+                message.format(total, RENDERER_VERSION, elapsed, total / elapsed)
+            )
+        )
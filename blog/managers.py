@@ -8,6 +8,28 @@ from django.db import models
 class PublishedEntryQuerySet(models.QuerySet):
     """QuerySet that returns only published Entries."""
 
+    # Columns rendered by entry cards, list pages and the sitemap.
+    CARD_FIELDS = (
+        "title",
+        "slug",
+        "category",
+        "author",
+        "poster",
+        "created_at",
+        "modified_at",
+        "published_date",
+        "is_published",
+        "views",
+        "excerpt",
+        "word_count",
+        "reading_time",
+        "code_blocks",
+    )
+
+    def cards(self):
+        """Load only the card columns, leaving out the (large) body columns."""
+        return self.only(*self.CARD_FIELDS)
+
     @classmethod
     def as_manager(cls):
         def get_queryset(self):
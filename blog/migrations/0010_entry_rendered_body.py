@@ -0,0 +1,23 @@
+# Generated by Django 2.0.8 on 2026-10-18 12:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("blog", "0009_entry_category")]
+
+    operations = [
+        migrations.AddField(
+            model_name="entry",
+            name="rendered_body",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.AddField(
+            model_name="entry",
+            name="renderer_version",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=64
+            ),
+        ),
+    ]
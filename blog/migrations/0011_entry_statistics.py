@@ -0,0 +1,55 @@
+# Generated by Django 2.0.8 on 2026-10-18 13:02
+
+import html
+import math
+import re
+
+from django.db import migrations, models
+from django.utils.encoding import smart_text
+
+
+TAG_RE = re.compile("<.*?>")
+PRE_RE = re.compile(r"(<pre[^>]*>)(.*?)(</pre>)", re.DOTALL | re.UNICODE)
+WORDS_PER_MINUTE = 200
+
+
+# a copy of blog.utils.body_statistics as of this migration
+def body_statistics(text):
+    text = smart_text(text)
+    words = len(html.unescape(TAG_RE.sub(" ", text)).split())
+    code_blocks = sum(1 for __ in PRE_RE.finditer(text))
+    return words, int(math.ceil(words / WORDS_PER_MINUTE)), code_blocks
+
+
+def update_statistics(apps, schema_editor):
+    Entry = apps.get_model("blog", "Entry")
+    entries = Entry.objects.order_by("pk").values_list("pk", "body")
+    for pk, body in entries.iterator(chunk_size=500):
+        word_count, reading_time, code_blocks = body_statistics(body)
+        Entry.objects.filter(pk=pk).update(
+            word_count=word_count, reading_time=reading_time, code_blocks=code_blocks
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("blog", "0010_entry_rendered_body")]
+
+    operations = [
+        migrations.AddField(
+            model_name="entry",
+            name="code_blocks",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="entry",
+            name="reading_time",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="entry",
+            name="word_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(update_statistics, migrations.RunPython.noop),
+    ]
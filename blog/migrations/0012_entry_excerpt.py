@@ -0,0 +1,40 @@
+# Generated by Django 2.0.8 on 2026-10-18 13:02
+
+import html
+import re
+
+from django.db import migrations, models
+from django.utils.encoding import smart_text
+from django.utils.text import Truncator
+
+
+TAG_RE = re.compile("<.*?>")
+
+
+# a copy of blog.utils.make_excerpt as of this migration
+def make_excerpt(text, length=128):
+    words = html.unescape(TAG_RE.sub(" ", smart_text(text))).split()
+    return Truncator(" ".join(words)).chars(length)
+
+
+def update_excerpts(apps, schema_editor):
+    Entry = apps.get_model("blog", "Entry")
+    entries = Entry.objects.order_by("pk").values_list("pk", "body")
+    for pk, body in entries.iterator(chunk_size=500):
+        Entry.objects.filter(pk=pk).update(excerpt=make_excerpt(body))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("blog", "0011_entry_statistics")]
+
+    operations = [
+        migrations.AddField(
+            model_name="entry",
+            name="excerpt",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=128
+            ),
+        ),
+        migrations.RunPython(update_excerpts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.0.8 on 2026-10-18 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("blog", "0012_entry_excerpt")]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="entry",
+            index=models.Index(
+                fields=["modified_at", "id"], name="entries_modified_id_idx"
+            ),
+        )
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 2.0.8 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+INDEXES = [
+    models.Index(
+        fields=["is_published", "-modified_at", "-id"], name="entries_published_idx"
+    ),
+    models.Index(
+        fields=["is_published", "category", "-modified_at", "-id"],
+        name="entries_category_pub_idx",
+    ),
+    models.Index(fields=["author", "-modified_at", "-id"], name="entries_author_idx"),
+]
+
+# Public queries only ever read published entries, PostgreSQL keeps them in
+# smaller partial indexes instead.
+PARTIAL_INDEXES = {
+    "entries_published_idx": (
+        'CREATE INDEX "entries_published_idx" ON "entries" '
+        '("modified_at" DESC, "id" DESC) WHERE "is_published"'
+    ),
+    "entries_category_pub_idx": (
+        'CREATE INDEX "entries_category_pub_idx" ON "entries" '
+        '("category_id", "modified_at" DESC, "id" DESC) WHERE "is_published"'
+    ),
+}
+
+
+def add_indexes(apps, schema_editor):
+    Entry = apps.get_model("blog", "Entry")
+    partial = schema_editor.connection.vendor == "postgresql"
+    for index in INDEXES:
+        if partial and index.name in PARTIAL_INDEXES:
+            schema_editor.execute(PARTIAL_INDEXES[index.name])
+        else:
+            schema_editor.add_index(Entry, index)
+
+
+def remove_indexes(apps, schema_editor):
+    Entry = apps.get_model("blog", "Entry")
+    for index in INDEXES:
+        schema_editor.remove_index(Entry, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("blog", "0013_entry_modified_id_index")]
+
+    operations = [
+        # superseded by the indexes below, which start with the filters
+        migrations.RemoveIndex(model_name="entry", name="entries_modified_id_idx"),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name="entry", index=index)
+                for index in INDEXES
+            ],
+            database_operations=[migrations.RunPython(add_indexes, remove_indexes)],
+        ),
+    ]
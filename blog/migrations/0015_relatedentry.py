@@ -0,0 +1,57 @@
+# Generated by Django 2.0.8 on 2026-10-18 13:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("blog", "0014_entry_composite_indexes")]
+
+    operations = [
+        migrations.CreateModel(
+            name="RelatedEntry",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField()),
+                (
+                    "entry",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="related_entries",
+                        to="blog.Entry",
+                    ),
+                ),
+                (
+                    "related",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similar_to",
+                        to="blog.Entry",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Related Entry",
+                "verbose_name_plural": "Related Entries",
+                "db_table": "related_entries",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="relatedentry",
+            index=models.Index(
+                fields=["entry", "-score"], name="related_entries_score_idx"
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="relatedentry", unique_together={("entry", "related")}
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 2.0.8 on 2026-10-18 13:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("blog", "0015_relatedentry")]
+
+    operations = [
+        migrations.CreateModel(
+            name="EntryVector",
+            fields=[
+                (
+                    "entry",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="vector",
+                        serialize=False,
+                        to="blog.Entry",
+                    ),
+                ),
+                ("terms", models.BinaryField()),
+                ("weights", models.BinaryField()),
+                ("neighbours", models.BinaryField()),
+                ("scores", models.BinaryField()),
+            ],
+            options={
+                "verbose_name": "Entry Vector",
+                "verbose_name_plural": "Entry Vectors",
+                "db_table": "entry_vectors",
+            },
+        ),
+        migrations.CreateModel(
+            name="TermFrequency",
+            fields=[
+                ("term", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("df", models.PositiveIntegerField()),
+            ],
+            options={
+                "verbose_name": "Term Frequency",
+                "verbose_name_plural": "Term Frequencies",
+                "db_table": "term_frequencies",
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.0.8 on 2026-10-18 13:55
+
+from collections import defaultdict
+import json
+
+from django.db import migrations, models
+
+
+def update_tag_names(apps, schema_editor):
+    Entry = apps.get_model("blog", "Entry")
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    TaggedItem = apps.get_model("taggit", "TaggedItem")
+
+    # historical models can't follow the generic relation of Entry.tags
+    content_type = ContentType.objects.filter(app_label="blog", model="entry").first()
+    if content_type is None:
+        return
+    names = defaultdict(list)
+    rows = (
+        TaggedItem.objects.filter(content_type=content_type)
+        .order_by("tag__name")
+        .values_list("object_id", "tag__name")
+    )
+    for pk, name in rows.iterator(chunk_size=500):
+        names[pk].append(name)
+    for pk, tag_names in names.items():
+        Entry.objects.filter(pk=pk).update(tag_names=json.dumps(tag_names))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0016_entryvector_termfrequency"),
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("taggit", "0002_auto_20150616_2121"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="entry",
+            name="tag_names",
+            field=models.TextField(default="[]", editable=False),
+        ),
+        migrations.RunPython(update_tag_names, migrations.RunPython.noop),
+    ]
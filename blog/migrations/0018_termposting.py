@@ -0,0 +1,69 @@
+# Generated by Django 2.0.8 on 2026-10-18 14:34
+
+from array import array
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def add_postings(apps, schema_editor):
+    EntryVector = apps.get_model("blog", "EntryVector")
+    TermPosting = apps.get_model("blog", "TermPosting")
+
+    # the vectors hold uint32 terms and float32 weights
+    postings = []
+    rows = EntryVector.objects.values_list("entry_id", "terms", "weights")
+    for pk, terms, weights in rows.iterator(chunk_size=500):
+        terms, weights = array("I", bytes(terms)), array("f", bytes(weights))
+        postings.extend(
+            TermPosting(term=term, entry_id=pk, weight=weight)
+            for term, weight in zip(terms, weights)
+        )
+        if len(postings) >= 5000:
+            TermPosting.objects.bulk_create(postings)
+            postings = []
+    TermPosting.objects.bulk_create(postings)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("blog", "0017_entry_tag_names")]
+
+    operations = [
+        migrations.CreateModel(
+            name="TermPosting",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("term", models.BigIntegerField()),
+                ("weight", models.FloatField()),
+                (
+                    "entry",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="term_postings",
+                        to="blog.Entry",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Term Posting",
+                "verbose_name_plural": "Term Postings",
+                "db_table": "term_postings",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="termposting",
+            index=models.Index(
+                fields=["term", "-weight", "-entry"], name="term_postings_weight_idx"
+            ),
+        ),
+        migrations.RunPython(add_postings, migrations.RunPython.noop),
+    ]
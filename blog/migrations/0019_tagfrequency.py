@@ -0,0 +1,48 @@
+# Generated by Django 2.0.8 on 2026-10-18 14:55
+
+from django.db import migrations, models
+
+
+def add_frequencies(apps, schema_editor):
+    Entry = apps.get_model("blog", "Entry")
+    TaggedItem = apps.get_model("taggit", "TaggedItem")
+    TagFrequency = apps.get_model("blog", "TagFrequency")
+
+    pairs = TaggedItem.objects.filter(
+        content_type__app_label="blog",
+        content_type__model="entry",
+        object_id__in=Entry.objects.filter(is_published=True).values("pk"),
+    )
+    frequencies = pairs.order_by().values("tag_id").annotate(df=models.Count("pk"))
+    TagFrequency.objects.bulk_create(
+        (TagFrequency(tag=row["tag_id"], df=row["df"]) for row in frequencies),
+        batch_size=500,
+    )
+    # tag -1 holds the number of tagged entries
+    total = pairs.values("object_id").distinct().count()
+    TagFrequency.objects.create(tag=-1, df=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("taggit", "0002_auto_20150616_2121"),
+        ("blog", "0018_termposting"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TagFrequency",
+            fields=[
+                ("tag", models.IntegerField(primary_key=True, serialize=False)),
+                ("df", models.PositiveIntegerField()),
+            ],
+            options={
+                "verbose_name": "Tag Frequency",
+                "verbose_name_plural": "Tag Frequencies",
+                "db_table": "tag_frequencies",
+            },
+        ),
+        migrations.RunPython(add_frequencies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.0.8 on 2026-10-18 15:10
+
+import html
+import math
+import re
+
+from django.db import migrations
+from django.utils.encoding import smart_text
+
+
+TAG_RE = re.compile("<.*?>", re.DOTALL)
+PRE_RE = re.compile(r"(<pre[^>]*>)(.*?)(</pre>)", re.DOTALL | re.UNICODE)
+WORDS_PER_MINUTE = 200
+
+
+# the word count of blog.utils.body_statistics as of this migration
+def prose_words(text):
+    prose = PRE_RE.sub(" ", smart_text(text))
+    return len(html.unescape(TAG_RE.sub(" ", prose)).split())
+
+
+def update_word_counts(apps, schema_editor):
+    Entry = apps.get_model("blog", "Entry")
+    entries = Entry.objects.order_by("pk").values_list("pk", "body", "word_count")
+    for pk, body, word_count in entries.iterator(chunk_size=500):
+        words = prose_words(body)
+        if words != word_count:
+            Entry.objects.filter(pk=pk).update(
+                word_count=words, reading_time=int(math.ceil(words / WORDS_PER_MINUTE))
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("blog", "0019_tagfrequency")]
+
+    operations = [migrations.RunPython(update_word_counts, migrations.RunPython.noop)]
@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from array import array
+import json
 import os
 import re
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.utils import timezone
 from django.urls import reverse
 from django.utils.safestring import mark_safe
@@ -15,7 +17,14 @@ from meta.models import ModelMeta
 from taggit.managers import TaggableManager
 
 from blog.managers import PublishedEntryQuerySet
-from blog.utils import FileUploader, pygmentify_html
+from blog.utils import (
+    RENDERER_VERSION,
+    FileUploader,
+    body_statistics,
+    make_excerpt,
+    render_entry_body,
+    EXCERPT_LENGTH,
+)
 
 
 class Category(models.Model):
@@ -50,6 +59,16 @@ class Entry(ModelMeta, models.Model):
     )
     author = models.ForeignKey("auth.User", on_delete=models.CASCADE)
     body = models.TextField(null=False, blank=False)
+    rendered_body = models.TextField(blank=True, default="", editable=False)
+    renderer_version = models.CharField(
+        max_length=64, blank=True, default="", editable=False
+    )
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveIntegerField(default=0, editable=False)
+    code_blocks = models.PositiveIntegerField(default=0, editable=False)
+    excerpt = models.CharField(
+        max_length=EXCERPT_LENGTH, blank=True, default="", editable=False
+    )
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
     modified_at = models.DateTimeField(auto_now=True, editable=False)
     published_date = models.DateTimeField(null=True, blank=True, editable=False)
@@ -57,10 +76,24 @@ class Entry(ModelMeta, models.Model):
         null=True, blank=True, upload_to=FileUploader(os.path.join("entry", "poster"))
     )
     is_published = models.BooleanField(default=False)
+    # JSON list of the tag names, kept in sync by blog.signals
+    tag_names = models.TextField(default="[]", editable=False)
     views = models.PositiveIntegerField(
         default=1
     )  # we will change this later and write a better one later
 
+    # number of slugs tried when concurrent saves race for the same one
+    SLUG_ATTEMPTS = 3
+    # fields computed from the body on save
+    BODY_FIELDS = (
+        "rendered_body",
+        "renderer_version",
+        "word_count",
+        "reading_time",
+        "code_blocks",
+        "excerpt",
+    )
+
     tags = TaggableManager()
     objects = models.Manager()
     published = PublishedEntryQuerySet.as_manager()
@@ -70,6 +103,21 @@ class Entry(ModelMeta, models.Model):
         verbose_name_plural = _("Entries")
         db_table = "entries"
         default_related_name = "entries"
+        # match the list, sitemap and dashboard queries and their
+        # (modified_at, id) cursors, see migration 0014 for PostgreSQL.
+        indexes = [
+            models.Index(
+                fields=["is_published", "-modified_at", "-id"],
+                name="entries_published_idx",
+            ),
+            models.Index(
+                fields=["is_published", "category", "-modified_at", "-id"],
+                name="entries_category_pub_idx",
+            ),
+            models.Index(
+                fields=["author", "-modified_at", "-id"], name="entries_author_idx"
+            ),
+        ]
 
     _metadata = {
         "title": "title",
@@ -79,33 +127,95 @@ class Entry(ModelMeta, models.Model):
         "url": "get_absolute_url",
     }
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Entry, cls).from_db(db, field_names, values)
+        # lets signal receivers tell what a save changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def get_meta_image(self):
         return self.get_poster()
 
     def get_meta_tags(self):
-        tags = self.tags.all()
-        return [tag.name.title() for tag in tags]
+        return [name.title() for name in self.get_tag_names()]
+
+    def get_tag_names(self):
+        """Names of the entry tags, sorted, read without querying the tags."""
+        if not hasattr(self, "_tag_names"):
+            self._tag_names = json.loads(self.tag_names)
+        return self._tag_names
+
+    @classmethod
+    def update_tag_names(cls, entry_ids):
+        """Store the current tag names of entry_ids in a single UPDATE."""
+        entry_ids = set(entry_ids)
+        if not entry_ids:
+            return {}
+        names = {pk: [] for pk in entry_ids}
+        rows = (
+            cls.objects.filter(pk__in=entry_ids, tags__isnull=False)
+            .order_by("tags__name")
+            .values_list("pk", "tags__name")
+        )
+        for pk, name in rows:
+            names[pk].append(name)
+        names = {pk: json.dumps(tag_names) for pk, tag_names in names.items()}
+        whens = [
+            models.When(pk=pk, then=models.Value(value)) for pk, value in names.items()
+        ]
+        cls.objects.filter(pk__in=entry_ids).update(
+            tag_names=models.Case(*whens, output_field=models.TextField())
+        )
+        return names
 
     def __str__(self):
         return self.title
 
     def __get_unique_slug(self):
-        slug = slugify(self.title)
+        # a title of punctuation or non-latin letters slugifies to nothing
+        slug = slugify(self.title) or "entry"
         unique_slug = slug
         num = 1
 
-        while self.__class__.objects.filter(slug=unique_slug).exists():
+        # fetch the taken slugs at once, then find a free suffix in memory
+        # instead of one query per taken slug.
+        taken = self.__taken_slugs(slug)
+        while unique_slug in taken:
             unique_slug = "{}-{}".format(slug, num)
             num += 1
         return unique_slug
 
+    def __taken_slugs(self, slug):
+        """slug and its numbered versions (slug-1, slug-2...) already taken."""
+        # the prefix goes through the slug index, the regex leaves out the
+        # longer slugs sharing it (python-tips for python)
+        numbered = models.Q(
+            slug__startswith=slug + "-",
+            slug__regex=r"^{0}-[0-9]+$".format(re.escape(slug)),
+        )
+        return set(
+            self.__class__.objects.filter(models.Q(slug=slug) | numbered).values_list(
+                "slug", flat=True
+            )
+        )
+
     def get_similar_post(self):
-        return (
-            self.__class__.published.filter(tags__in=self.tags.all())
-            .exclude(id=self.id)
-            .distinct()
+        """Published entries sharing tags with this one, most similar first."""
+        # read from the table blog.related keeps up to date
+        return self.__class__.published.filter(similar_to__entry=self).order_by(
+            "-similar_to__score"
         )
 
+    def get_similar_by_content(self):
+        """Published entries closest to this one by their text, closest first."""
+        try:
+            neighbours = EntryVector.objects.get(pk=self.pk).get_neighbours()
+        except EntryVector.DoesNotExist:
+            return []
+        entries = self.__class__.published.cards().in_bulk(neighbours)
+        return [entries[pk] for pk in neighbours if pk in entries]
+
     def get_absolute_url(self):
         return reverse("entry_detail", kwargs={"slug": self.slug})
 
@@ -127,16 +237,16 @@ class Entry(ModelMeta, models.Model):
     def count_comments():
         return 0
 
-    def count_words_in_text(self, word_length=5):
-        total_words = 0
-        for current_text in self.body:
-            total_words += len(current_text) / word_length
-        return total_words
+    def count_words_in_text(self):
+        return body_statistics(self.body)[0]
 
     def estimate_reading_time(self):
-        words_per_min = 200  # Word per min
-        total_words = self.count_words_in_text()
-        return round(total_words / words_per_min)
+        return body_statistics(self.body)[1]
+
+    def update_statistics(self):
+        self.word_count, self.reading_time, self.code_blocks = body_statistics(
+            self.body
+        )
 
     @staticmethod
     def cleanhtml(raw_html):
@@ -144,24 +254,171 @@ class Entry(ModelMeta, models.Model):
         cleaned_string = re.sub(cleaner, "", raw_html)
         return cleaned_string
 
+    def render_body(self):
+        self.rendered_body = render_entry_body(self.body)
+        self.renderer_version = RENDERER_VERSION
+
+    def get_rendered_body(self):
+        if self.renderer_version != RENDERER_VERSION:
+            # Stale or missing render, serve a fresh one until the
+            # render_entries command (or the next save) persists it.
+            return mark_safe(render_entry_body(self.body))
+        return mark_safe(self.rendered_body)
+
     def headline(self):
-        res = self.cleanhtml(self.body)[:128]
+        return self.excerpt
 
-        try:
-            res = pygmentify_html(res, noclasses=True)
-        except (AttributeError, TypeError):
-            res = res[:128]
-        finally:
-            return mark_safe(res)
+    def body_changed(self):
+        """Whether the body was changed since the entry was loaded."""
+        if "body" in self.get_deferred_fields():
+            # never loaded, so never changed
+            return False
+        loaded = getattr(self, "_loaded_values", {})
+        return "body" not in loaded or loaded["body"] != self.body
 
     def save(self, *args, **kwargs):
         if self.is_published and self.published_date is None:
             self.published_date = timezone.now()
 
-        if self.slug in [None, ""]:
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "body" in update_fields:
+            stale = "body" not in self.get_deferred_fields() and (
+                self.renderer_version != RENDERER_VERSION
+            )
+            if self.body_changed() or stale:
+                self.render_body()
+                self.update_statistics()
+                self.excerpt = make_excerpt(self.body)
+                if update_fields is not None:
+                    kwargs["update_fields"] = set(update_fields).union(self.BODY_FIELDS)
+
+        if self.slug not in [None, ""]:
+            return super(Entry, self).save(*args, **kwargs)
+
+        for attempt in range(self.SLUG_ATTEMPTS, 0, -1):
             self.slug = self.__get_unique_slug()
+            try:
+                with transaction.atomic():
+                    return super(Entry, self).save(*args, **kwargs)
+            except IntegrityError:
+                # A concurrent save took the slug, pick the next one.
+                slug_taken = self.__class__.objects.filter(slug=self.slug).exists()
+                self.slug = None
+                if attempt == 1 or not slug_taken:
+                    raise
+
+
+class RelatedEntry(models.Model):
+    """An entry similar to entry, with its score, see blog.related."""
+
+    entry = models.ForeignKey(
+        Entry, on_delete=models.CASCADE, related_name="related_entries"
+    )
+    related = models.ForeignKey(
+        Entry, on_delete=models.CASCADE, related_name="similar_to"
+    )
+    score = models.FloatField()
+
+    class Meta:
+        verbose_name = _("Related Entry")
+        verbose_name_plural = _("Related Entries")
+        db_table = "related_entries"
+        unique_together = ("entry", "related")
+        indexes = [
+            models.Index(fields=["entry", "-score"], name="related_entries_score_idx")
+        ]
 
-        super(Entry, self).save(*args, **kwargs)
+    def __str__(self):
+        return "{0} -> {1}".format(self.entry_id, self.related_id)
+
+
+class TagFrequency(models.Model):
+    """
+    Number of published entries tagged with a tag, see blog.related.
+    Tag -1 holds the number of tagged entries.
+    """
+
+    tag = models.IntegerField(primary_key=True)
+    df = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = _("Tag Frequency")
+        verbose_name_plural = _("Tag Frequencies")
+        db_table = "tag_frequencies"
+
+    def __str__(self):
+        return "{0}: {1}".format(self.tag, self.df)
+
+
+class EntryVector(models.Model):
+    """
+    TF-IDF vector of an entry body and its nearest entries, packed as
+    uint32 term hashes / entry ids and float32 weights, see blog.tfidf.
+    """
+
+    entry = models.OneToOneField(
+        Entry, primary_key=True, on_delete=models.CASCADE, related_name="vector"
+    )
+    terms = models.BinaryField()
+    weights = models.BinaryField()
+    neighbours = models.BinaryField()
+    scores = models.BinaryField()
+
+    class Meta:
+        verbose_name = _("Entry Vector")
+        verbose_name_plural = _("Entry Vectors")
+        db_table = "entry_vectors"
+
+    def __str__(self):
+        return str(self.entry_id)
+
+    def get_neighbours(self):
+        """Ids of the nearest entries, nearest first."""
+        return array("I", bytes(self.neighbours)).tolist()
+
+
+class TermFrequency(models.Model):
+    """
+    Number of published entries using a (hashed) term, see blog.tfidf.
+    Term -1 holds the number of entries.
+    """
+
+    term = models.BigIntegerField(primary_key=True)
+    df = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = _("Term Frequency")
+        verbose_name_plural = _("Term Frequencies")
+        db_table = "term_frequencies"
+
+    def __str__(self):
+        return "{0}: {1}".format(self.term, self.df)
+
+
+class TermPosting(models.Model):
+    """
+    Weight of a (hashed) term in the vector of an entry. The heaviest
+    entries of a term are its champion list, see blog.tfidf.
+    """
+
+    term = models.BigIntegerField()
+    entry = models.ForeignKey(
+        Entry, on_delete=models.CASCADE, related_name="term_postings"
+    )
+    weight = models.FloatField()
+
+    class Meta:
+        verbose_name = _("Term Posting")
+        verbose_name_plural = _("Term Postings")
+        db_table = "term_postings"
+        indexes = [
+            models.Index(
+                fields=["term", "-weight", "-entry"], name="term_postings_weight_idx"
+            )
+        ]
+
+    def __str__(self):
+        return "{0}: {1}".format(self.term, self.entry_id)
 
 
 class Image(models.Model):
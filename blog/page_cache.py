@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from calendar import timegm
+from functools import wraps
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from blog.models import Entry
+
+
+def is_anonymous_read(request):
+    """
+    Anonymous reads without pending flash messages, their pages are the
+    same for every visitor.
+    """
+    return (
+        request.method in ("GET", "HEAD")
+        and not request.user.is_authenticated
+        and not len(get_messages(request))
+    )
+
+
+class PageCache:
+    """
+    Full page cache for anonymous reads.
+
+    Every cached page depends on a few namespaces ("site" plus e.g.
+    "entries" or "entry:<slug>") and its key is stamped with their current
+    versions. Invalidating a namespace is a single INCR of its version, the
+    pages stamped with the old one are never read again and expire on
+    their own.
+    """
+
+    def __init__(self, timeout=600, cache_alias="default"):
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @staticmethod
+    def version_key(namespace):
+        return "page_cache:version:{0}".format(namespace)
+
+    @staticmethod
+    def new_version():
+        # larger than any version handed out before an eviction
+        return int(time.time() * 1000)
+
+    def get_versions(self, namespaces):
+        keys = [self.version_key(namespace) for namespace in namespaces]
+        versions = self.cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                self.cache.add(key, self.new_version(), None)
+                versions[key] = self.cache.get(key)
+        return ".".join(str(versions[key]) for key in keys)
+
+    def make_key(self, request, namespaces):
+        url = hashlib.md5(request.build_absolute_uri().encode("utf-8")).hexdigest()
+        return "page_cache:{0}:{1}".format(url, self.get_versions(namespaces))
+
+    def invalidate(self, *namespaces):
+        for namespace in namespaces:
+            key = self.version_key(namespace)
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                # never stamped or evicted, a fresh version orphans old pages
+                self.cache.set(key, self.new_version(), None)
+
+    def is_cacheable(self, request):
+        """Only anonymous reads without pending flash messages are shared."""
+        return self.timeout > 0 and is_anonymous_read(request)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, response):
+        if (
+            response.status_code != 200
+            or response.cookies
+            or "private" in response.get("Cache-Control", "")
+        ):
+            return response
+
+        def store(response):
+            self.cache.set(key, response, self.timeout)
+
+        if hasattr(response, "render") and callable(response.render):
+            response.add_post_render_callback(store)
+        else:
+            store(response)
+        return response
+
+
+page_cache = PageCache(timeout=getattr(settings, "PAGE_CACHE_TIMEOUT", 600))
+
+
+def page_namespaces(namespaces, kwargs):
+    return ["site"] + [namespace.format(**kwargs) for namespace in namespaces]
+
+
+def anonymous_page_cache(*namespaces, on_hit=None):
+    """
+    Serve a view from the page cache to anonymous users.
+
+    namespaces are formatted with the view kwargs ("entry:{slug}"), "site"
+    is always included. on_hit(request, *args, **kwargs) is called when a
+    page is served from the cache, for work the view would have done.
+    """
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if not page_cache.is_cacheable(request):
+                return view_func(request, *args, **kwargs)
+
+            key = page_cache.make_key(request, page_namespaces(namespaces, kwargs))
+            response = page_cache.get(key)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+                if request.method == "GET":
+                    page_cache.set(key, response)
+                return response
+
+            if on_hit is not None:
+                on_hit(request, *args, **kwargs)
+            # revalidate against the validators conditional_page stored
+            return get_conditional_response(
+                request,
+                etag=response.get("ETag"),
+                last_modified=parse_http_date_safe(response.get("Last-Modified")),
+                response=response,
+            )
+
+        return _wrapped_view
+
+    return decorator
+
+
+def invalidate_pages(*namespaces):
+    """Invalidate namespaces now and again once the transaction commits."""
+    page_cache.invalidate(*namespaces)
+    if transaction.get_connection().in_atomic_block:
+        # pages rendered from the old rows until the commit are dropped too
+        transaction.on_commit(lambda: page_cache.invalidate(*namespaces))
+
+
+def invalidate_entries(entry_ids, batch_size=500):
+    """Invalidate the pages of the entries with entry_ids."""
+    entry_ids = list(entry_ids)
+    for start in range(0, len(entry_ids), batch_size):
+        slugs = Entry.objects.filter(
+            pk__in=entry_ids[start : start + batch_size]
+        ).values_list("slug", flat=True)
+        invalidate_pages(*("entry:{0}".format(slug) for slug in slugs))
+
+
+def conditional_page(state_func, *namespaces, on_not_modified=None):
+    """
+    Answer conditional GETs with 304 from validators computed without
+    rendering the page.
+
+    state_func(request, *args, **kwargs) returns (last_modified, token) for
+    the rows the page shows, or None to let the view answer (e.g. 404).
+    The ETag also covers the versions of namespaces (as in
+    anonymous_page_cache) so changes that leave modified_at alone, like
+    tags or category names, still change it. on_not_modified is called
+    like on_hit when a 304 is returned.
+
+    Only anonymous reads get validators, as in anonymous_page_cache: the
+    pages of authors (who see drafts) and of requests with pending flash
+    messages differ from the ones the validators describe.
+
+    Apply it inside anonymous_page_cache: cached pages keep the validators
+    and are revalidated without queries.
+    """
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if not is_anonymous_read(request):
+                return view_func(request, *args, **kwargs)
+
+            state = state_func(request, *args, **kwargs)
+            if state is None:
+                return view_func(request, *args, **kwargs)
+
+            modified_at, token = state
+            versions = page_cache.get_versions(page_namespaces(namespaces, kwargs))
+            # the ETag keeps the microseconds Last-Modified drops
+            etag = "{0}:{1}:{2}".format(modified_at.isoformat(), token, versions)
+            etag = quote_etag(hashlib.md5(etag.encode("utf-8")).hexdigest())
+            last_modified = timegm(modified_at.utctimetuple())
+
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is not None:
+                if on_not_modified is not None and response.status_code == 304:
+                    on_not_modified(request, *args, **kwargs)
+                return response
+
+            response = view_func(request, *args, **kwargs)
+            if response.status_code == 200:
+                response["ETag"] = etag
+                response["Last-Modified"] = http_date(last_modified)
+            return response
+
+        return _wrapped_view
+
+    return decorator
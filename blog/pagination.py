@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import base64
+import binascii
+from math import ceil
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, InvalidPage, PageNotAnInteger
+from django.db.models import Q
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import ugettext_lazy as _
+
+
+class CursorPage:
+    """A page of CursorPaginator, quacks like django.core.paginator.Page."""
+
+    def __init__(self, object_list, paginator, number, previous_page, next_page):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.number = number
+        self._previous_page = previous_page
+        self._next_page = next_page
+
+    def __repr__(self):
+        return "<CursorPage {0}>".format(self.number or "cursor")
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._next_page is not None
+
+    def has_previous(self):
+        return self._previous_page is not None
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def next_page_number(self):
+        if self._next_page is None:
+            raise EmptyPage(_("That page contains no results"))
+        return self._next_page
+
+    def previous_page_number(self):
+        if self._previous_page is None:
+            raise EmptyPage(_("That page number is less than 1"))
+        return self._previous_page
+
+
+class CursorPaginator:
+    """
+    Keyset paginator over (modified_at, id), newest first.
+
+    The first max_pages pages keep their page numbers and are read with
+    OFFSET, every page after them is addressed by an opaque cursor holding
+    the (modified_at, id) of the row it starts after (or before, going
+    back) and is read from the index without OFFSET nor COUNT(*).
+    """
+
+    field = "modified_at"
+
+    def __init__(self, object_list, per_page, max_pages=5):
+        self.object_list = object_list.order_by("-" + self.field, "-pk")
+        self.per_page = int(per_page)
+        self.max_pages = max_pages
+
+    @property
+    def count(self):
+        """Number of rows in the numbered pages, counted up to that limit."""
+        if not hasattr(self, "_count"):
+            limit = self.per_page * self.max_pages
+            self._count = self.object_list[:limit].count()
+        return self._count
+
+    @property
+    def num_pages(self):
+        return max(int(ceil(self.count / float(self.per_page))), 1)
+
+    @property
+    def page_range(self):
+        return range(1, self.num_pages + 1)
+
+    def encode_cursor(self, direction, obj):
+        value = "{0}|{1}|{2}".format(
+            direction, getattr(obj, self.field).isoformat(), obj.pk
+        )
+        return base64.urlsafe_b64encode(value.encode("utf-8")).decode("ascii")
+
+    def decode_cursor(self, cursor):
+        try:
+            value = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+            direction, position, pk = value.split("|")
+            position, pk = parse_datetime(position), int(pk)
+        except (binascii.Error, UnicodeError, ValueError):
+            raise PageNotAnInteger(_("That page is not a valid cursor"))
+        if direction not in ("next", "prev") or position is None:
+            raise PageNotAnInteger(_("That page is not a valid cursor"))
+        return direction, position, pk
+
+    def page(self, page):
+        try:
+            number = int(page)
+        except (TypeError, ValueError):
+            return self.cursor_page(*self.decode_cursor(page))
+        return self.numbered_page(number)
+
+    def numbered_page(self, number):
+        if number < 1 or number > self.max_pages:
+            raise EmptyPage(_("That page is not numbered, follow the next links"))
+
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom : bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage(_("That page contains no results"))
+
+        next_page = None
+        if len(rows) > self.per_page:
+            rows = rows[: self.per_page]
+            if number < self.max_pages:
+                next_page = number + 1
+            else:
+                next_page = self.encode_cursor("next", rows[-1])
+        previous_page = number - 1 if number > 1 else None
+        return CursorPage(rows, self, number, previous_page, next_page)
+
+    def cursor_page(self, direction, position, pk):
+        lookup = "__lt" if direction == "next" else "__gt"
+        keyset = Q(**{self.field + lookup: position}) | Q(
+            **{self.field: position, "pk" + lookup: pk}
+        )
+        rows = self.object_list.filter(keyset)
+        if direction == "prev":
+            rows = rows.reverse()
+        rows = list(rows[: self.per_page + 1])
+        if not rows:
+            raise EmptyPage(_("That page contains no results"))
+
+        more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if direction == "next":
+            previous_page = self.encode_cursor("prev", rows[0])
+            next_page = self.encode_cursor("next", rows[-1]) if more else None
+        else:
+            rows.reverse()
+            previous_page = self.encode_cursor("prev", rows[0]) if more else None
+            next_page = self.encode_cursor("next", rows[-1])
+        return CursorPage(rows, self, None, previous_page, next_page)
+
+
+class CursorPaginationMixin:
+    """
+    Paginate a ListView with CursorPaginator when settings.CURSOR_PAGINATION
+    is on, page links keep using ?page= with a number or a cursor.
+    """
+
+    def paginate_queryset(self, queryset, page_size):
+        if not getattr(settings, "CURSOR_PAGINATION", False):
+            return super(CursorPaginationMixin, self).paginate_queryset(
+                queryset, page_size
+            )
+
+        paginator = CursorPaginator(
+            queryset, page_size, getattr(settings, "CURSOR_PAGINATION_PAGES", 5)
+        )
+        page = self.request.GET.get(self.page_kwarg) or 1
+        try:
+            page = paginator.page(page)
+        except InvalidPage as e:
+            raise Http404(
+                _("Invalid page (%(page_number)s): %(message)s")
+                % {"page_number": page, "message": str(e)}
+            )
+        return (paginator, page, page.object_list, page.has_other_pages())
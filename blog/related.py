@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+import heapq
+import math
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from taggit.models import TaggedItem
+
+from blog.models import Entry, RelatedEntry, TagFrequency
+from blog.page_cache import invalidate_entries
+
+
+# TagFrequency row holding the number of tagged entries, tag ids are positive
+ENTRIES = -1
+
+
+def tagged_entries():
+    return TaggedItem.objects.filter(
+        content_type=ContentType.objects.get_for_model(Entry)
+    )
+
+
+def published_tagged_entries():
+    return tagged_entries().filter(object_id__in=Entry.published.values("pk"))
+
+
+def by_score(item):
+    return item[1], item[0]
+
+
+def get_tag_frequencies(tag_ids, batch_size=500):
+    tag_ids = list(tag_ids)
+    frequencies = {}
+    for start in range(0, len(tag_ids), batch_size):
+        frequencies.update(
+            TagFrequency.objects.filter(
+                tag__in=tag_ids[start : start + batch_size]
+            ).values_list("tag", "df")
+        )
+    return frequencies
+
+
+def save_tag_frequencies(frequencies, batch_size=500):
+    """Store the df of the tags in frequencies (tag id -> df)."""
+    tag_ids = list(frequencies)
+    with transaction.atomic():
+        for start in range(0, len(tag_ids), batch_size):
+            TagFrequency.objects.filter(
+                tag__in=tag_ids[start : start + batch_size]
+            ).delete()
+        TagFrequency.objects.bulk_create(
+            (TagFrequency(tag=tag_id, df=df) for tag_id, df in frequencies.items()),
+            batch_size=batch_size,
+        )
+
+
+class TagIndex:
+    """
+    Tag <-> published entry incidence.
+
+    Tags are weighted by their inverse entry frequency so sharing a rare
+    tag counts more than sharing a common one, and entries are compared
+    with the weighted Jaccard index of their tags. Scoring an entry only
+    walks the posting lists of its own tags (a sparse row times the
+    incidence matrix), not every other entry.
+
+    The index holds either the whole incidence or, loaded by extend, the
+    posting lists of some tags and every tag of the entries in them, the
+    other tags weighted by their stored TagFrequency.
+    """
+
+    def __init__(self, pairs, frequencies=None, total=None):
+        self.entry_tags = defaultdict(set)
+        self.tag_entries = defaultdict(set)
+        self.add(pairs)
+        if frequencies is None:
+            frequencies = {
+                tag_id: len(entry_ids) for tag_id, entry_ids in self.tag_entries.items()
+            }
+            total = len(self.entry_tags)
+            self.loaded_tags = set(self.tag_entries)
+        else:
+            self.loaded_tags = set()
+        self.frequencies = frequencies
+        self.total = max(total, 1)
+        self.weights = {}
+        self.entry_weights = {}
+
+    @classmethod
+    def load(cls, tag_ids=None):
+        """
+        Load the whole incidence with one query or, given tag_ids, only
+        the posting lists of tag_ids and the tags of the entries in them.
+        """
+        if tag_ids is None:
+            pairs = published_tagged_entries().values_list("object_id", "tag_id")
+            return cls(pairs.iterator())
+
+        total = get_tag_frequencies([ENTRIES]).get(ENTRIES)
+        if total is None:
+            total = published_tagged_entries().values("object_id").distinct().count()
+        index = cls((), {}, total)
+        index.extend(tag_ids)
+        return index
+
+    def add(self, pairs):
+        for entry_id, tag_id in pairs:
+            self.entry_tags[entry_id].add(tag_id)
+            self.tag_entries[tag_id].add(entry_id)
+
+    def extend(self, tag_ids):
+        """Load the posting lists of tag_ids and the tags of their entries."""
+        tag_ids = set(tag_ids) - self.loaded_tags
+        if not tag_ids:
+            return
+        pairs = published_tagged_entries()
+        entry_ids = pairs.filter(tag_id__in=tag_ids).values("object_id")
+        self.add(
+            pairs.filter(object_id__in=entry_ids)
+            .values_list("object_id", "tag_id")
+            .iterator()
+        )
+        self.loaded_tags.update(tag_ids)
+
+        # the posting lists loaded are exact, the others are partial
+        for tag_id in tag_ids:
+            self.frequencies[tag_id] = len(self.tag_entries[tag_id])
+        missing = [
+            tag_id for tag_id in self.tag_entries if tag_id not in self.frequencies
+        ]
+        self.frequencies.update(get_tag_frequencies(missing))
+        self.weights.clear()
+        self.entry_weights.clear()
+
+    def weight(self, tag_id):
+        try:
+            return self.weights[tag_id]
+        except KeyError:
+            # a tag counted since the last rebuild has at least its entries
+            df = max(self.frequencies.get(tag_id, 0), len(self.tag_entries[tag_id]))
+            weight = self.weights[tag_id] = math.log(1 + self.total / df)
+            return weight
+
+    def entry_weight(self, entry_id):
+        try:
+            return self.entry_weights[entry_id]
+        except KeyError:
+            weight = sum(self.weight(tag_id) for tag_id in self.entry_tags[entry_id])
+            self.entry_weights[entry_id] = weight
+            return weight
+
+    def is_complete(self, entry_id):
+        """Whether every entry sharing a tag with entry_id is loaded."""
+        return all(
+            tag_id in self.loaded_tags
+            or self.frequencies.get(tag_id, 0) <= len(self.tag_entries[tag_id])
+            for tag_id in self.entry_tags.get(entry_id, ())
+        )
+
+    def neighbours(self, tag_ids):
+        """Entries tagged with any of tag_ids."""
+        entry_ids = set()
+        for tag_id in tag_ids:
+            entry_ids.update(self.tag_entries.get(tag_id, ()))
+        return entry_ids
+
+    def score(self, entry_id, other_id):
+        """Weighted Jaccard index of the tags of entry_id and other_id."""
+        shared_tags = self.entry_tags.get(entry_id, set()) & self.entry_tags.get(
+            other_id, set()
+        )
+        if not shared_tags:
+            return 0
+        shared = sum(self.weight(tag_id) for tag_id in shared_tags)
+        own, other = self.entry_weight(entry_id), self.entry_weight(other_id)
+        return shared / (own + other - shared)
+
+    def similar(self, entry_id, count):
+        """The count (entry id, score) most similar to entry_id, best first."""
+        shared = defaultdict(float)
+        for tag_id in self.entry_tags.get(entry_id, ()):
+            weight = self.weight(tag_id)
+            for other_id in self.tag_entries[tag_id]:
+                if other_id != entry_id:
+                    shared[other_id] += weight
+
+        own = self.entry_weight(entry_id)
+        scores = (
+            (other_id, weight / (own + self.entry_weight(other_id) - weight))
+            for other_id, weight in shared.items()
+        )
+        return heapq.nlargest(count, scores, key=by_score)
+
+
+def save_related(entry_ids, similar, batch_size=500):
+    """
+    Store the similar entries of entry_ids, similar(batch, old) giving the
+    lists of a batch of entries from their stored ones, rewriting only the
+    lists that changed. Returns the ids of the entries whose list changed.
+    """
+    entry_ids = list(entry_ids)
+    changed = []
+    with transaction.atomic():
+        for start in range(0, len(entry_ids), batch_size):
+            batch = entry_ids[start : start + batch_size]
+            old = defaultdict(list)
+            rows = (
+                RelatedEntry.objects.filter(entry_id__in=batch)
+                .order_by("entry_id", "-score", "-related_id")
+                .values_list("entry_id", "related_id", "score")
+            )
+            for entry_id, related_id, score in rows:
+                old[entry_id].append((related_id, score))
+            new = similar(batch, old)
+            batch = [entry_id for entry_id in batch if new[entry_id] != old[entry_id]]
+
+            RelatedEntry.objects.filter(entry_id__in=batch).delete()
+            RelatedEntry.objects.bulk_create(
+                RelatedEntry(entry_id=entry_id, related_id=related_id, score=score)
+                for entry_id in batch
+                for related_id, score in new[entry_id]
+            )
+            changed.extend(batch)
+    return changed
+
+
+def update_related(entry_ids=(), tag_ids=(), count=None):
+    """
+    Update the similar entries of entry_ids and of every entry they share
+    a tag with, including tag_ids they were just untagged from.
+
+    Only the posting lists of those tags and the tags of the entries in
+    them are loaded, and their TagFrequency rows are counted again. The
+    lists of entry_ids are computed again, the others only rescore
+    entry_ids and are computed again (loading the posting lists of their
+    other tags if needed) when they may have lost a member. The number of
+    tagged entries is refit by rebuild_related.
+    """
+    count = count or settings.RELATED_ENTRIES_COUNT
+    entry_ids = set(entry_ids)
+
+    # drafts are not in the index but may just have been unpublished
+    tag_ids = set(tag_ids)
+    tag_ids.update(
+        tagged_entries()
+        .filter(object_id__in=entry_ids)
+        .values_list("tag_id", flat=True)
+    )
+    index = TagIndex.load(tag_ids)
+    save_tag_frequencies({tag_id: index.frequencies[tag_id] for tag_id in tag_ids})
+
+    def similar(batch, old):
+        lists, refill = {}, []
+        for entry_id in batch:
+            if entry_id in entry_ids:
+                # the posting lists of all its tags are loaded
+                lists[entry_id] = index.similar(entry_id, count)
+                continue
+
+            rescored = [
+                (other_id, index.score(entry_id, other_id)) for other_id in entry_ids
+            ]
+            merged = heapq.nlargest(
+                count,
+                [item for item in old[entry_id] if item[0] not in entry_ids]
+                + [item for item in rescored if item[1] > 0],
+                key=by_score,
+            )
+            lists[entry_id] = merged
+            # an entry not in the list may now rank in it
+            if len(merged) < count or (
+                len(old[entry_id]) == count and merged[-1][1] < old[entry_id][-1][1]
+            ):
+                refill.append(entry_id)
+
+        incomplete = [
+            entry_id for entry_id in refill if not index.is_complete(entry_id)
+        ]
+        if incomplete:
+            index.extend(
+                tag_id
+                for entry_id in incomplete
+                for tag_id in index.entry_tags[entry_id]
+            )
+        for entry_id in refill:
+            lists[entry_id] = index.similar(entry_id, count)
+        return lists
+
+    entry_ids_to_update = index.neighbours(tag_ids) | entry_ids
+    # the detail pages list the similar entries
+    invalidate_entries(save_related(entry_ids_to_update, similar))
+    return len(entry_ids_to_update)
+
+
+def rebuild_related(count=None):
+    """
+    Recompute the similar entries of every entry, and the TagFrequency
+    rows weighting the tags.
+    """
+    count = count or settings.RELATED_ENTRIES_COUNT
+    index = TagIndex.load()
+    with transaction.atomic():
+        TagFrequency.objects.all().delete()
+        TagFrequency.objects.bulk_create(
+            (
+                TagFrequency(tag=tag_id, df=df)
+                for tag_id, df in index.frequencies.items()
+            ),
+            batch_size=500,
+        )
+        TagFrequency.objects.create(tag=ENTRIES, df=len(index.entry_tags))
+
+        stale = set(
+            RelatedEntry.objects.order_by()
+            .values_list("entry_id", flat=True)
+            .distinct()
+        )
+        stale.difference_update(index.entry_tags)
+        stale = list(stale)
+        for start in range(0, len(stale), 500):
+            RelatedEntry.objects.filter(
+                entry_id__in=stale[start : start + 500]
+            ).delete()
+        changed = save_related(
+            index.entry_tags.keys(),
+            lambda batch, old: {
+                entry_id: index.similar(entry_id, count) for entry_id in batch
+            },
+        )
+    invalidate_entries(stale + changed)
+    return len(index.entry_tags)
@@ -13,4 +13,7 @@ class EntryIndex(indexes.SearchIndex, indexes.Indexable):
         return Entry
 
     def index_queryset(self, using=None):
-        return self.get_model().published.select_related("author").all()
+        # the body is indexed, its rendered html is not needed
+        return (
+            self.get_model().published.select_related("author").defer("rendered_body")
+        )
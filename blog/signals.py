@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from taggit.models import Tag
+
+from blog.models import Category, Entry, Image, RelatedEntry, TermPosting
+from blog.page_cache import invalidate_entries, invalidate_pages
+from blog.tasks import update_entry_vector, update_related_entries
+from blog.tfidf import QUERY_TERMS
+
+logger = logging.getLogger(__name__)
+
+# runs the tasks of schedule(), one at a time, when celery is disabled
+background = ThreadPoolExecutor(max_workers=1)
+
+
+@receiver(post_save, sender=Entry)
+@receiver(post_delete, sender=Entry)
+def invalidate_entry_pages(sender, instance, **kwargs):
+    invalidate_pages("entries", "entry:{0}".format(instance.slug))
+
+
+@receiver(m2m_changed, sender=Entry.tags.through)
+def invalidate_tagged_entry_pages(sender, instance, action, reverse, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse:
+        # entries changed from the tag side
+        invalidate_pages("site")
+    else:
+        invalidate_pages("entry:{0}".format(instance.slug))
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def invalidate_image_pages(sender, instance, **kwargs):
+    slug = (
+        Entry.objects.filter(pk=instance.entry_id)
+        .values_list("slug", flat=True)
+        .first()
+    )
+    if slug is not None:
+        invalidate_pages("entry:{0}".format(slug))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_site_pages(sender, **kwargs):
+    # category names and tags show up on most pages
+    invalidate_pages("site")
+
+
+@receiver(m2m_changed, sender=Entry.tags.through)
+def update_tag_names(sender, instance, action, reverse, pk_set, **kwargs):
+    # taggit gives tags no manager to change their entries, renames and
+    # deletes are handled by the Tag receivers below
+    if reverse or action not in ("post_add", "post_remove", "post_clear"):
+        return
+    instance.tag_names = Entry.update_tag_names([instance.pk])[instance.pk]
+    instance.__dict__.pop("_tag_names", None)
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_deleted_tag_entries(sender, instance, **kwargs):
+    instance._deleted_entry_ids = list(
+        Entry.objects.filter(tags=instance).values_list("pk", flat=True)
+    )
+
+
+@receiver(post_save, sender=Tag)
+def update_renamed_tag_names(sender, instance, created, raw=False, **kwargs):
+    if not (raw or created):
+        Entry.update_tag_names(
+            Entry.objects.filter(tags=instance).values_list("pk", flat=True)
+        )
+
+
+@receiver(post_delete, sender=Tag)
+def update_deleted_tag_names(sender, instance, **kwargs):
+    Entry.update_tag_names(getattr(instance, "_deleted_entry_ids", ()))
+
+
+def run_in_background(task, *args):
+    try:
+        task(*args)
+    except Exception:
+        logger.exception("Task %s failed", task.name)
+    finally:
+        # nothing closes the connections of this thread otherwise
+        connections.close_all()
+
+
+def schedule(task, *args):
+    """
+    Run task once committed, in celery or in a thread of this process when
+    celery is disabled, never in the request. TASKS_ALWAYS_EAGER runs it
+    right away instead.
+    """
+    if settings.TASKS_ALWAYS_EAGER:
+        task(*args)
+    elif settings.ENABLE_CELERY:
+        transaction.on_commit(lambda: task.delay(*args))
+    else:
+        transaction.on_commit(lambda: background.submit(run_in_background, task, *args))
+
+
+def schedule_related_update(entry_ids=(), tag_ids=()):
+    schedule(update_related_entries, list(entry_ids), list(tag_ids))
+
+
+@receiver(post_save, sender=Entry)
+def update_saved_entry_related(sender, instance, created, raw=False, **kwargs):
+    # new entries get their tags, and so their similar entries, through
+    # m2m_changed. Publishing or unpublishing adds or removes the entry
+    # from the lists of others.
+    if raw or created:
+        return
+    loaded = getattr(instance, "_loaded_values", {})
+    if loaded.get("is_published") != instance.is_published:
+        schedule_related_update([instance.pk])
+
+
+@receiver(post_save, sender=Entry)
+def update_saved_entry_vector(sender, instance, created, raw=False, **kwargs):
+    # the text of unpublished entries is never compared
+    if raw:
+        return
+    loaded = getattr(instance, "_loaded_values", {})
+    was_published = loaded.get("is_published", False)
+    if not (instance.is_published or was_published):
+        return
+    if created or was_published != instance.is_published or instance.body_changed():
+        schedule(update_entry_vector, instance.pk)
+
+
+@receiver(m2m_changed, sender=Entry.tags.through)
+def update_tagged_entry_related(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and not reverse:
+        instance._cleared_tag_ids = list(instance.tags.values_list("pk", flat=True))
+    elif action in ("post_add", "post_remove", "post_clear"):
+        if reverse:
+            schedule_related_update(pk_set or (), [instance.pk])
+        else:
+            tag_ids = pk_set or getattr(instance, "_cleared_tag_ids", ())
+            schedule_related_update([instance.pk], tag_ids)
+
+
+@receiver(pre_delete, sender=Entry)
+def remember_deleted_entry_tags(sender, instance, **kwargs):
+    instance._deleted_tag_ids = list(instance.tags.values_list("pk", flat=True))
+    # the rows go with the entry, the pages linking to it have to go too
+    instance._related_from = list(
+        RelatedEntry.objects.filter(related=instance).values_list("entry_id", flat=True)
+    )
+    # the postings are deleted with the entry, its neighbours are found
+    # through its terms
+    instance._deleted_terms = list(
+        TermPosting.objects.filter(entry=instance)
+        .order_by("-weight")
+        .values_list("term", flat=True)[:QUERY_TERMS]
+    )
+
+
+@receiver(post_delete, sender=Entry)
+def update_deleted_entry_related(sender, instance, **kwargs):
+    invalidate_entries(getattr(instance, "_related_from", ()))
+    schedule_related_update(tag_ids=getattr(instance, "_deleted_tag_ids", ()))
+    if instance.is_published:
+        # drop the entry from the neighbours of the others
+        schedule(
+            update_entry_vector, instance.pk, getattr(instance, "_deleted_terms", [])
+        )
@@ -23,7 +23,7 @@ class BlogSitemap(sitemaps.Sitemap):
     priority = 0.9
 
     def items(self):
-        return Entry.published.all().order_by("-modified_at")
+        return Entry.published.cards().order_by("-modified_at")
 
     def lastmod(self, obj):
         return obj.modified_at
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from tinyblog import celery_app
+from .counters import view_counter
+from .related import update_related
+from .tfidf import update_vector
+
+
+@celery_app.task(ignore_result=True, name="flush_entry_views")
+def flush_entry_views():
+    return view_counter.flush()
+
+
+@celery_app.task(ignore_result=True, name="update_related_entries")
+def update_related_entries(entry_ids=(), tag_ids=()):
+    return update_related(entry_ids, tag_ids)
+
+
+@celery_app.task(ignore_result=True, name="update_entry_vector")
+def update_entry_vector(entry_id, old_terms=None):
+    return update_vector(entry_id, old_terms=old_terms)
@@ -5,7 +5,7 @@ from django import template
 from django.template.defaultfilters import stringfilter
 from django.utils.safestring import mark_safe
 
-from ..utils import pygmentify_html
+from ..utils import cached_pygmentify_html
 
 register = template.Library()
 
@@ -14,7 +14,7 @@ register = template.Library()
 @stringfilter
 def pygmentify(value):
     try:
-        res = pygmentify_html(value)
+        res = cached_pygmentify_html(value)
     except Exception as e:
         print(e)
         print('value="%s"' % value)
@@ -26,7 +26,7 @@ def pygmentify(value):
 @stringfilter
 def pygmentify_inline(value):
     try:
-        res = pygmentify_html(value, noclasses=True)
+        res = cached_pygmentify_html(value, noclasses=True)
     except Exception as e:
         print(e)
         print('value="%s"' % value)
@@ -42,7 +42,7 @@ class PygmentifyNode(template.Node):
     def render(self, context):
         output = self.nodelist.render(context)
         try:
-            res = pygmentify_html(output, **self.kwargs)
+            res = cached_pygmentify_html(output, **self.kwargs)
         except Exception as e:
             print(e)
             print('value="%s"' % output)
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from functools import reduce
+from itertools import accumulate
+import os
+import random
+import re
+import sys
+import timeit
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils.encoding import smart_text
+
+from pygments import highlight
+from pygments.lexers import LEXERS, get_lexer_by_name
+
+from blog.models import Entry
+from blog.tfidf import build_index
+from blog.utils import HighlightCache, ListHtmlFormatter, block_cache, pygmentify_html
+from blog.views import EntryListView
+
+
+RUN_BENCHMARKS = os.environ.get("RUN_BENCHMARKS")
+
+BENCHMARK_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "dummy": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+}
+
+
+def cold_cache():
+    """Patch the block cache so every call highlights its blocks again."""
+    return patch("blog.utils.block_cache", HighlightCache(0, cache_alias="dummy"))
+
+
+def legacy_pygmentify_html(text, **kwargs):
+    """The original pygmentify_html, kept as the reference to measure against."""
+    text = smart_text(text)
+    lang = default_lang = "text"
+    lexers_iter = LEXERS.values()
+    lexer_names = reduce(lambda a, b: a + b[2], lexers_iter, ())
+    formatter = ListHtmlFormatter(encoding="utf-8", **kwargs)
+    subs = []
+    pre_re = re.compile(r"(<pre[^>]*>)(.*?)(</pre>)", re.DOTALL | re.UNICODE)
+    br_re = re.compile(r"<br[^>]*?>", re.UNICODE)
+    p_re = re.compile(r"<?p[^>]*>", re.UNICODE)
+    lang_re = re.compile(r'lang=["\'](.+?)["\']', re.DOTALL | re.UNICODE)
+    for pre_match in pre_re.findall(text):
+        work_area = pre_match[1]
+        work_area = br_re.sub("\n", work_area)
+        match = lang_re.search(pre_match[0])
+        if match:
+            lang = match.group(1).strip()
+            if lang not in lexer_names:
+                lang = default_lang
+        lexer = get_lexer_by_name(lang, stripall=True)
+        work_area = (
+            work_area.replace("&nbsp;", " ")
+            .replace("&amp;", "&")
+            .replace("&lt;", "<")
+            .replace("&gt;", ">")
+            .replace("&quot;", '"')
+            .replace("&#39;", "'")
+        )
+        work_area = p_re.sub("", work_area)
+        work_area = highlight(work_area, lexer, formatter)
+        subs.append(["".join(pre_match), smart_text(work_area)])
+    for sub in subs:
+        text = text.replace(sub[0], sub[1], 1)
+    return text
+
+
+def make_body(code_blocks, size=0):
+    """
+    Build an entry body with code_blocks <pre> blocks, padded with paragraphs
+    spread between the blocks to at least size chars.
+    """
+    filler = "<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>"
+    block = '<pre lang="python">def f{0}(x):<br>    return x &lt; {0}</pre>'
+    sections = max(code_blocks, 1)
+    padding = filler * max(size // sections // len(filler), 1)
+    body = "".join(
+        "<p>Paragraph {0}</p>{1}{2}".format(
+            index, padding, block.format(index) if index < code_blocks else ""
+        )
+        for index in range(sections)
+    )
+    return body
+
+
+def report(title, rows, unit="ms"):
+    sys.stderr.write("\n{0}\n".format(title))
+    for label, value in rows:
+        sys.stderr.write("  {0:<28} {1:>12.3f} {2}\n".format(label, value, unit))
+
+
+@override_settings(CACHES=BENCHMARK_CACHES)
+class PygmentifyEquivalenceTestCase(SimpleTestCase):
+    """The single pass pygmentify_html renders exactly like the original."""
+
+    def setUp(self):
+        block_cache.clear()
+
+    def assertSameOutput(self, text, **kwargs):
+        self.assertEqual(
+            pygmentify_html(text, **kwargs), legacy_pygmentify_html(text, **kwargs)
+        )
+
+    def test_no_code(self):
+        self.assertSameOutput("<p>No code &amp; no pre here.</p>")
+
+    def test_generated_bodies(self):
+        for code_blocks in (1, 20):
+            self.assertSameOutput(make_body(code_blocks, 2000))
+            self.assertSameOutput(make_body(code_blocks, 2000), noclasses=True)
+
+    def test_lang_carries_over(self):
+        # blocks without a lang reuse the previous block's lang.
+        self.assertSameOutput(
+            '<pre lang="python">x = 1</pre><p>a</p><pre>y = 2</pre>'
+            "<pre lang='nope'>z = 3</pre><pre>w = 4</pre>"
+        )
+
+    def test_duplicate_blocks(self):
+        self.assertSameOutput(
+            '<pre lang="js">var a;</pre><pre lang="python">var a;</pre>'
+            '<pre lang="js">var a;</pre>'
+        )
+
+    def test_entities_and_markup(self):
+        self.assertSameOutput(
+            '<pre lang="html"><p>&lt;a href=&quot;#&quot;&gt;&amp;nbsp;'
+            "&#39;x&#39;&lt;/a&gt;</p><br/><br /></pre>"
+        )
+
+
+@skipUnless(RUN_BENCHMARKS, "set RUN_BENCHMARKS=1 to run benchmarks")
+@override_settings(CACHES=BENCHMARK_CACHES)
+class PygmentifyOverheadBenchmark(SimpleTestCase):
+    """Per call overhead of pygmentify_html, RUN_BENCHMARKS=1 to run."""
+
+    def timeit(self, func, body, number):
+        return min(timeit.repeat(lambda: func(body), number=number, repeat=3))
+
+    def test_per_call_overhead(self):
+        rows = []
+        for code_blocks, number in ((0, 200), (50, 5)):
+            body = make_body(code_blocks)
+            with cold_cache():
+                self.assertEqual(pygmentify_html(body), legacy_pygmentify_html(body))
+
+                legacy = self.timeit(legacy_pygmentify_html, body, number) / number
+                current = self.timeit(pygmentify_html, body, number) / number
+            rows.append(("legacy, {0} blocks".format(code_blocks), legacy * 1000))
+            rows.append(("current, {0} blocks".format(code_blocks), current * 1000))
+        report("pygmentify_html per call", rows)
+
+    def test_edit_prose_around_code(self):
+        body = make_body(50)
+        edited = body.replace("Paragraph 7", "Paragraph seven")
+
+        with cold_cache():
+            cold = self.timeit(pygmentify_html, edited, 5) / 5
+
+        # Warm the block cache with the original body, then render the edit.
+        pygmentify_html(body)
+        warm = self.timeit(pygmentify_html, edited, 5) / 5
+
+        report(
+            "re-render after editing prose, 50 blocks",
+            [("cold block cache", cold * 1000), ("warm block cache", warm * 1000)],
+        )
+
+    def test_single_pass_substitution(self):
+        rows = []
+        for size in (10 * 1024, 100 * 1024, 1024 * 1024):
+            for code_blocks in (1, 20, 200):
+                body = make_body(code_blocks, size)
+                with cold_cache():
+                    legacy = self.timeit(legacy_pygmentify_html, body, 1)
+                    current = self.timeit(pygmentify_html, body, 1)
+                label = "{0} KB, {1} blocks".format(size // 1024, code_blocks)
+                rows.append(("legacy, " + label, legacy * 1000))
+                rows.append(("current, " + label, current * 1000))
+        report("findall + replace vs single pass sub", rows)
+
+
+def fetched_bytes(queryset):
+    """Size of the column values the database returns for queryset."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return sum(
+            len(str(value).encode("utf-8"))
+            for row in cursor.fetchall()
+            for value in row
+            if value is not None
+        )
+
+
+@skipUnless(RUN_BENCHMARKS, "set RUN_BENCHMARKS=1 to run benchmarks")
+@override_settings(CACHES=BENCHMARK_CACHES)
+class ListQuerySetBenchmark(TestCase):
+    """Bytes fetched per list page for large posts, RUN_BENCHMARKS=1 to run."""
+
+    def setUp(self):
+        author = get_user_model().objects.create(username="iamatest")
+        for index in range(EntryListView.paginate_by):
+            Entry.objects.create(
+                title="Large post {0}".format(index),
+                body=make_body(20, 100 * 1024),
+                author=author,
+                is_published=True,
+            )
+
+    def test_bytes_per_page(self):
+        page = slice(0, EntryListView.paginate_by)
+        full = Entry.published.select_related("category").order_by("-modified_at")
+        cards = EntryListView().get_queryset()
+
+        report(
+            "fetched per list page, 100 KB posts",
+            [
+                ("all columns", fetched_bytes(full[page]) / 1024.0),
+                ("cards()", fetched_bytes(cards[page]) / 1024.0),
+            ],
+            unit="KB",
+        )
+
+
+def zipf_corpus(documents, words=150, vocabulary=20000, seed=0):
+    """A callable yielding documents of words drawn with a Zipf distribution."""
+    terms = [
+        "term" + "".join(chr(97 + int(d)) for d in str(rank))
+        for rank in range(vocabulary)
+    ]
+    weights = list(accumulate(1.0 / rank for rank in range(1, vocabulary + 1)))
+
+    def corpus():
+        rng = random.Random(seed)
+        for pk in range(documents):
+            yield pk, " ".join(rng.choices(terms, cum_weights=weights, k=words))
+
+    return corpus
+
+
+@skipUnless(RUN_BENCHMARKS, "set RUN_BENCHMARKS=1 to run benchmarks")
+class TfidfIndexBenchmark(SimpleTestCase):
+    """build_index on synthetic Zipf corpora, RUN_BENCHMARKS=1 to run."""
+
+    def test_build_index(self):
+        rows = []
+        for documents in (10000, 100000):
+            corpus = zipf_corpus(documents)
+            started = timeit.default_timer()
+            __, vectors, neighbours = build_index(corpus, 5)
+            elapsed = timeit.default_timer() - started
+            self.assertEqual(len(neighbours), documents)
+            rows.append(("{0} documents".format(documents), elapsed * 1000))
+            rows.append(("  per document", elapsed * 1000 / documents))
+        report("TF-IDF index build, 150 words", rows)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from blog.counters import ViewCounter, view_counter
+from blog.models import Entry
+from blog.tasks import flush_entry_views
+
+
+class ViewCounterTestCase(TestCase):
+    def tearDown(self):
+        from django_redis import get_redis_connection
+
+        get_redis_connection("default").flushall()
+
+    def setUp(self):
+        author = get_user_model().objects.create(username="iamatest")
+        self.entries = [
+            Entry.objects.create(
+                title="Test blog Title {0}".format(index),
+                body="This is my test blog",
+                author=author,
+                is_published=True,
+            )
+            for index in range(2)
+        ]
+        self.views = [entry.views for entry in self.entries]
+
+    def get_views(self):
+        return [Entry.objects.get(pk=entry.pk).views for entry in self.entries]
+
+    def test_sync(self):
+        self.client.get(self.entries[0].get_absolute_url())
+        self.assertEqual(self.get_views(), [self.views[0] + 1, self.views[1]])
+
+    @override_settings(ENTRY_VIEWS_MODE="buffered")
+    def test_buffered(self):
+        for __ in range(3):
+            self.client.get(self.entries[0].get_absolute_url())
+        self.client.get(self.entries[1].get_absolute_url())
+
+        # Nothing is written until the views are flushed.
+        self.assertEqual(self.get_views(), self.views)
+
+        self.assertEqual(flush_entry_views(), 4)
+        self.assertEqual(self.get_views(), [self.views[0] + 3, self.views[1] + 1])
+
+        # The flushed views are not counted twice.
+        self.assertEqual(view_counter.flush(), 0)
+        self.assertEqual(self.get_views(), [self.views[0] + 3, self.views[1] + 1])
+
+    def test_local_fallback(self):
+        counter = ViewCounter(flush_interval=3600)
+
+        with patch.object(counter, "get_connection", return_value=None):
+            counter.incr(self.entries[0].slug)
+            counter.incr(self.entries[0].slug)
+            self.assertEqual(self.get_views(), self.views)
+
+            # Views kept in process are written once the interval is over.
+            counter.flush_interval = 0
+            counter.incr(self.entries[1].slug)
+
+        self.assertEqual(self.get_views(), [self.views[0] + 2, self.views[1] + 1])
+
+    @override_settings(ENTRY_VIEWS_MODE="buffered")
+    def test_recover_failed_flush(self):
+        from django_redis import get_redis_connection
+
+        connection = get_redis_connection("default")
+        for __ in range(2):
+            self.client.get(self.entries[0].get_absolute_url())
+
+        with patch.object(ViewCounter, "drain", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                view_counter.flush()
+        self.client.get(self.entries[1].get_absolute_url())
+
+        # The hash of the failed flush is left until it is old enough.
+        self.assertEqual(flush_entry_views(), 1)
+        self.assertEqual(self.get_views(), [self.views[0], self.views[1] + 1])
+
+        with patch.object(view_counter, "recover_after", 0):
+            # leftovers are found through the registered keys, not by a scan
+            with patch.object(connection, "scan_iter") as scan_iter:
+                self.assertEqual(flush_entry_views(), 2)
+            self.assertFalse(scan_iter.called)
+        self.assertEqual(self.get_views(), [self.views[0] + 2, self.views[1] + 1])
+        self.assertEqual(flush_entry_views(), 0)
+        self.assertEqual(connection.zcard(view_counter.flushing_keys), 0)
+
+    def test_task_flushes_local(self):
+        with patch.object(view_counter, "get_connection", return_value=None):
+            view_counter.incr(self.entries[0].slug)
+            self.assertEqual(self.get_views(), self.views)
+
+            self.assertEqual(flush_entry_views(), 1)
+        self.assertEqual(self.get_views(), [self.views[0] + 1, self.views[1]])
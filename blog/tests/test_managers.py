@@ -1,11 +1,30 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from unittest import skipUnless
+
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import connection, models
 from django.db.models.query import QuerySet
 from django.test import TestCase
 from ..models import Entry
+from ..views import EntryListView
+
+
+def explain(queryset):
+    """The query plan of queryset as text, on SQLite or PostgreSQL."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            # tiny test tables are cheaper to scan, ask for the index anyway
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("EXPLAIN " + sql, params)
+        else:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return "\n".join(" ".join(str(value) for value in row) for row in cursor)
+
+
+EXPLAIN_VENDORS = ("sqlite", "postgresql")
 
 
 class PublishedEntryQuerySetTestCase(TestCase):
@@ -52,3 +71,41 @@ class PublishedEntryQuerySetTestCase(TestCase):
         self.assertTrue(
             Entry.published.all().values("is_published").distinct()[0]["is_published"]
         )
+
+    def test_cards(self):
+        entry = Entry.published.cards().order_by("-modified_at")[0]
+
+        # The large text columns are left out, card columns are loaded.
+        self.assertEqual(
+            entry.get_deferred_fields(),
+            {"body", "rendered_body", "renderer_version", "tag_names"},
+        )
+        with self.assertNumQueries(0):
+            entry.title, entry.excerpt, entry.reading_time, entry.author.username
+
+
+@skipUnless(connection.vendor in EXPLAIN_VENDORS, "EXPLAIN output is vendor specific")
+class EntryIndexTestCase(TestCase):
+    def tearDown(self):
+        from django_redis import get_redis_connection
+
+        get_redis_connection("default").flushall()
+
+    def setUp(self):
+        self.author = get_user_model().objects.create(username="iamatest")
+
+    def assertUsesIndex(self, queryset, name):
+        self.assertIn(name, explain(queryset))
+
+    def test_published(self):
+        self.assertUsesIndex(
+            EntryListView().get_queryset()[:12], "entries_published_idx"
+        )
+
+    def test_published_in_category(self):
+        queryset = Entry.published.filter(category__pk=1).order_by("-modified_at")
+        self.assertUsesIndex(queryset[:12], "entries_category_pub_idx")
+
+    def test_author(self):
+        queryset = Entry.objects.filter(author=self.author).order_by("-modified_at")
+        self.assertUsesIndex(queryset[:12], "entries_author_idx")
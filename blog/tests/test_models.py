@@ -1,15 +1,22 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from itertools import product
 import tempfile
+from unittest.mock import patch
 
+from django.apps import apps
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.db import IntegrityError
+from django.db import IntegrityError, connection
 from django.test import TestCase
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
 
+from taggit.models import Tag
+
+from ..managers import PublishedEntryQuerySet
 from ..models import Category, Entry, Image
+from ..utils import RENDERER_VERSION
 
 
 class CategoryModelTestCase(TestCase):
@@ -94,11 +101,203 @@ class BlogModelTestCase(TestCase):
         self.assertFalse(" " in slug)
         self.assertTrue("-" in slug)
 
+    def test_unique_slug_suffix(self):
+        titles = ["Same title", "Same title!", "Same title?", "same title."]
+        entries = [
+            Entry.objects.create(title=title, body=self.blog_body, author=self.author)
+            for title in titles
+        ]
+        self.assertEqual(
+            [entry.slug for entry in entries],
+            ["same-title", "same-title-1", "same-title-2", "same-title-3"],
+        )
+
+    def test_unique_slug_prefix(self):
+        for title in ["Python tips", "Python", "Python 1", "Python 1 tips"]:
+            Entry.objects.create(title=title, body=self.blog_body, author=self.author)
+
+        # the longer slugs sharing the prefix are not loaded
+        entry = Entry(title="Python!", body=self.blog_body, author=self.author)
+        self.assertEqual(entry._Entry__taken_slugs("python"), {"python", "python-1"})
+
+        entry.save()
+        self.assertEqual(entry.slug, "python-2")
+
+    def test_unique_slug_empty(self):
+        entries = [
+            Entry.objects.create(title=title, body=self.blog_body, author=self.author)
+            for title in ["???", "Здравствуй"]
+        ]
+        self.assertEqual([entry.slug for entry in entries], ["entry", "entry-1"])
+
+    def test_unique_slug_query_count(self):
+        # 1,000 distinct titles that all slugify to "same-title".
+        titles = [
+            "Same title " + "".join(chars) for chars in product("!?.,;:", repeat=4)
+        ][:1000]
+
+        # Skip search indexing, this is about the database queries.
+        signal_processor = apps.get_app_config("haystack").signal_processor
+        signal_processor.teardown()
+        self.addCleanup(signal_processor.setup)
+
+        with CaptureQueriesContext(connection) as queries:
+            for title in titles:
+                Entry(title=title, body=self.blog_body, author=self.author).save()
+
+        # A slug query, the insert and its savepoint, not a query per collision.
+        self.assertLessEqual(len(queries), 4 * len(titles))
+        self.assertTrue(Entry.objects.filter(slug="same-title-999").exists())
+
+    def test_unique_slug_race(self):
+        Entry.objects.create(title="Race", body=self.blog_body, author=self.author)
+        entry = Entry(title="Race!", body=self.blog_body, author=self.author)
+
+        # Simulate a concurrent save taking "race" after it was picked.
+        with patch.object(
+            Entry, "_Entry__get_unique_slug", side_effect=["race", "race-1"]
+        ):
+            entry.save()
+
+        self.assertEqual(entry.slug, "race-1")
+
     def test_as_json(self):
         entry = self.get_entry()[0]
         self.assertTrue(hasattr(entry, "as_json"))
         self.assertIsInstance(entry.as_json(), dict)
 
+    def test_rendered_body_on_save(self):
+        entry = Entry(
+            title=self.blog_title,
+            body='<pre lang="python">print("hi")</pre>',
+            author=self.author,
+        )
+        entry.save()
+        entry.refresh_from_db()
+
+        self.assertEqual(entry.renderer_version, RENDERER_VERSION)
+        self.assertIn('<div class="highlight"', entry.rendered_body)
+        self.assertEqual(entry.get_rendered_body(), entry.rendered_body)
+
+    def test_statistics_on_save(self):
+        body = "<p>One two&nbsp;three</p>" + "<p>word</p>" * 397
+        body += '<pre lang="python">x = 1</pre><pre>y = 2</pre>'
+        entry = Entry(title=self.blog_title, body=body, author=self.author)
+        entry.save()
+        entry.refresh_from_db()
+
+        self.assertEqual(entry.word_count, 400)
+        self.assertEqual(entry.reading_time, 2)
+        self.assertEqual(entry.code_blocks, 2)
+        self.assertEqual(entry.count_words_in_text(), entry.word_count)
+        self.assertEqual(entry.estimate_reading_time(), entry.reading_time)
+
+    def test_statistics_of_prose(self):
+        code = "\n".join(
+            "value_{0} = compute({0}, other)".format(n) for n in range(300)
+        )
+        body = '<p class="intro"\n   id="first">Only these four words</p>'
+        body += '<pre lang="python">{0}</pre>'.format(code)
+        entry = Entry(title=self.blog_title, body=body, author=self.author)
+        entry.update_statistics()
+
+        # the tag spanning lines and the code block are not counted
+        self.assertEqual(entry.word_count, 4)
+        self.assertEqual(entry.reading_time, 1)
+        self.assertEqual(entry.code_blocks, 1)
+
+    def test_excerpt_on_save(self):
+        body = "<p>Compare <code>a &lt; b</code></p>\n<p>" + "word " * 100 + "</p>"
+        entry = Entry(title=self.blog_title, body=body, author=self.author)
+        entry.save()
+        entry.refresh_from_db()
+
+        self.assertTrue(entry.excerpt.startswith("Compare a < b word word"))
+        self.assertLessEqual(len(entry.excerpt), 128)
+        self.assertEqual(entry.headline(), entry.excerpt)
+
+    def test_get_rendered_body_stale(self):
+        entry = self.get_entry()[0]
+        Entry.objects.filter(pk=entry.pk).update(
+            rendered_body="stale", renderer_version="0-pygments-0"
+        )
+        entry.refresh_from_db()
+        self.assertEqual(entry.get_rendered_body(), self.blog_body)
+
+    def test_body_work_skipped(self):
+        pk = self.get_entry()[0].pk
+
+        with patch("blog.models.render_entry_body") as render_entry_body:
+            entry = Entry.objects.get(pk=pk)
+            entry.views += 1
+            entry.save(update_fields=["views"])
+            entry.title = "Another title"
+            entry.save()
+
+            # the body of a card is not loaded to be saved (search indexing,
+            # which reads it, is left out)
+            signal_processor = apps.get_app_config("haystack").signal_processor
+            signal_processor.teardown()
+            self.addCleanup(signal_processor.setup)
+            card = Entry.objects.only(*PublishedEntryQuerySet.CARD_FIELDS).get(pk=pk)
+            with self.assertNumQueries(1):
+                card.save()
+            self.assertIn("body", card.get_deferred_fields())
+        self.assertFalse(render_entry_body.called)
+
+        entry.body = "<p>A new body</p>"
+        entry.save(update_fields=["body"])
+        entry = Entry.objects.get(pk=pk)
+        self.assertEqual(entry.excerpt, "A new body")
+        self.assertEqual(entry.word_count, 3)
+        self.assertIn("A new body", entry.rendered_body)
+
+    def test_stale_render_on_save(self):
+        pk = self.get_entry()[0].pk
+        Entry.objects.filter(pk=pk).update(
+            rendered_body="stale", renderer_version="0-pygments-0"
+        )
+        entry = Entry.objects.get(pk=pk)
+        entry.save()
+        entry.refresh_from_db()
+        self.assertEqual(entry.renderer_version, RENDERER_VERSION)
+        self.assertEqual(entry.rendered_body, self.blog_body)
+
+    def tag_names(self, entry):
+        return Entry.objects.get(pk=entry.pk).get_tag_names()
+
+    def test_tag_names(self):
+        entry = self.get_entry()[0]
+        self.assertEqual(entry.get_tag_names(), [])
+
+        entry.tags.add("python", "django")
+        self.assertEqual(entry.get_tag_names(), ["django", "python"])
+        self.assertEqual(self.tag_names(entry), ["django", "python"])
+
+        entry.tags.remove("python")
+        self.assertEqual(self.tag_names(entry), ["django"])
+        entry.tags.clear()
+        self.assertEqual(self.tag_names(entry), [])
+
+    def test_tag_names_from_tag_side(self):
+        entry = self.get_entry()[0]
+        entry.tags.add("python", "django")
+        tag = Tag.objects.get(name="python")
+
+        tag.name = "python3"
+        tag.save()
+        self.assertEqual(self.tag_names(entry), ["django", "python3"])
+
+        Tag.objects.get(name="django").delete()
+        self.assertEqual(self.tag_names(entry), ["python3"])
+
+    def test_meta_tags_without_queries(self):
+        entry = self.get_entry()[0]
+        entry.tags.add("python", "django")
+        entry = Entry.objects.get(pk=entry.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(entry.get_meta_tags(), ["Django", "Python"])
+
 
 @override_settings(MEDIA_ROOT=tempfile.gettempdir())
 class ImageModelTestCase(TestCase):
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from blog.models import Category, Entry
+from blog.page_cache import page_cache
+
+
+class PageCacheTestCase(TestCase):
+    def tearDown(self):
+        from django_redis import get_redis_connection
+
+        get_redis_connection("default").flushall()
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="iamatest", password="password"
+        )
+        self.category = Category.objects.create(name="Python")
+        self.entry = Entry.objects.create(
+            title="Test blog Title",
+            body="This is my test blog",
+            author=self.user,
+            category=self.category,
+            is_published=True,
+        )
+        self.urls = [
+            reverse("index"),
+            reverse("entry_list"),
+            reverse("post-in-category", kwargs={"pk": self.category.pk}),
+            self.entry.get_absolute_url(),
+            reverse("django.contrib.sitemaps.views.sitemap"),
+        ]
+
+    def assertCached(self, url):
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).content, response.content)
+
+    def test_anonymous_pages_cached(self):
+        with override_settings(ENTRY_VIEWS_MODE="buffered"):
+            for url in self.urls:
+                self.assertCached(url)
+
+    def test_cached_detail_counts_views(self):
+        views = self.entry.views
+        for __ in range(3):
+            self.client.get(self.entry.get_absolute_url())
+        self.assertEqual(Entry.objects.get(pk=self.entry.pk).views, views + 3)
+
+    def test_entry_save_invalidates(self):
+        for url in self.urls:
+            self.client.get(url)
+
+        self.entry.title = "A new title"
+        self.entry.save()
+
+        # the sitemap only lists urls, it is checked by test_unpublish_removes_from_cache
+        for url in self.urls[:-1]:
+            self.assertContains(self.client.get(url), "A new title")
+
+    def test_tags_invalidate_detail(self):
+        url = self.entry.get_absolute_url()
+        self.client.get(url)
+        self.entry.tags.add("caching")
+        self.assertContains(self.client.get(url), '<div class="tag">caching</div>')
+
+    def test_category_invalidates(self):
+        url = reverse("post-in-category", kwargs={"pk": self.category.pk})
+        self.client.get(url)
+        self.category.name = "Django"
+        self.category.save()
+        self.assertContains(self.client.get(url), "Category(Django)")
+
+    def test_unpublish_removes_from_cache(self):
+        url = self.entry.get_absolute_url()
+        sitemap_url = self.urls[-1]
+        self.assertContains(self.client.get(sitemap_url), url)
+        self.client.get(url)
+
+        self.entry.is_published = False
+        self.entry.save()
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertNotContains(self.client.get(sitemap_url), url)
+
+    def test_authenticated_bypass(self):
+        self.client.login(username="iamatest", password="password")
+        url = reverse("entry_list")
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertTrue(queries.captured_queries)
+
+    def test_not_found_not_cached(self):
+        url = reverse("entry_detail", kwargs={"slug": "missing"})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        # the validators lookup and the view's own
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_invalidate_unknown_namespace(self):
+        page_cache.invalidate("never-stamped")
+        version = page_cache.get_versions(["never-stamped"])
+        page_cache.invalidate("never-stamped")
+        self.assertEqual(
+            page_cache.get_versions(["never-stamped"]), str(int(version) + 1)
+        )
+
+
+class ConditionalGetTestCase(TestCase):
+    def tearDown(self):
+        from django_redis import get_redis_connection
+
+        get_redis_connection("default").flushall()
+
+    def setUp(self):
+        user = get_user_model().objects.create(username="iamatest")
+        self.entry = Entry.objects.create(
+            title="Test blog Title",
+            body="This is my test blog",
+            author=user,
+            is_published=True,
+        )
+        self.urls = [
+            reverse("entry_list"),
+            self.entry.get_absolute_url(),
+            reverse("django.contrib.sitemaps.views.sitemap"),
+        ]
+
+    def test_validators(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertTrue(response.has_header("ETag"))
+            self.assertTrue(response.has_header("Last-Modified"))
+
+    @override_settings(ENTRY_VIEWS_MODE="buffered")
+    def test_not_modified(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            # served from the page cache
+            with self.assertNumQueries(0):
+                not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(not_modified.content, b"")
+
+            not_modified = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+            )
+            self.assertEqual(not_modified.status_code, 304)
+
+    @override_settings(ENTRY_VIEWS_MODE="buffered")
+    def test_not_modified_uncached(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            with patch.object(page_cache, "timeout", 0):
+                # only the validators are looked up
+                with self.assertNumQueries(1):
+                    not_modified = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response["ETag"]
+                    )
+            self.assertEqual(not_modified.status_code, 304)
+
+    def test_modified(self):
+        etags = [self.client.get(url)["ETag"] for url in self.urls]
+        self.entry.save()
+        for url, etag in zip(self.urls, etags):
+            self.assertEqual(
+                self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200
+            )
+
+    def test_tags_change_etag(self):
+        url = self.entry.get_absolute_url()
+        etag = self.client.get(url)["ETag"]
+        self.entry.tags.add("caching")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_unpublished_entry_leaves_list(self):
+        Entry.objects.create(
+            title="Another title",
+            body="Another test blog",
+            author=self.entry.author,
+            is_published=True,
+        )
+        etag = self.client.get(self.urls[0])["ETag"]
+        # deleting an older entry leaves the latest modified_at alone
+        self.entry.delete()
+        response = self.client.get(self.urls[0], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_authenticated_and_messages_not_validated(self):
+        url = self.entry.get_absolute_url()
+        etag = self.client.get(url)["ETag"]
+
+        self.entry.author.set_password("password")
+        self.entry.author.save()
+        self.client.login(username="iamatest", password="password")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("ETag"))
+        self.client.logout()
+
+        # a pending flash message is rendered by the page
+        etag = self.client.get(url)["ETag"]
+        with patch("blog.page_cache.get_messages", return_value=["Saved"]):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("ETag"))
+
+    def test_not_modified_counts_view(self):
+        url = self.entry.get_absolute_url()
+        etag = self.client.get(url)["ETag"]
+        self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(
+            Entry.objects.get(pk=self.entry.pk).views, self.entry.views + 2
+        )
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.paginator import InvalidPage
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from blog.models import Entry
+from blog.pagination import CursorPaginator
+
+
+class CursorPaginatorTestCase(TestCase):
+    def tearDown(self):
+        from django_redis import get_redis_connection
+
+        get_redis_connection("default").flushall()
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="iamatest", password="password"
+        )
+        now = timezone.now()
+        for index in range(25):
+            entry = Entry.objects.create(
+                title="Test blog Title {0}".format(index),
+                body="This is my test blog",
+                author=self.user,
+                is_published=True,
+            )
+            # every third entry shares its modified_at with the previous one
+            Entry.objects.filter(pk=entry.pk).update(
+                modified_at=now - timedelta(minutes=index - index % 3 // 2)
+            )
+        self.expected = list(
+            Entry.published.order_by("-modified_at", "-pk").values_list("pk", flat=True)
+        )
+
+    def paginator(self):
+        return CursorPaginator(Entry.published.all(), 4, max_pages=2)
+
+    def walk(self, paginator, page, step):
+        pks = []
+        while True:
+            rows = [entry.pk for entry in page]
+            pks = pks + rows if step == "next" else rows + pks
+            if not getattr(page, "has_" + step)():
+                return pks
+            page = paginator.page(getattr(page, step + "_page_number")())
+
+    def test_forward_and_back(self):
+        paginator = self.paginator()
+        self.assertEqual(self.walk(paginator, paginator.page(1), "next"), self.expected)
+
+        last = paginator.page(1)
+        while last.has_next():
+            last = paginator.page(last.next_page_number())
+        self.assertEqual(self.walk(paginator, last, "previous"), self.expected)
+
+    def test_numbered_pages(self):
+        paginator = self.paginator()
+        self.assertEqual(paginator.page(1).next_page_number(), 2)
+        self.assertNotIsInstance(paginator.page(2).next_page_number(), int)
+        self.assertEqual(list(paginator.page_range), [1, 2])
+        with self.assertRaises(InvalidPage):
+            paginator.page(3)
+
+    def test_cursor_page_query(self):
+        paginator = self.paginator()
+        cursor = paginator.page(2).next_page_number()
+        with CaptureQueriesContext(connection) as queries:
+            page = paginator.page(cursor)
+        self.assertEqual(len(queries.captured_queries), 1)
+        sql = queries.captured_queries[0]["sql"]
+        self.assertNotIn("OFFSET", sql)
+        self.assertNotIn("COUNT", sql)
+        self.assertEqual([entry.pk for entry in page], self.expected[8:12])
+
+    def test_invalid_cursor(self):
+        for cursor in ("nope", "bmV4dHxub3BlfDE=", "-1"):
+            with self.assertRaises(InvalidPage):
+                self.paginator().page(cursor)
+
+    @override_settings(CURSOR_PAGINATION=True, CURSOR_PAGINATION_PAGES=2)
+    def test_views(self):
+        self.client.login(username="iamatest", password="password")
+        for url in (reverse("entry_list"), reverse("dashboard-entries")):
+            response = self.client.get(url, {"page": 2})
+            cursor = response.context["page_obj"].next_page_number()
+            self.assertContains(response, "?page={0}".format(cursor))
+
+            response = self.client.get(url, {"page": cursor})
+            self.assertEqual(
+                [entry.pk for entry in response.context["entries"]],
+                self.expected[24:36],
+            )
+            self.assertEqual(self.client.get(url, {"page": 3}).status_code, 404)
+            self.assertEqual(self.client.get(url, {"page": "nope"}).status_code, 404)
+
+    @override_settings(CURSOR_PAGINATION=True, CURSOR_PAGINATION_PAGES=2)
+    def test_conditional_get(self):
+        url = reverse("entry_list")
+        with CaptureQueriesContext(connection) as queries:
+            etag = self.client.get(url, {"page": 2})["ETag"]
+        # the validators are read without counting the entries
+        state = [
+            query["sql"] for query in queries.captured_queries if "MAX(" in query["sql"]
+        ]
+        self.assertEqual(len(state), 1)
+        self.assertNotIn("COUNT", state[0])
+
+        response = self.client.get(url, {"page": 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Entry.objects.get(pk=self.expected[-1]).delete()
+        response = self.client.get(url, {"page": 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_disabled(self):
+        response = self.client.get(reverse("entry_list"), {"page": 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["paginator"].count, 25)
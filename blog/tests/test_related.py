@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+
+from blog.models import Entry, RelatedEntry
+from blog.page_cache import page_cache
+from blog.related import TagIndex, update_related
+
+
+class TagIndexTestCase(TestCase):
+    def test_weighted_jaccard(self):
+        common, rare = 1, 2
+        index = TagIndex([(1, common), (1, rare), (2, common), (3, rare), (4, common)])
+
+        # sharing the rare tag counts more than sharing the common one
+        similar = index.similar(1, 3)
+        self.assertEqual([entry_id for entry_id, __ in similar], [3, 4, 2])
+        self.assertGreater(similar[0][1], similar[1][1])
+        self.assertEqual(similar[1][1], similar[2][1])
+
+        self.assertAlmostEqual(index.similar(2, 1)[0][1], 1.0)
+        self.assertEqual(index.similar(5, 3), [])
+
+
+@override_settings(TASKS_ALWAYS_EAGER=True)
+class RelatedEntryTestCase(TestCase):
+    def tearDown(self):
+        from django_redis import get_redis_connection
+
+        get_redis_connection("default").flushall()
+
+    def setUp(self):
+        self.author = get_user_model().objects.create(username="iamatest")
+        self.entries = {}
+        for name, tags in (
+            ("a", ["python", "django"]),
+            ("b", ["python", "django", "web"]),
+            ("c", ["python"]),
+            ("d", ["cooking"]),
+        ):
+            entry = Entry.objects.create(
+                title="Test blog Title {0}".format(name),
+                body="This is my test blog",
+                author=self.author,
+                is_published=True,
+            )
+            entry.tags.add(*tags)
+            self.entries[name] = entry
+
+    def similar(self, name):
+        titles = self.entries[name].get_similar_post().values_list("title", flat=True)
+        return [title[-1] for title in titles]
+
+    def test_similar(self):
+        self.assertEqual(self.similar("a"), ["b", "c"])
+        self.assertEqual(self.similar("c"), ["a", "b"])
+        self.assertEqual(self.similar("d"), [])
+
+    def test_tags_changed(self):
+        self.entries["c"].tags.remove("python")
+        self.assertEqual(self.similar("a"), ["b"])
+        self.assertEqual(self.similar("c"), [])
+
+        self.entries["d"].tags.add("django")
+        self.assertEqual(self.similar("d"), ["a", "b"])
+        self.assertEqual(self.similar("a"), ["b", "d"])
+
+        self.entries["b"].tags.clear()
+        self.assertEqual(self.similar("a"), ["d"])
+
+    def test_unpublished_and_deleted(self):
+        self.entries["b"].is_published = False
+        self.entries["b"].save()
+        self.assertEqual(self.similar("a"), ["c"])
+        self.assertEqual(self.similar("b"), [])
+
+        self.entries["c"].delete()
+        self.assertEqual(self.similar("a"), [])
+
+    def test_detail_page(self):
+        response = self.client.get(self.entries["a"].get_absolute_url())
+        # the tagged entries first, then d topped up by its (same) text
+        self.assertEqual(
+            response.context["similar_posts"],
+            [self.entries["b"], self.entries["c"], self.entries["d"]],
+        )
+        self.assertContains(response, self.entries["b"].get_absolute_url())
+
+    def test_pages_invalidated(self):
+        def version():
+            return page_cache.get_versions(["entry:" + self.entries["a"].slug])
+
+        before = version()
+        # b and d are listed by each other, not by a
+        self.entries["d"].tags.add("web")
+        self.assertEqual(version(), before)
+
+        self.entries["c"].tags.remove("python")
+        self.assertNotEqual(version(), before)
+
+        # the rows listing b are deleted with it
+        before = version()
+        self.entries["b"].delete()
+        self.assertNotEqual(version(), before)
+
+    def test_rebuild(self):
+        RelatedEntry.objects.all().delete()
+        out = StringIO()
+        call_command("rebuild_related", stdout=out)
+        self.assertIn("Related entries of 4 entries rebuilt", out.getvalue())
+        self.assertEqual(self.similar("a"), ["b", "c"])
+
+    @override_settings(RELATED_ENTRIES_COUNT=1)
+    def test_refill(self):
+        from blog.related import rebuild_related
+
+        rebuild_related()
+        self.assertEqual(self.similar("a"), ["b"])
+
+        # c was left out of a's list, it takes the place b leaves
+        self.entries["b"].delete()
+        self.assertEqual(self.similar("a"), ["c"])
+
+        # d ties with c (and has the higher id) once it is tagged django only
+        self.entries["d"].tags.remove("cooking")
+        self.entries["d"].tags.add("django")
+        self.assertEqual(self.similar("a"), ["d"])
+
+        # a is refilled from python, not loaded for a django change
+        with patch.object(
+            TagIndex, "extend", autospec=True, side_effect=TagIndex.extend
+        ) as extend:
+            self.entries["d"].tags.remove("django")
+        self.assertEqual(self.similar("a"), ["c"])
+        self.assertEqual(extend.call_count, 2)
+
+    def test_update_cost(self):
+        def update():
+            loaded = []
+            add = TagIndex.add
+
+            def record(index, pairs):
+                pairs = list(pairs)
+                loaded.extend(pairs)
+                add(index, pairs)
+
+            with patch.object(TagIndex, "add", record):
+                with CaptureQueriesContext(connection) as queries:
+                    update_related([self.entries["d"].pk])
+            return len(queries), {entry_id for entry_id, __ in loaded}
+
+        queries, loaded = update()
+        self.assertEqual(loaded, {self.entries["d"].pk})
+
+        # entries not sharing d's tags are neither loaded nor queried
+        for index in range(20):
+            entry = Entry.objects.create(
+                title="Other {0}".format(index),
+                body="This is my test blog",
+                author=self.author,
+                is_published=True,
+            )
+            entry.tags.add("python", "other")
+        self.assertEqual(update(), (queries, loaded))
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils.six import StringIO
+
+from blog import signals
+from blog.models import Entry, EntryVector, TermFrequency, TermPosting
+from blog.tasks import update_entry_vector
+from blog.tfidf import build_index, rebuild_vectors, term_counts, update_vector
+
+
+BODIES = {
+    "a": "<p>Django querysets are lazy, django evaluates querysets late.</p>",
+    "b": "<p>Lazy querysets in Django: evaluate the queryset once.</p>",
+    "c": "<p>Sourdough bread needs flour, water and a lazy starter.</p>",
+    "d": "<p>Bake the bread with flour and water.</p>",
+}
+
+
+class BuildIndexTestCase(SimpleTestCase):
+    def test_term_counts(self):
+        counts = term_counts("<p>Django <b>django</b> 42 a x_y</p>")
+        self.assertEqual(sorted(counts.values()), [2])
+
+    def test_nearest(self):
+        df, vectors, neighbours = build_index(lambda: iter(sorted(BODIES.items())), 2)
+
+        self.assertEqual(len(vectors), 4)
+        for vector in vectors.values():
+            norm = sum(weight * weight for weight in vector.values())
+            self.assertAlmostEqual(norm, 1.0)
+        self.assertEqual(neighbours["a"][0][0], "b")
+        self.assertEqual(neighbours["c"][0][0], "d")
+        self.assertEqual(len(neighbours["a"]), 2)
+        self.assertGreater(neighbours["a"][0][1], neighbours["a"][1][1])
+
+    def test_empty(self):
+        self.assertEqual(build_index(lambda: iter(()), 2), ({}, {}, {}))
+
+
+@override_settings(TASKS_ALWAYS_EAGER=True)
+class EntryVectorTestCase(TestCase):
+    def tearDown(self):
+        from django_redis import get_redis_connection
+
+        get_redis_connection("default").flushall()
+
+    def setUp(self):
+        self.author = get_user_model().objects.create(username="iamatest")
+        self.entries = {}
+        for name, body in sorted(BODIES.items()):
+            self.entries[name] = Entry.objects.create(
+                title="Test blog Title {0}".format(name),
+                body=body,
+                author=self.author,
+                is_published=True,
+            )
+
+    def similar(self, name):
+        entry = Entry.objects.get(pk=self.entries[name].pk)
+        return [post.title[-1] for post in entry.get_similar_by_content()]
+
+    def test_rebuild(self):
+        self.assertEqual(rebuild_vectors(), 4)
+        self.assertEqual(EntryVector.objects.count(), 4)
+        self.assertTrue(TermFrequency.objects.exists())
+        self.assertEqual(self.similar("a")[0], "b")
+        self.assertEqual(self.similar("d")[0], "c")
+
+    def test_rebuild_matches_updates(self):
+        # entries created after the first one were vectorized on save
+        updated = {name: self.similar(name) for name in self.entries}
+        rebuild_vectors()
+        for name in self.entries:
+            self.assertEqual(self.similar(name)[:1], updated[name][:1])
+
+    def test_body_change(self):
+        rebuild_vectors()
+        entry = Entry.objects.get(pk=self.entries["c"].pk)
+        entry.body = "<p>Django querysets evaluate lazy.</p>"
+        entry.save()
+        self.assertEqual(sorted(self.similar("c")[:2]), ["a", "b"])
+        self.assertIn("c", self.similar("a"))
+        self.assertNotIn("c", self.similar("d"))
+
+    def test_unpublish_and_delete(self):
+        rebuild_vectors()
+        entry = Entry.objects.get(pk=self.entries["b"].pk)
+        entry.is_published = False
+        entry.save()
+        self.assertFalse(EntryVector.objects.filter(pk=entry.pk).exists())
+        self.assertNotIn("b", self.similar("a"))
+
+        self.entries["d"].delete()
+        self.assertNotIn("d", self.similar("c"))
+        # unpublished entries are not vectorized
+        self.assertEqual(update_vector(entry.pk), 0)
+
+    def test_refill(self):
+        rebuild_vectors(count=1)
+        self.assertEqual(self.similar("a"), ["b"])
+        self.assertEqual(
+            TermPosting.objects.filter(entry=self.entries["b"]).count(),
+            len(term_counts(BODIES["b"])),
+        )
+        self.entries["b"].delete()
+        # the list lost its only entry and was refilled
+        self.assertEqual(self.similar("a"), ["c"])
+        self.assertFalse(TermPosting.objects.filter(entry_id=self.entries["b"].pk))
+
+    @override_settings(TASKS_ALWAYS_EAGER=False)
+    def test_scheduled_after_commit(self):
+        rebuild_vectors()
+        entry = Entry.objects.get(pk=self.entries["c"].pk)
+        entry.body = "<p>Django querysets evaluate lazy.</p>"
+        with patch.object(signals.transaction, "on_commit") as on_commit:
+            with patch.object(signals.background, "submit") as submit:
+                entry.save()
+                # nothing is computed in the request
+                self.assertEqual(self.similar("c")[0], "d")
+                self.assertFalse(submit.called)
+                for call in on_commit.call_args_list:
+                    call[0][0]()
+        submit.assert_any_call(signals.run_in_background, update_entry_vector, entry.pk)
+
+    def test_detail_tops_up_related_posts(self):
+        rebuild_vectors()
+        self.entries["a"].tags.add("python")
+        self.entries["c"].tags.add("python")
+        response = self.client.get(self.entries["a"].get_absolute_url())
+        titles = [post.title[-1] for post in response.context["similar_posts"]]
+        # the tagged entry first, then the closest by text
+        self.assertEqual(titles[:2], ["c", "b"])
+        self.assertEqual(len(titles), len(set(titles)))
+
+    def test_command(self):
+        out = StringIO()
+        call_command("rebuild_vectors", "--count", "1", stdout=out)
+        self.assertIn("Vectors of 4 entries rebuilt", out.getvalue())
+        self.assertEqual(len(self.similar("a")), 1)
@@ -1,13 +1,31 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from io import StringIO
 import json
 import os
-from unittest.mock import MagicMock, Mock
+import tempfile
+from unittest.mock import MagicMock, Mock, patch
 
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
 from django.test import TestCase
 
-from blog.utils import ajax_required, FileUploader
+from blog.models import Entry
+from blog.utils import (
+    ajax_required,
+    block_cache,
+    cached_pygmentify_html,
+    get_formatter,
+    get_lexer,
+    highlight_cache,
+    pygmentify_html,
+    FileUploader,
+    HighlightCache,
+    LEXER_NAMES,
+    RENDERER_VERSION,
+)
 
 
 class AjaxRequiredTestCase(TestCase):
@@ -77,7 +95,7 @@ class AjaxRequiredTestCase(TestCase):
 
     def test_is_ajax_true_no_func_name(self):
         """ajax_required decorator called via ajax from view
-          with no attr __name__.
+        with no attr __name__.
         """
 
         # Setup.
@@ -131,3 +149,152 @@ class FileUploaderTestCase(TestCase):
             file_no_path(obj, filename),
             os.path.join(os.path.join("entry", "poster"), "911_test.png"),
         )
+
+
+class RenderEntriesCommandTestCase(TestCase):
+    def tearDown(self):
+        from django_redis import get_redis_connection
+
+        get_redis_connection("default").flushall()
+
+    def setUp(self):
+        author = get_user_model().objects.create(username="iamatest")
+        self.entries = [
+            Entry.objects.create(
+                title="Test blog Title {0}".format(index),
+                body="This is my test blog {0}".format(index),
+                author=author,
+            )
+            for index in range(5)
+        ]
+        Entry.objects.update(rendered_body="", renderer_version="")
+
+    def assertRendered(self, entries):
+        for entry in entries:
+            entry.refresh_from_db()
+            self.assertEqual(entry.renderer_version, RENDERER_VERSION)
+            self.assertEqual(entry.rendered_body, entry.body)
+
+    def test_render_stale_entries(self):
+        out = StringIO()
+        call_command("render_entries", workers=1, batch_size=2, stdout=out)
+
+        self.assertIn("Rendered 5 entries", out.getvalue())
+        self.assertRendered(self.entries)
+
+    def test_render_with_workers(self):
+        out = StringIO()
+        call_command("render_entries", workers=2, batch_size=2, stdout=out)
+
+        self.assertIn("Rendered 5 entries", out.getvalue())
+        self.assertRendered(self.entries)
+
+    def test_resume_from_checkpoint(self):
+        path = os.path.join(tempfile.mkdtemp(), "render_entries.json")
+        with open(path, "w") as checkpoint:
+            json.dump(
+                {"renderer_version": RENDERER_VERSION, "last_pk": self.entries[2].pk},
+                checkpoint,
+            )
+
+        out = StringIO()
+        call_command("render_entries", all=True, workers=1, checkpoint=path, stdout=out)
+
+        # Entries up to the checkpoint are not rendered again.
+        self.assertIn("Rendered 2 entries", out.getvalue())
+        self.assertRendered(self.entries[3:])
+        self.assertFalse(os.path.exists(path))
+
+
+class HighlightCacheTestCase(TestCase):
+    def tearDown(self):
+        from django_redis import get_redis_connection
+
+        get_redis_connection("default").flushall()
+
+    def setUp(self):
+        highlight_cache.clear()
+
+    def test_make_key(self):
+        key = HighlightCache.make_key("<pre>a</pre>", {"noclasses": True})
+
+        # Same input and options give the same key.
+        self.assertEqual(
+            key, HighlightCache.make_key("<pre>a</pre>", {"noclasses": True})
+        )
+
+        # Text and options are both part of the key.
+        self.assertNotEqual(key, HighlightCache.make_key("<pre>b</pre>", {}))
+        self.assertNotEqual(key, HighlightCache.make_key("<pre>a</pre>", {}))
+
+    def test_lru_eviction(self):
+        cache = HighlightCache(maxsize=2)
+        cache.set("a", "1")
+        cache.set("b", "2")
+
+        # Touch "a" so that "b" is the least recently used.
+        cache.get("a")
+        cache.set("c", "3")
+
+        self.assertEqual(list(cache._local), ["a", "c"])
+
+        # Evicted entries are still served by the django cache.
+        self.assertEqual(cache.get("b"), "2")
+
+    def test_cached_pygmentify_html(self):
+        text = '<pre lang="python">print("cached")</pre>'
+
+        with patch("blog.utils.pygmentify_html", wraps=pygmentify_html) as render:
+            first = cached_pygmentify_html(text, noclasses=True)
+            second = cached_pygmentify_html(text, noclasses=True)
+
+        render.assert_called_once_with(text, noclasses=True)
+        self.assertEqual(first, second)
+        self.assertEqual(first, pygmentify_html(text, noclasses=True))
+
+    def test_block_cache(self):
+        block_cache.clear()
+        code = '<pre lang="python">print("block")</pre><pre>x = 1</pre>'
+
+        with patch("blog.utils.highlight_block") as highlight_block:
+            highlight_block.side_effect = lambda code, lang, formatter: lang
+            first = pygmentify_html("<p>Intro</p>" + code)
+            second = pygmentify_html("<p>Edited intro</p>" + code)
+
+        # Each block was highlighted once, editing the prose reused them.
+        self.assertEqual(highlight_block.call_count, 2)
+        self.assertEqual(first, "<p>Intro</p>pythonpython")
+        self.assertEqual(second, "<p>Edited intro</p>pythonpython")
+
+    def test_block_cache_round_trips(self):
+        block_cache.clear()
+        code = "".join('<pre lang="python">x = {0}</pre>'.format(n) for n in range(20))
+        cache = caches["default"]
+
+        with patch.object(cache, "get_many", wraps=cache.get_many) as get_many:
+            with patch.object(cache, "set_many", wraps=cache.set_many) as set_many:
+                with patch.object(cache, "get", wraps=cache.get) as get:
+                    first = pygmentify_html(code)
+                    # a cold worker reads the blocks rendered by another
+                    block_cache.clear()
+                    second = pygmentify_html(code)
+
+        self.assertEqual(first, second)
+        self.assertEqual(get_many.call_count, 2)
+        self.assertEqual(set_many.call_count, 1)
+        self.assertFalse(get.called)
+
+
+class LexerPoolTestCase(TestCase):
+    def test_lexer_names(self):
+        self.assertIsInstance(LEXER_NAMES, frozenset)
+        self.assertIn("python", LEXER_NAMES)
+        self.assertIn("text", LEXER_NAMES)
+
+    def test_instances_are_shared(self):
+        self.assertIs(get_lexer("python"), get_lexer("python"))
+        self.assertIs(get_formatter(noclasses=True), get_formatter(noclasses=True))
+        self.assertIsNot(get_formatter(noclasses=True), get_formatter())
+
+        # Unhashable options still get a formatter, just not a shared one.
+        self.assertIsNot(get_formatter(hl_lines=[1]), get_formatter(hl_lines=[1]))
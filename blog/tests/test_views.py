@@ -165,7 +165,7 @@ class EntryByCategoryListViewTestCase(TestCase):
 
         self.assertIn("entries", response.context)
 
-        self.assertEquals(response.context["entries"].count(), 0)
+        self.assertEquals(len(response.context["entries"]), 0)
 
     def test_post_in_category(self):
         pk = Category.objects.last().pk
@@ -175,7 +175,7 @@ class EntryByCategoryListViewTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn("entries", response.context)
         self.assertEquals(
-            response.context["entries"].count(),
+            len(response.context["entries"]),
             Entry.objects.select_related("category")
             .filter(category__pk=pk)
             .order_by("pk")
@@ -248,6 +248,37 @@ class EntryViewTestCase(TestCase):
         response = self.client.get(self.entry.get_absolute_url())
         self.assertContains(response, self.entry.body)
 
+    def test_num_queries_anonymous(self):
+        self.entry.tags.add("django", "python")
+        url = self.entry.get_absolute_url()
+
+        # the conditional GET validators, the entry (with its tag names), the
+        # similar entries, its text vector to top them up and the views update.
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertContains(response, "python")
+
+    def test_num_queries_author(self):
+        self.entry.tags.add("django", "python")
+        url = self.entry.get_absolute_url()
+        self.client.login(username="iamatest", password="Passiamatest123")
+
+        # the logged in user on top of the anonymous queries, less the
+        # validators lookup only anonymous reads get.
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertContains(response, "python")
+
+    def test_draft_only_visible_to_author(self):
+        self.entry.is_published = False
+        self.entry.save()
+        url = self.entry.get_absolute_url()
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.client.login(username="iamatest", password="Passiamatest123")
+        self.assertEqual(self.client.get(url).status_code, 200)
+
 
 class EntryListViewTestCase(TestCase):
     def tearDown(self):
@@ -295,9 +326,30 @@ class EntryListViewTestCase(TestCase):
     def test_multiple_entries(self):
         self.update_entries()
         response = self.client.get(reverse("entry_list"))
-        self.assertEquals(
-            response.context["entries"].count(), EntryListView.paginate_by
-        )
+        self.assertEquals(len(response.context["entries"]), EntryListView.paginate_by)
+
+    def test_num_queries(self):
+        url = reverse("entry_list")
+        for count in (3, 30):
+            Entry.objects.all().delete()
+            for index in range(count):
+                Entry.objects.create(
+                    title=self.blog_title + str(index),
+                    body=self.blog_body + str(index),
+                    author=self.author,
+                    is_published=True,
+                )
+
+            # the conditional GET validators, the paginator count and the page.
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+            self.assertEqual(len(response.context["featured"]), 2)
+
+    def test_body_not_loaded(self):
+        self.update_entries()
+        response = self.client.get(reverse("entry_list"))
+        for entry in response.context["entries"]:
+            self.assertIn("body", entry.get_deferred_fields())
 
 
 @override_settings(HAYSTACK_CONNECTIONS=TEST_INDEX)
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from array import array
+from collections import Counter, defaultdict
+import heapq
+import math
+import re
+import zlib
+
+from django.conf import settings
+from django.db import transaction
+
+from blog.models import Entry, EntryVector, TermFrequency, TermPosting
+from blog.page_cache import invalidate_entries
+
+TOKEN_RE = re.compile(r"[^\W\d_]{2,}", re.UNICODE)
+
+# heaviest terms kept in an entry vector
+VECTOR_TERMS = 64
+
+# heaviest terms of an entry looked up to find its neighbours
+QUERY_TERMS = 16
+
+# entries kept per term, heaviest first: a term weighs little in the rest
+POSTING_DEPTH = 100
+
+# TermFrequency row holding the number of documents, term hashes are unsigned
+DOCUMENTS = -1
+
+
+def term_counts(text):
+    """Hashed term -> count of the words of an entry body, tags stripped."""
+    tokens = Counter(TOKEN_RE.findall(Entry.cleanhtml(text).lower()))
+    counts = Counter()
+    for token, count in tokens.items():
+        counts[zlib.crc32(token.encode("utf-8"))] += count
+    return counts
+
+
+def vectorize(counts, df, total, size=VECTOR_TERMS):
+    """The size heaviest (sublinear tf) * idf terms of counts, L2 normalized."""
+    weights = [
+        (
+            (1 + math.log(count))
+            * (math.log((1.0 + total) / (1 + df.get(term, 0))) + 1),
+            term,
+        )
+        for term, count in counts.items()
+    ]
+    weights = heapq.nlargest(size, weights)
+    norm = math.sqrt(sum(weight * weight for weight, __ in weights)) or 1.0
+    return {term: weight / norm for weight, term in weights}
+
+
+def float32(value):
+    return array("f", [value])[0]
+
+
+def by_score(item):
+    return item[1], item[0]
+
+
+def query_terms(vector):
+    """The QUERY_TERMS heaviest terms of vector."""
+    return [
+        term for term, __ in heapq.nlargest(QUERY_TERMS, vector.items(), key=by_score)
+    ]
+
+
+def scores(vector, postings, exclude=None):
+    """
+    pk -> cosine of the entries found in the postings of the QUERY_TERMS
+    heaviest terms of vector. The scores are those of the neighbours found
+    through these terms only, the top N can miss an entry sharing many
+    light terms.
+    """
+    found = defaultdict(float)
+    for term in query_terms(vector):
+        weight = vector[term]
+        for pk, other_weight in postings.get(term, ()):
+            found[pk] += weight * other_weight
+    found.pop(exclude, None)
+    return found
+
+
+def nearest(vector, postings, count, exclude=None):
+    """The count (pk, cosine) closest to vector in the postings, best first."""
+    found = scores(vector, postings, exclude)
+    return [
+        (pk, float32(score))
+        for pk, score in heapq.nlargest(count, found.items(), key=by_score)
+    ]
+
+
+def build_index(documents, count):
+    """
+    TF-IDF vectors and nearest neighbours of documents, a callable returning
+    an iterator of (pk, text). The texts are read twice, once to count
+    document frequencies, so the term counts of every document are never
+    held at once. Each term only keeps its POSTING_DEPTH heaviest entries,
+    which bounds the work per document whatever the size of the corpus.
+    """
+    df = Counter()
+    total = 0
+    for __, text in documents():
+        df.update(term_counts(text).keys())
+        total += 1
+
+    vectors = {pk: vectorize(term_counts(text), df, total) for pk, text in documents()}
+
+    postings = defaultdict(list)
+    for pk, vector in vectors.items():
+        for term, weight in vector.items():
+            postings[term].append((pk, weight))
+    for term, posting in postings.items():
+        if len(posting) > POSTING_DEPTH:
+            postings[term] = heapq.nlargest(POSTING_DEPTH, posting, key=by_score)
+
+    neighbours = {
+        pk: nearest(vector, postings, count, exclude=pk)
+        for pk, vector in vectors.items()
+    }
+    return df, vectors, neighbours
+
+
+def pack(pairs, key_type, value_type):
+    keys, values = zip(*pairs) if pairs else ((), ())
+    return array(key_type, keys).tobytes(), array(value_type, values).tobytes()
+
+
+def unpack(keys, values, key_type, value_type):
+    keys, values = array(key_type, bytes(keys)), array(value_type, bytes(values))
+    return list(zip(keys, values))
+
+
+def make_vector(pk, vector, neighbours):
+    terms, weights = pack(sorted(vector.items()), "I", "f")
+    neighbours, scores = pack(neighbours, "I", "f")
+    return EntryVector(
+        entry_id=pk, terms=terms, weights=weights, neighbours=neighbours, scores=scores
+    )
+
+
+def published_bodies():
+    return (
+        Entry.objects.filter(is_published=True)
+        .order_by()
+        .values_list("pk", "body")
+        .iterator()
+    )
+
+
+def make_postings(pk, vector):
+    return [
+        TermPosting(term=term, entry_id=pk, weight=weight)
+        for term, weight in vector.items()
+    ]
+
+
+def rebuild_vectors(count=None, batch_size=1000):
+    """Rebuild the vectors and neighbours of every published entry."""
+    count = count or settings.RELATED_ENTRIES_COUNT
+    df, vectors, neighbours = build_index(published_bodies, count)
+
+    with transaction.atomic():
+        TermFrequency.objects.all().delete()
+        TermPosting.objects.all().delete()
+        EntryVector.objects.all().delete()
+        TermFrequency.objects.bulk_create(
+            (TermFrequency(term=term, df=frequency) for term, frequency in df.items()),
+            batch_size=batch_size,
+        )
+        TermFrequency.objects.create(term=DOCUMENTS, df=len(vectors))
+        EntryVector.objects.bulk_create(
+            (make_vector(pk, vectors[pk], neighbours[pk]) for pk in vectors),
+            batch_size=batch_size,
+        )
+        for start in range(0, len(vectors), batch_size):
+            TermPosting.objects.bulk_create(
+                posting
+                for pk in list(vectors)[start : start + batch_size]
+                for posting in make_postings(pk, vectors[pk])
+            )
+    return len(vectors)
+
+
+def get_document_frequencies(terms, batch_size=500):
+    terms = list(terms)
+    df = {}
+    for start in range(0, len(terms), batch_size):
+        df.update(
+            TermFrequency.objects.filter(
+                term__in=terms[start : start + batch_size]
+            ).values_list("term", "df")
+        )
+    return df
+
+
+class ChampionLists(dict):
+    """term -> its POSTING_DEPTH heaviest (pk, weight), read when first used."""
+
+    def __missing__(self, term):
+        self[term] = list(
+            TermPosting.objects.filter(term=term)
+            .order_by("-weight", "-entry")
+            .values_list("entry_id", "weight")[:POSTING_DEPTH]
+        )
+        return self[term]
+
+    def get(self, term, default=None):
+        return self[term]
+
+
+def update_vector(pk, count=None, old_terms=None, batch_size=500):
+    """
+    Recompute the vector and neighbours of one entry, and move it in or out
+    of the neighbours of the entries found through the champion lists of
+    its old and new heaviest terms, the ones whose lists it can be in.
+    Lists losing the entry are refilled the same way, the work is bounded
+    by QUERY_TERMS * POSTING_DEPTH whatever the number of entries.
+    Document frequencies are the ones of the last rebuild_vectors.
+
+    old_terms are the terms of an entry whose postings are already gone,
+    deleted with it.
+    """
+    count = count or settings.RELATED_ENTRIES_COUNT
+    entry = Entry.objects.filter(pk=pk, is_published=True).values_list("body").first()
+
+    vector = {}
+    if entry is not None:
+        counts = term_counts(entry[0])
+        df = get_document_frequencies(list(counts) + [DOCUMENTS])
+        total = df.pop(DOCUMENTS, None) or EntryVector.objects.count() + 1
+        vector = vectorize(counts, df, total)
+    old_vector = dict(
+        TermPosting.objects.filter(entry_id=pk).values_list("term", "weight")
+    )
+    old_terms = query_terms(old_vector) if old_vector else old_terms or []
+
+    with transaction.atomic():
+        EntryVector.objects.filter(pk=pk).delete()
+        TermPosting.objects.filter(entry_id=pk).delete()
+        TermPosting.objects.bulk_create(make_postings(pk, vector))
+
+        postings = ChampionLists()
+        found = scores(vector, postings, exclude=pk)
+        candidates = set(found)
+        for term in old_terms:
+            candidates.update(other_pk for other_pk, __ in postings[term])
+        candidates.discard(pk)
+
+        changed = []
+        candidates = sorted(candidates)
+        for start in range(0, len(candidates), batch_size):
+            others = EntryVector.objects.filter(
+                pk__in=candidates[start : start + batch_size]
+            ).values_list("entry_id", "terms", "weights", "neighbours", "scores")
+            for other_pk, terms, weights, neighbours, other_scores in others:
+                old = unpack(neighbours, other_scores, "I", "f")
+                new = [(other, value) for other, value in old if other != pk]
+                if found.get(other_pk):
+                    new.append((pk, float32(found[other_pk])))
+                    new = heapq.nlargest(count, new, key=by_score)
+                elif len(new) < len(old):
+                    # refill the list the entry dropped out of
+                    other_vector = dict(unpack(terms, weights, "I", "f"))
+                    new = nearest(other_vector, postings, count, exclude=other_pk)
+                if new != old:
+                    neighbours, other_scores = pack(new, "I", "f")
+                    EntryVector.objects.filter(pk=other_pk).update(
+                        neighbours=neighbours, scores=other_scores
+                    )
+                    changed.append(other_pk)
+
+        if entry is not None:
+            neighbours = nearest(vector, postings, count, exclude=pk)
+            make_vector(pk, vector, neighbours).save(force_insert=True)
+    # the detail pages list the closest entries
+    invalidate_entries(changed)
+    return len(changed)
@@ -1,17 +1,32 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from functools import reduce
+from collections import OrderedDict
+from functools import lru_cache
+import hashlib
+import html
+import math
 import os
 import re
+import threading
 
+from django.conf import settings
+from django.core.cache import caches
 from django.http.response import JsonResponse
 from django.utils.encoding import smart_text
 from django.utils.deconstruct import deconstructible
+from django.utils.text import Truncator
 
+import pygments
 from pygments import highlight
 from pygments.formatters.html import HtmlFormatter
 from pygments.lexers import LEXERS, get_lexer_by_name
+from pygments.util import ClassNotFound, OptionError
+
+# Bump FORMATTER_REVISION whenever ListHtmlFormatter or the options used to
+# render entry bodies change, so stored renders are regenerated.
+FORMATTER_REVISION = 1
+RENDERER_VERSION = "{0}-pygments-{1}".format(FORMATTER_REVISION, pygments.__version__)
 
 
 def ajax_required(view_function):
@@ -76,42 +91,221 @@ class ListHtmlFormatter(HtmlFormatter):
         yield 0, "</ol>"
 
 
+# Aliases of every lexer known to Pygments, built once per process.
+LEXER_NAMES = frozenset(alias for lexer in LEXERS.values() for alias in lexer[2])
+
+PRE_RE = re.compile(r"(<pre[^>]*>)(.*?)(</pre>)", re.DOTALL | re.UNICODE)
+BR_RE = re.compile(r"<br[^>]*?>", re.UNICODE)
+P_RE = re.compile(r"<?p[^>]*>", re.UNICODE)
+LANG_RE = re.compile(r'lang=["\'](.+?)["\']', re.DOTALL | re.UNICODE)
+
+
+@lru_cache(maxsize=None)
+def get_lexer(lang):
+    """Return a shared lexer instance for lang, lexers keep no state."""
+    return get_lexer_by_name(lang, stripall=True)
+
+
+@lru_cache(maxsize=64)
+def _get_formatter(options):
+    return ListHtmlFormatter(encoding="utf-8", **dict(options))
+
+
+def get_formatter(**kwargs):
+    """Return a shared ListHtmlFormatter instance for the given options."""
+    try:
+        return _get_formatter(tuple(sorted(kwargs.items())))
+    except TypeError:
+        # unhashable option values (e.g. hl_lines=[1, 2]) are not pooled
+        return ListHtmlFormatter(encoding="utf-8", **kwargs)
+
+
+def highlight_block(code, lang, formatter):
+    code = BR_RE.sub("\n", code)
+    code = (
+        code.replace("&nbsp;", " ")
+        .replace("&amp;", "&")
+        .replace("&lt;", "<")
+        .replace("&gt;", ">")
+        .replace("&quot;", '"')
+        .replace("&#39;", "'")
+    )
+    code = P_RE.sub("", code)
+    return smart_text(highlight(code, get_lexer(lang), formatter))
+
+
 def pygmentify_html(text, **kwargs):
     text = smart_text(text)
     lang = default_lang = "text"
-    # a tuple of known lexer names
-    try:
-        lexers_iter = LEXERS.itervalues()
-    except AttributeError:
-        lexers_iter = LEXERS.values()
-    lexer_names = reduce(lambda a, b: a + b[2], lexers_iter, ())
-    # custom formatter
-    formatter = ListHtmlFormatter(encoding="utf-8", **kwargs)
-    subs = []
-    pre_re = re.compile(r"(<pre[^>]*>)(.*?)(</pre>)", re.DOTALL | re.UNICODE)
-    br_re = re.compile(r"<br[^>]*?>", re.UNICODE)
-    p_re = re.compile(r"<?p[^>]*>", re.UNICODE)
-    lang_re = re.compile(r'lang=["\'](.+?)["\']', re.DOTALL | re.UNICODE)
-    for pre_match in pre_re.findall(text):
-        work_area = pre_match[1]
-        work_area = br_re.sub("\n", work_area)
-        match = lang_re.search(pre_match[0])
+
+    blocks = []
+    for pre_match in PRE_RE.finditer(text):
+        # a <pre> without a lang attribute reuses the previous block's lang
+        match = LANG_RE.search(pre_match.group(1))
         if match:
             lang = match.group(1).strip()
-            if lang not in lexer_names:
+            if lang not in LEXER_NAMES:
                 lang = default_lang
-        lexer = get_lexer_by_name(lang, stripall=True)
-        work_area = (
-            work_area.replace("&nbsp;", " ")
-            .replace("&amp;", "&")
-            .replace("&lt;", "<")
-            .replace("&gt;", ">")
-            .replace("&quot;", '"')
-            .replace("&#39;", "'")
-        )
-        work_area = p_re.sub("", work_area)
-        work_area = highlight(work_area, lexer, formatter)
-        subs.append(["".join(pre_match), smart_text(work_area)])
-    for sub in subs:
-        text = text.replace(sub[0], sub[1], 1)
-    return text
+        code = pre_match.group(2)
+        key = block_cache.make_key(code, kwargs, namespace="pygmentify-" + lang)
+        blocks.append((code, lang, key))
+    if not blocks:
+        return text
+
+    # Blocks are memoized on their own so that editing the prose around
+    # them does not highlight unchanged code again, and all of a body's
+    # blocks are read and written with one cache query each.
+    rendered = block_cache.get_many({key for __, __, key in blocks})
+    new = {}
+    for code, lang, key in blocks:
+        if key not in rendered:
+            rendered[key] = new[key] = highlight_block(
+                code, lang, get_formatter(**kwargs)
+            )
+    if new:
+        block_cache.set_many(new)
+
+    keys = iter([key for __, __, key in blocks])
+    return PRE_RE.sub(lambda pre_match: rendered[next(keys)], text)
+
+
+class HighlightCache:
+    """
+    Content addressed cache for highlighted html.
+
+    A bounded in-process LRU sits in front of the configured django cache
+    (redis in production), so repeated renders within a worker cost a
+    dictionary lookup and renders done by one worker are shared with the
+    others. Keys hash the input text, the formatter options and the
+    renderer version, so upgrading Pygments never serves stale html.
+    """
+
+    def __init__(self, maxsize=256, timeout=None, cache_alias="default"):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text, options, namespace="pygmentify"):
+        digest = hashlib.sha1(RENDERER_VERSION.encode("utf-8"))
+        digest.update(repr(sorted(options.items())).encode("utf-8"))
+        digest.update(text.encode("utf-8"))
+        return "{0}:{1}".format(namespace, digest.hexdigest())
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._local.move_to_end(key)
+                return self._local[key]
+            except KeyError:
+                pass
+
+        value = caches[self.cache_alias].get(key)
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def get_many(self, keys):
+        """The values of keys found, the ones not in this process in one query."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._local:
+                    self._local.move_to_end(key)
+                    found[key] = self._local[key]
+
+        missing = [key for key in keys if key not in found]
+        if missing:
+            fetched = caches[self.cache_alias].get_many(missing)
+            for key, value in fetched.items():
+                self._remember(key, value)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value):
+        self._remember(key, value)
+        caches[self.cache_alias].set(key, value, self.timeout)
+
+    def set_many(self, values):
+        for key, value in values.items():
+            self._remember(key, value)
+        caches[self.cache_alias].set_many(values, self.timeout)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._local[key] = value
+            self._local.move_to_end(key)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+
+highlight_cache = HighlightCache(
+    maxsize=getattr(settings, "PYGMENTIFY_CACHE_SIZE", 256),
+    timeout=getattr(settings, "PYGMENTIFY_CACHE_TIMEOUT", 7 * 24 * 3600),
+)
+
+# Highlighted <pre> blocks, keyed by language and block content.
+block_cache = HighlightCache(
+    maxsize=getattr(settings, "PYGMENTIFY_BLOCK_CACHE_SIZE", 2048),
+    timeout=getattr(settings, "PYGMENTIFY_CACHE_TIMEOUT", 7 * 24 * 3600),
+)
+
+
+def cached_pygmentify_html(text, **kwargs):
+    """
+    Same as pygmentify_html but served from highlight_cache when the same
+    text was already highlighted with the same options.
+    """
+    text = smart_text(text)
+    key = highlight_cache.make_key(text, kwargs)
+    res = highlight_cache.get(key)
+    if res is None:
+        res = pygmentify_html(text, **kwargs)
+        highlight_cache.set(key, res)
+    return res
+
+
+def render_entry_body(text):
+    """
+    Render an entry body to the HTML served on the detail page, falling
+    back to the raw text if no lexer is found, the options are rejected or
+    the body does not decode.
+    """
+    try:
+        return cached_pygmentify_html(text, noclasses=True)
+    except (ClassNotFound, OptionError, UnicodeError):
+        return smart_text(text, errors="replace")
+
+
+TAG_RE = re.compile("<.*?>", re.DOTALL)
+WORDS_PER_MINUTE = 200
+
+
+def body_statistics(text):
+    """
+    Return the number of words (markup and code blocks stripped), the
+    reading time in minutes and the number of code blocks of an entry body.
+    """
+    text = smart_text(text)
+    code_blocks = sum(1 for __ in PRE_RE.finditer(text))
+    prose = PRE_RE.sub(" ", text)
+    words = len(html.unescape(TAG_RE.sub(" ", prose)).split())
+    return words, int(math.ceil(words / WORDS_PER_MINUTE)), code_blocks
+
+
+EXCERPT_LENGTH = 128
+
+
+def make_excerpt(text, length=EXCERPT_LENGTH):
+    """
+    Return the first length chars of the body as plain text, markup stripped
+    and entities decoded, it is escaped like any other text when rendered.
+    """
+    words = html.unescape(TAG_RE.sub(" ", smart_text(text))).split()
+    return Truncator(" ".join(words)).chars(length)
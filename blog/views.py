@@ -8,7 +8,7 @@ from urllib.parse import urlencode
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import F
+from django.db.models import Count, Max, Q
 from django.http import Http404
 from django.http.response import JsonResponse
 from django.shortcuts import get_object_or_404, redirect
@@ -22,7 +22,10 @@ from django.views.generic.edit import UpdateView
 from haystack.views import SearchView
 from meta.views import Meta
 
+from blog.counters import count_view
 from blog.models import Category
+from blog.page_cache import anonymous_page_cache, conditional_page
+from blog.pagination import CursorPaginationMixin
 from blog.utils import ajax_required
 from .models import Entry, Image
 
@@ -108,6 +111,61 @@ class PublishEntryView(View):
             return redirect(reverse_lazy("dashboard-entries"))
 
 
+def visible_to(user):
+    """Published entries are public, authors also see their drafts."""
+    visible = Q(is_published=True)
+    if user.is_authenticated:
+        visible |= Q(author=user)
+    return visible
+
+
+def count_cached_view(request, slug):
+    count_view(slug)
+
+
+def entry_state(request, slug):
+    """Validators of an entry page, from a single indexed lookup."""
+    modified_at = (
+        Entry.objects.filter(visible_to(request.user), slug=slug)
+        .values_list("modified_at", flat=True)
+        .first()
+    )
+    if modified_at is None:
+        return None
+    return modified_at, ""
+
+
+def entries_state(request, pk=None, **kwargs):
+    """
+    Validators of the published entries (in category pk) shown by the list
+    pages and the sitemap. The count catches deleted or unpublished entries,
+    which leave the latest modified_at alone.
+
+    Keyset pagination never counts the entries and neither does this then,
+    the latest modified_at is read from the index and deletes, which change
+    the version of the "entries" namespace, change the ETag instead.
+    """
+    entries = Entry.published.all()
+    if pk is not None:
+        entries = entries.filter(category__pk=pk)
+    if getattr(settings, "CURSOR_PAGINATION", False):
+        last_modified = entries.aggregate(last_modified=Max("modified_at"))
+        if last_modified["last_modified"] is None:
+            return None
+        return last_modified["last_modified"], ""
+    state = entries.aggregate(last_modified=Max("modified_at"), count=Count("pk"))
+    if state["last_modified"] is None:
+        return None
+    return state["last_modified"], state["count"]
+
+
+@method_decorator(
+    anonymous_page_cache("entry:{slug}", on_hit=count_cached_view), name="dispatch"
+)
+@method_decorator(
+    conditional_page(entry_state, "entry:{slug}", on_not_modified=count_cached_view),
+    name="dispatch",
+)
 class EntryDetail(DetailView):
     context_object_name = "entry"
     model = Entry
@@ -118,34 +176,48 @@ class EntryDetail(DetailView):
             return f"{self.template_dir}/entry_detail.html"
         return "entry_detail.html"
 
+    def get_queryset(self):
+        # the tags are read from the denormalized Entry.tag_names
+        return self.model.objects.select_related("author", "category")
+
     def get_object(self, queryset=None):
         if self.kwargs.get("slug", None) is None:
             raise Http404
 
-        try:
-            return self.model.objects.select_related("author").get(
-                author=self.request.user, slug=self.kwargs.get("slug")
-            )
-        except (self.model.DoesNotExist, TypeError):
-            obj = get_object_or_404(
-                self.model, slug=self.kwargs.get("slug"), is_published=True
-            )
-            return obj
+        if queryset is None:
+            queryset = self.get_queryset()
 
-    def get_context_data(self, **kwargs):
-        entry = self.get_object()
-        entry.__class__.objects.select_related("author").filter(pk=entry.pk).update(
-            views=F("views") + 1
+        return get_object_or_404(
+            queryset, visible_to(self.request.user), slug=self.kwargs.get("slug")
         )
+
+    def get_similar_posts(self, entry):
+        """Entries sharing tags with entry, topped up with ones close by text."""
+        count = settings.RELATED_ENTRIES_COUNT
+        similar = list(entry.get_similar_post().cards()[:count])
+        if len(similar) < count:
+            seen = {post.pk for post in similar}
+            similar += [
+                post for post in entry.get_similar_by_content() if post.pk not in seen
+            ][: count - len(similar)]
+        return similar
+
+    def get_context_data(self, **kwargs):
+        entry = self.object
+        count_view(entry.slug)
         context = super(EntryDetail, self).get_context_data(**kwargs)
-        context["title"] = context["entry"].title
+        context["title"] = entry.title
         context["meta"] = entry.as_meta()
+        context["body"] = entry.get_rendered_body()
+        context["similar_posts"] = self.get_similar_posts(entry)
         if settings.CATEGORIES_IN_DETAIL:
             context["categories"] = Category.objects.all().order_by("name")
         return context
 
 
-class EntryListView(PageMetaData, ListView):
+@method_decorator(anonymous_page_cache("entries"), name="dispatch")
+@method_decorator(conditional_page(entries_state, "entries"), name="dispatch")
+class EntryListView(CursorPaginationMixin, PageMetaData, ListView):
     paginate_by = 12
     model = Entry
     context_object_name = "entries"
@@ -154,7 +226,7 @@ class EntryListView(PageMetaData, ListView):
     def get_queryset(self):
         return (
             self.model.published.select_related("category")
-            .all()
+            .cards()
             .order_by("-modified_at")
         )
 
@@ -166,6 +238,12 @@ class EntryListView(PageMetaData, ListView):
     def get_context_data(self, **kwargs):
         self.object_list = self.get_queryset()
         context = super(EntryListView, self).get_context_data(**kwargs)
+
+        # Evaluate the page once, the template only reads plain lists.
+        entries = list(context["object_list"])
+        context["object_list"] = context[self.context_object_name] = entries
+        context["featured"] = entries[:2] if len(entries) >= 2 else []
+
         context["title"] = _("Latest Posts")
         context["meta"] = self.get_meta(context=context)
         return context
@@ -291,6 +369,7 @@ class EntryByCategoryListView(EntryListView, PageMetaData):
         return (
             self.model.published.select_related("category")
             .filter(category__pk=pk)
+            .cards()
             .order_by("-modified_at")
         )
 
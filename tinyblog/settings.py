@@ -141,6 +141,14 @@ CACHES = {
 DJANGO_REDIS_IGNORE_EXCEPTIONS = True
 DJANGO_REDIS_LOG_IGNORED_EXCEPTIONS = True
 
+# Highlighted html cache: number of renders (and of single code blocks) kept
+# in each worker's memory and how long (seconds, None for ever) renders are
+# kept in the cache above. Keys are content-addressed and never deleted, a week
+# keeps the renders of edited bodies from piling up in the default redis.
+PYGMENTIFY_CACHE_SIZE = int(os.environ.get("PYGMENTIFY_CACHE_SIZE", 256))
+PYGMENTIFY_BLOCK_CACHE_SIZE = int(os.environ.get("PYGMENTIFY_BLOCK_CACHE_SIZE", 2048))
+PYGMENTIFY_CACHE_TIMEOUT = b_eval(os.environ.get("PYGMENTIFY_CACHE_TIMEOUT", "604800"))
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
@@ -179,6 +187,51 @@ SITE_LOGO = os.environ.get("SITE_LOGO", "image/py.png")
 
 CATEGORIES_IN_DETAIL = b_eval(os.environ.get("CATEGORIES_IN_DETAIL", "true").title())
 
+# "sync" adds each entry view to the database as it happens, "buffered" counts
+# views in redis and the flush_entry_views task (scheduled every
+# ENTRY_VIEWS_FLUSH_INTERVAL seconds when celery is enabled) writes them.
+ENTRY_VIEWS_MODE = os.environ.get("ENTRY_VIEWS_MODE", "sync")
+ENTRY_VIEWS_FLUSH_INTERVAL = int(os.environ.get("ENTRY_VIEWS_FLUSH_INTERVAL", 60))
+
+# Analytics beacons are queued in redis and written in batches by the
+# flush_page_views task, scheduled every PAGE_VIEWS_FLUSH_INTERVAL seconds
+# when celery is enabled.
+PAGE_VIEWS_FLUSH_INTERVAL = int(os.environ.get("PAGE_VIEWS_FLUSH_INTERVAL", 10))
+
+# The rollup_page_views task adds the page views stored since its last run
+# (and at least PAGE_VIEWS_ROLLUP_LAG seconds old) to the hourly and daily
+# rollups every PAGE_VIEWS_ROLLUP_INTERVAL seconds, then deletes the rolled up
+# views older than PAGE_VIEWS_RETENTION_DAYS days (0 keeps them all).
+PAGE_VIEWS_ROLLUP_INTERVAL = int(os.environ.get("PAGE_VIEWS_ROLLUP_INTERVAL", 300))
+PAGE_VIEWS_ROLLUP_LAG = int(os.environ.get("PAGE_VIEWS_ROLLUP_LAG", 60))
+PAGE_VIEWS_RETENTION_DAYS = int(os.environ.get("PAGE_VIEWS_RETENTION_DAYS", 90))
+
+# Unique visitors per page and day are counted in redis HyperLogLogs, kept
+# UNIQUE_VISITORS_REDIS_DAYS days and copied to the database by the
+# persist_visitor_sketches task every UNIQUE_VISITORS_PERSIST_INTERVAL seconds.
+# Without redis, sketches are kept in process and written to the database
+# every UNIQUE_VISITORS_FLUSH_INTERVAL seconds.
+UNIQUE_VISITORS_REDIS_DAYS = int(os.environ.get("UNIQUE_VISITORS_REDIS_DAYS", 3))
+UNIQUE_VISITORS_PERSIST_INTERVAL = int(
+    os.environ.get("UNIQUE_VISITORS_PERSIST_INTERVAL", 300)
+)
+UNIQUE_VISITORS_FLUSH_INTERVAL = int(
+    os.environ.get("UNIQUE_VISITORS_FLUSH_INTERVAL", 60)
+)
+
+# Seconds anonymous list, detail and sitemap pages are served from the cache,
+# 0 disables the page cache. Pages are invalidated when entries change.
+PAGE_CACHE_TIMEOUT = int(os.environ.get("PAGE_CACHE_TIMEOUT", 600))
+
+# Paginate the entry lists and the dashboard with (modified_at, id) cursors
+# instead of OFFSET and COUNT(*), the first CURSOR_PAGINATION_PAGES pages keep
+# their ?page=<number> urls.
+CURSOR_PAGINATION = b_eval(os.environ.get("CURSOR_PAGINATION", "false").title())
+CURSOR_PAGINATION_PAGES = int(os.environ.get("CURSOR_PAGINATION_PAGES", 5))
+
+# Number of similar entries kept per entry, see blog.related.
+RELATED_ENTRIES_COUNT = int(os.environ.get("RELATED_ENTRIES_COUNT", 5))
+
 #  django-taggit settings
 TAGGIT_CASE_INSENSITIVE = True
 
@@ -231,14 +284,38 @@ DEFAULT_META_DESCRIPTION = os.environ.get("DEFAULT_META_DESCRIPTION", "")
 DEFAULT_META_KEYWORDS = os.environ.get("DEFAULT_META_KEYWORDS", "")
 DEFAULT_META_TITLE = os.environ.get("DEFAULT_META_TITLE", "")
 
-if b_eval(os.environ.get("ENABLE_CELERY", "false").title()):
+ENABLE_CELERY = b_eval(os.environ.get("ENABLE_CELERY", "false").title())
+
+# Related entries and vectors are updated by celery tasks, or by a thread of
+# the web process when celery is disabled. True runs them in the request
+# (tests).
+TASKS_ALWAYS_EAGER = b_eval(os.environ.get("TASKS_ALWAYS_EAGER", "false").title())
+
+if ENABLE_CELERY:
     CELERY_BROKER_URL = os.environ.get("BROKER_URL", "redis://localhost:6379/2")
     CELERY_RESULT_BACKEND = os.environ.get("RESULT_BACKEND", "redis://localhost:6379/3")
     CELERY_ACCEPT_CONTENT = ["application/json"]
     CELERY_RESULT_SERIALIZER = "json"
     CELERY_TASK_SERIALIZER = "json"
     CELERY_TIMEZONE = TIME_ZONE
-    CELERY_BEAT_SCHEDULE = {}
+    CELERY_BEAT_SCHEDULE = {
+        "flush-entry-views": {
+            "task": "flush_entry_views",
+            "schedule": ENTRY_VIEWS_FLUSH_INTERVAL,
+        },
+        "flush-page-views": {
+            "task": "flush_page_views",
+            "schedule": PAGE_VIEWS_FLUSH_INTERVAL,
+        },
+        "rollup-page-views": {
+            "task": "rollup_page_views",
+            "schedule": PAGE_VIEWS_ROLLUP_INTERVAL,
+        },
+        "persist-visitor-sketches": {
+            "task": "persist_visitor_sketches",
+            "schedule": UNIQUE_VISITORS_PERSIST_INTERVAL,
+        },
+    }
 
 
 STATIC_ROOT = os.path.join(DIR, "static")
@@ -16,7 +16,7 @@ import analytics.urls
 import blog.urls
 import blog.views as blog_views
 import blog.sitemaps as blog_sitemaps
-
+from blog.page_cache import anonymous_page_cache, conditional_page
 
 sitemaps = {
     "static": blog_sitemaps.StaticViewSitemap,
@@ -31,7 +31,9 @@ urlpatterns = [
     re_path("blog/", include(blog.urls)),
     path(
         "sitemap.xml",
-        sitemap,
+        anonymous_page_cache("entries")(
+            conditional_page(blog_views.entries_state, "entries")(sitemap)
+        ),
         {"sitemaps": sitemaps},
         name="django.contrib.sitemaps.views.sitemap",
     ),